@@ -98,7 +98,9 @@ class LinkBox(QtWidgets.QDialog, Ui_Dialog):
         # the following section required for update printer connected status
         for key in drivers.keys():
             attr_name = 'driver_%s_thread' % key
-            getattr(getattr(self, attr_name), 'printer_status_signal').connect(self.update_printer_status)
+            # the dialog only shows the default printers, the named ones are configured in config.ini
+            if getattr(self, attr_name).printer_name is None:
+                getattr(getattr(self, attr_name), 'printer_status_signal').connect(self.update_printer_status)
 
     # --------------------------------------------------------------------------------
     # ******************** Callback function for signals is here ********************|
@@ -145,10 +147,10 @@ class LinkBox(QtWidgets.QDialog, Ui_Dialog):
             self._reload_printers()
             return
         if btnID == 'btnTestZPL':
-            self.state.printer_zpl.print_test_request = True
+            drivers['zpl'].push_task('printstatus')
             return
         if btnID == 'btnTestESCPOS':
-            self.state.printer_escpos.print_test_request = True
+            drivers['escpos'].push_task('printstatus')
             return
 
     # --------------------------------------------------------------------------------
@@ -1,28 +1,24 @@
 # -*- coding: utf-8 -*-
+import os
 import time
 import math
 import logging
 import netifaces
-import traceback
-import release
 from threading import Lock
-from queue import Queue
-from PyQt5 import QtCore
+import release
 import addons.hw_proxy.controllers.main as hw_proxy
-
-try:
-    import usb.core
-except ImportError:
-    usb = None
-
-from devices import Printer
+from addons.hw_proxy.driver import PrinterDriver
+from addons.hw_proxy.jobs import JobCancelled, PRIORITY_HIGH, PRIORITY_NORMAL, STATE_RENDERING, STATE_SENDING
+from addons.hw_proxy.pipeline import RenderPipeline
 
 from odoo import http
-from odoo.thread import Thread
 from odoo.tools.translate import _
 from state import StateManager
 
-from ..escpos.printer import Usb
+from ..escpos.cache import ImageCache
+from ..escpos.escpos import Escpos
+from ..escpos.printer import Usb, Renderer
+from ..escpos.constants import DLE_DC4_PULSE_2, DLE_DC4_PULSE_5
 
 _logger = logging.getLogger(__name__)
 
@@ -32,127 +28,162 @@ from datetime import datetime
 
 datetime.strptime('2012-01-01', '%Y-%m-%d')
 
+# the ESC/POS drivers share the image cache, the first one to start loads it
+image_cache_lock = Lock()
+
 
-class EscposDriver(Thread):
-    printer_status_signal = QtCore.pyqtSignal(str, str)
+class EscposDriver(PrinterDriver):
+    """ ESC/POS printer driver
 
-    def __init__(self):
-        Thread.__init__(self)
-        self.queue = Queue()
-        self.lock = Lock()
-        self.status = {'status': 'connecting', 'messages': []}
-        self.current_printer_status = None
+    Unless [DRIVER] render_ahead is 0, the jobs are rendered by a RenderPipeline thread while the driver
+    thread sends the previous ones to the printer, see render() and transmit().
+    """
+    printer_type = StateManager.ESCPOS_PRINTER
+    device_class = Usb
+    name = 'escpos'
+    label = 'ESC/POS'
+    tasks = {
+        'cashbox': (PRIORITY_HIGH, 12, False),
+        'printstatus': (PRIORITY_HIGH, None, True),
+        'receipt': (PRIORITY_NORMAL, 1 * 60 * 60, True),
+        'xml_receipt': (PRIORITY_NORMAL, 1 * 60 * 60, True),
+    }
 
-    def lockedstart(self):
-        with self.lock:
-            if not self.isAlive():
-                self.daemon = True
-                self.start()
+    def __init__(self, printer_name=None, printer_pool=None):
+        PrinterDriver.__init__(self, printer_name, printer_pool)
+        self.renderer = Renderer()
+        self.pipeline = None
 
-    def get_escpos_printer(self):
-        printer = StateManager.getInstance().printer_escpos
-        # print test request coming out
-        if printer.print_test_request:
-            self.push_task('printstatus')
-            printer.print_test_request = False
+    def get_status(self):
+        status = PrinterDriver.get_status(self)
+        status['image_cache'] = Escpos.img_cache.stats()
+        status['receipt_cache'] = Escpos.receipt_cache.stats()
+        if self.pipeline is not None:
+            status['pipeline'] = self.pipeline.get_stats()
+        return status
 
-        printer_device = None
+    def run(self):
+        with image_cache_lock:
+            # rasterized images are kept on disk and pre-warmed at startup, once for all the printers
+            if Escpos.img_cache.path is None:
+                state = StateManager.getInstance()
+                Escpos.img_cache = ImageCache(state.image_cache.max_size * 1024,
+                                              os.path.join(state.base_path, 'cache', 'images'))
+                Escpos.img_cache.load()
+        render_ahead = StateManager.getInstance().driver.render_ahead
+        if render_ahead:
+            self.pipeline = RenderPipeline(self.queue, self.render, self.running, render_ahead)
+            self.pipeline.start()
+        PrinterDriver.run(self)
+
+    def next_job(self, timeout):
+        if self.pipeline is None:
+            return PrinterDriver.next_job(self, timeout)
+        return self.pipeline.get(timeout)
+
+    def is_idle(self):
+        return PrinterDriver.is_idle(self) and (self.pipeline is None or not self.pipeline.rendered)
+
+    def requeue(self, job):
+        job.output = None
+        PrinterDriver.requeue(self, job)
+        if self.pipeline is not None:
+            # the jobs rendered after it go back too, they keep their place in the queue
+            self.pipeline.drain()
+
+    def interrupt(self):
+        PrinterDriver.interrupt(self)
+        if self.pipeline is not None:
+            self.pipeline.interrupt()
+
+    def update_printer_status(self, printer, printer_device=None):
+        PrinterDriver.update_printer_status(self, printer, printer_device)
+        if self.pipeline is not None and not self.is_connected():
+            self.pipeline.drain()
+
+    def hold_jobs(self):
+        held = PrinterDriver.hold_jobs(self)
+        if held and self.pipeline is not None:
+            self.pipeline.drain()
+        return held
+
+    def dispatch(self, job):
+        if job.output is None:
+            return PrinterDriver.dispatch(self, job)
+        started = time.monotonic()
         try:
-            printer_device = Usb(printer.vendor_id, printer.product_id)
-            printer.status = Printer.STATUS_CONNECTED
-            return printer_device
-        except usb.core.USBError:
-            printer.status = Printer.STATUS_DISCONNECTED
+            return PrinterDriver.dispatch(self, job)
         finally:
-            if printer.status != self.current_printer_status:
-                self.current_printer_status = printer.status
-                if printer_device:
-                    self.set_status(
-                        'connected',
-                        "Connected to %s (in=0x%02x,out=0x%02x)" % (printer.description,
-                                                                    printer_device.in_ep,
-                                                                    printer_device.out_ep)
-                    )
-                else:
-                    self.set_status('disconnected', 'Printer Not Found')
-
-            # update status in GUI
-            self.printer_status_signal.emit(str(StateManager.ESCPOS_PRINTER), str(printer.status))
-
-        return printer_device
-
-    def get_status(self):
-        return self.status
+            self.pipeline.record_transmit(time.monotonic() - started)
+
+    def render(self, job):
+        """ render a job ahead of its transmission, from the render thread
+        :return: programs of the parts of its output and the exception raised while rendering it
+        """
+        job.set_state(STATE_RENDERING)
+        error = None
+        try:
+            self.process_job(self.renderer, job)
+        except Exception as e:
+            error = e
+        return self.renderer.take(), error
+
+    def transmit(self, printer, job):
+        """ send the output of a job rendered ahead, it stops between two parts when the job is cancelled """
+        parts, error = job.output
+        job.output = None
+        job.set_state(STATE_SENDING)
+        for i, program in enumerate(parts):
+            if job.cancelled:
+                if i:
+                    printer.cut()
+                raise JobCancelled()
+            printer.execute(program)
+        if error is not None:
+            raise error
+
+    def query_printer_status(self, device):
+        return device.get_printer_status()
+
+    def hold_reason(self, printer_status):
+        if [True for status in printer_status.values() if status['status_error']]:
+            # not a status byte, do not hold the jobs on garbage
+            return None
+        if printer_status['offline']['cover_open']:
+            return 'cover open'
+        if not printer_status['paper']['present'] or not printer_status['offline']['paper']:
+            return 'no paper'
+        if printer_status['error']['unrecoverable']:
+            return 'unrecoverable error'
+        if printer_status['error']['recoverable'] or printer_status['error']['autocutter']:
+            return 'recoverable error'
+        if not printer_status['printer']['online']:
+            return 'offline'
+        return None
 
     def open_cashbox(self, printer):
+        if self.held:
+            # the printer is offline (no paper, cover open...) and would keep ESC p until it is back
+            printer._raw(DLE_DC4_PULSE_2 + DLE_DC4_PULSE_5)
+            return
         printer.cashdraw(2)
         printer.cashdraw(5)
 
-    def set_status(self, status, message=None):
-        _logger.info(status + ' : ' + (message or 'no message'))
-        if status == self.status['status']:
-            if message != None and (len(self.status['messages']) == 0 or message != self.status['messages'][-1]):
-                self.status['messages'].append(message)
-        else:
-            self.status['status'] = status
-            if message:
-                self.status['messages'] = [message]
-            else:
-                self.status['messages'] = []
-
-        if status == 'error' and message:
-            _logger.error('ESC/POS Error: ' + message)
-        elif status == 'disconnected' and message:
-            _logger.warning('ESC/POS Device Disconnected: ' + message)
-
-    def run(self):
-        while True:
-            reprint = False
-            printer = None
-            timestamp, task, data = self.queue.get(True)
-            try:
-                printer = self.get_escpos_printer()
-
-                if printer:
-                    if task == 'status':
-                        # nothing todo
-                        continue
-
-                    # specific done bellow
-                    if task == 'receipt':
-                        if timestamp >= time.time() - 1 * 60 * 60:
-                            self.print_receipt_body(printer, data)
-                            printer.cut()
-                    elif task == 'xml_receipt':
-                        if timestamp >= time.time() - 1 * 60 * 60:
-                            printer.receipt(data)
-                    elif task == 'cashbox':
-                        if timestamp >= time.time() - 12:
-                            self.open_cashbox(printer)
-                    elif task == 'printstatus':
-                        self.print_status(printer)
-                else:
-                    if task != 'status':
-                        # re-add job if exists
-                        reprint = True
-            except usb.core.USBError:
-                reprint = True
-            except Exception as e:
-                self.set_status('error', str(e))
-                errmsg = str(e) + '\n' + '-' * 60 + '\n' + traceback.format_exc() + '-' * 60 + '\n'
-                _logger.error(errmsg)
-            finally:
-                if reprint:
-                    self.queue.put((timestamp, task, data))
-                if printer:
-                    printer.close()
-                # check status after complete
-                self.push_task('status')
-                time.sleep(0.25)
-
-    def push_task(self, task, data=None):
-        self.lockedstart()
-        self.queue.put((time.time(), task, data))
+    def process_job(self, printer, job):
+        if job.output is not None:
+            self.transmit(printer, job)
+            return
+        task, data = job.task, job.data
+        if task == 'receipt':
+            self.print_receipt_body(printer, data)
+            printer.cut()
+        elif task == 'xml_receipt':
+            if not printer.receipt(data, lambda: job.cancelled):
+                raise JobCancelled()
+        elif task == 'cashbox':
+            self.open_cashbox(printer)
+        elif task == 'printstatus':
+            self.print_status(printer)
 
     def print_status(self, eprint):
         eprint.text('\n')
@@ -319,24 +350,22 @@ class EscposDriver(Thread):
                     + ':' + str(receipt['date']['minute']).zfill(2))
 
 
-driver = EscposDriver()
-driver.push_task('status')
-hw_proxy.drivers['escpos'] = driver
+driver = hw_proxy.register_drivers(EscposDriver)
 
 
 class EscposProxy(hw_proxy.Proxy):
 
     @http.route('/hw_proxy/open_cashbox', type='json', auth='none', cors='*')
-    def open_cashbox(self):
+    def open_cashbox(self, printer=None):
         _logger.info('ESC/POS: OPEN CASHBOX')
-        driver.push_task('cashbox')
+        return hw_proxy.push_job(EscposDriver.name, printer, 'cashbox')
 
     @http.route('/hw_proxy/print_receipt', type='json', auth='none', cors='*')
-    def print_receipt(self, receipt):
+    def print_receipt(self, receipt, job_key=None, printer=None):
         _logger.info('ESC/POS: PRINT RECEIPT')
-        driver.push_task('receipt', receipt)
+        return hw_proxy.push_job(EscposDriver.name, printer, 'receipt', receipt, job_key)
 
     @http.route('/hw_proxy/print_xml_receipt', type='json', auth='none', cors='*')
-    def print_xml_receipt(self, receipt):
+    def print_xml_receipt(self, receipt, job_key=None, printer=None):
         _logger.info('ESC/POS: PRINT XML RECEIPT')
-        driver.push_task('xml_receipt', receipt)
+        return hw_proxy.push_job(EscposDriver.name, printer, 'xml_receipt', receipt, job_key)
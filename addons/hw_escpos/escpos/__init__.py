@@ -1,3 +1,3 @@
-from . import constants, escpos, exceptions, printer
+from . import cache, constants, escpos, exceptions, printer
 
-__all__ = ["constants", "escpos", "exceptions", "printer"]
+__all__ = ["cache", "constants", "escpos", "exceptions", "printer"]
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import os
+import hashlib
+import logging
+from collections import OrderedDict
+from threading import Lock
+
+_logger = logging.getLogger(__name__)
+
+
+class ImageCache(object):
+    """ LRU cache of rasterized images
+
+    The cache is bounded by the total size of the cached rasters. When a directory is given every
+    entry is also stored there, so the images sent by the POS (the company logo...) survive a restart
+    of the box; load() pre-warms the memory cache from it.
+    """
+    suffix = '.raster'
+
+    def __init__(self, max_size=4 * 1024 * 1024, path=None):
+        """
+        :param max_size: maximum size of the cached rasters, in bytes
+        :param path: directory where the entries are persisted, None keeps them in memory only
+        """
+        self.max_size = max_size
+        self.path = path
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(data, profile=''):
+        """ :return: cache key of the image data rendered with the given printer profile """
+        return hashlib.sha1(profile.encode() + b'\0' + data.encode()).hexdigest()
+
+    def get(self, key):
+        """ :return: the cached raster or None """
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            if self.sizeof(value) > self.max_size:
+                return
+            self._insert(key, value)
+        if self.path:
+            self._write(key, value)
+
+    def load(self):
+        """ pre-warm the cache with the most recently used entries stored on disk """
+        if not self.path or not os.path.isdir(self.path):
+            return
+        files = [os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith(self.suffix)]
+        files.sort(key=os.path.getmtime)
+        for filename in files:
+            try:
+                with open(filename, 'rb') as f:
+                    value = f.read()
+            except (IOError, OSError) as e:
+                _logger.warning('Can not read cached image %s: %s' % (filename, str(e)))
+                continue
+            with self.lock:
+                self._insert(os.path.basename(filename)[:-len(self.suffix)], value)
+        _logger.info('Image cache loaded %d entries (%d bytes)' % (len(self.entries), self.size))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'size': self.size,
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    @staticmethod
+    def sizeof(value):
+        return len(value)
+
+    def _insert(self, key, value):
+        if key in self.entries:
+            self.size -= self.sizeof(self.entries.pop(key))
+        self.entries[key] = value
+        self.size += self.sizeof(value)
+        while self.size > self.max_size:
+            old_key, old_value = self.entries.popitem(last=False)
+            self.size -= self.sizeof(old_value)
+            self._remove(old_key)
+
+    def _filename(self, key):
+        return os.path.join(self.path, key + self.suffix)
+
+    def _write(self, key, value):
+        try:
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            tmp = self._filename(key) + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(value)
+            os.replace(tmp, self._filename(key))
+        except (IOError, OSError) as e:
+            _logger.warning('Can not store cached image %s: %s' % (key, str(e)))
+
+    def _remove(self, key):
+        if not self.path:
+            return
+        try:
+            os.remove(self._filename(key))
+        except (IOError, OSError):
+            pass
+
+
+class ReceiptCache(ImageCache):
+    """ LRU cache of compiled xml receipt elements
+
+    Entries are the program printing a top level element of a receipt (header, footer, logo...) and
+    the serializer state after it, keyed by the element and the state it was rendered in. They are
+    kept in memory only.
+    """
+    # accounts for the bookkeeping of an entry, so that many tiny entries are bounded too
+    overhead = 64
+    # number of keys remembered by admit()
+    max_seen = 1024
+
+    def __init__(self, max_size=1024 * 1024):
+        super(ReceiptCache, self).__init__(max_size)
+        self.seen = OrderedDict()
+
+    def admit(self, key):
+        """ :return: whether a missing key was asked for before, only repeated elements are worth compiling """
+        with self.lock:
+            if self.seen.pop(key, False):
+                return True
+            self.seen[key] = True
+            if len(self.seen) > self.max_seen:
+                self.seen.popitem(last=False)
+            return False
+
+    @staticmethod
+    def receipt_key(data, state=()):
+        """ :return: cache key of a whole receipt, from its encoded xml """
+        return hashlib.sha1(repr(state).encode() + b'\0' + data).hexdigest()
+
+    @staticmethod
+    def key(elem, state=()):
+        """ :return: cache key of the element (without its tail) rendered from the given state """
+        parts = [repr(state)]
+        for e in elem.iter():
+            # xml text can not contain NUL, and the number of children makes the pre-order walk
+            # describe a single tree
+            parts += (e.tag, repr(e.attrib) if e.attrib else '', str(len(e)), e.text or '',
+                      e.tail or '' if e is not elem else '')
+        return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def sizeof(cls, value):
+        program, state = value
+        return cls.overhead + sum(len(segment) for segment in program if segment is not None)
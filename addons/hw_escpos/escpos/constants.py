@@ -15,6 +15,9 @@ DLE_EOT_PRINTER = DLE + EOT + b'\x01'
 DLE_EOT_OFFLINE = DLE + EOT + b'\x02'
 DLE_EOT_ERROR = DLE + EOT + b'\x03'
 DLE_EOT_PAPER = DLE + EOT + b'\x04'
+# RT cash drawer pulses on pin 2 and pin 5 (100 ms), executed even while the printer is offline
+DLE_DC4_PULSE_2 = DLE + b'\x14\x01\x00\x01'
+DLE_DC4_PULSE_5 = DLE + b'\x14\x01\x01\x01'
 
 # # Printer hardware
 # HW_INIT   = '\x1b\x40'         # Clear data in buffer and reset modes
@@ -2,7 +2,6 @@
 import io
 import base64
 import math
-import hashlib
 import re
 import traceback
 import codecs
@@ -20,10 +19,17 @@ try:
 except ImportError:
     qrcode = None
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from escpos.escpos import Escpos as EscposCore
 from escpos.constants import *
 from escpos.exceptions import *
 
+from .cache import ImageCache, ReceiptCache
+
 
 def utfstr(stuff):
     """ converts stuff to string and does without failing if stuff is a utf8 string """
@@ -33,6 +39,62 @@ def utfstr(stuff):
         return str(stuff)
 
 
+ELEM_STYLES = {
+    'h1': {'bold': 'on', 'size': 'double'},
+    'h2': {'size': 'double'},
+    'h3': {'bold': 'on', 'size': 'double-height'},
+    'h4': {'size': 'double-height'},
+    'h5': {'bold': 'on'},
+    'em': {'font': 'b'},
+    'b': {'bold': 'on'},
+}
+
+BLOCK_TAGS = ('p', 'div', 'section', 'article', 'receipt', 'header', 'footer', 'li', 'h1', 'h2', 'h3', 'h4', 'h5')
+
+INLINE_TAGS = ('span', 'em', 'b', 'left', 'right')
+
+# elements rendered while their children are still being parsed, the others are rendered once complete
+STREAMED_TAGS = BLOCK_TAGS + INLINE_TAGS + ('ul',)
+
+
+def strclean(string):
+    if not string:
+        string = ''
+    string = string.strip()
+    string = re.sub('\s+', ' ', string)
+    return string
+
+
+def format_value(value, decimals=3, width=0, decimals_separator='.', thousands_separator=',', autoint=False,
+                 symbol='', position='after'):
+    decimals = max(0, int(decimals))
+    width = max(0, int(width))
+    value = float(value)
+
+    if autoint and math.floor(value) == value:
+        decimals = 0
+    if width == 0:
+        width = ''
+
+    if thousands_separator:
+        formatstr = "{:" + str(width) + ",." + str(decimals) + "f}"
+    else:
+        formatstr = "{:" + str(width) + "." + str(decimals) + "f}"
+
+    ret = formatstr.format(value)
+    ret = ret.replace(',', 'COMMA')
+    ret = ret.replace('.', 'DOT')
+    ret = ret.replace('COMMA', thousands_separator)
+    ret = ret.replace('DOT', decimals_separator)
+
+    if symbol:
+        if position == 'after':
+            ret = ret + symbol
+        else:
+            ret = symbol + ret
+    return ret
+
+
 class StyleStack:
     """
     The stylestack is used by the xml receipt serializer to compute the active styles along the xml
@@ -120,17 +182,27 @@ class StyleStack:
             },
         }
 
+        # styles with an escpos command, in the order they must be issued
+        self.cmd_order = tuple(sorted(self.cmds, key=lambda style: (self.cmds[style]['_order'], style)))
+        # resolved styles and escpos state of each stack level
+        self.resolved = []
+        self.states = []
+
         self.push(self.defaults)
 
+    # commands emitted to go from one escpos state to another, shared by all the receipts
+    _commands = {}
+
+    # ESC ! (the 'size' command) also resets these modes on the printer
+    size_resets = {
+        'font': 'a',
+        'bold': 'off',
+        'underline': 'off',
+    }
+
     def get(self, style):
         """ what's the value of a style at the current stack level"""
-        level = len(self.stack) - 1
-        while level >= 0:
-            if style in self.stack[level]:
-                return self.stack[level][style]
-            else:
-                level = level - 1
-        return None
+        return self.resolved[-1].get(style)
 
     def enforce_type(self, attr, val):
         """converts a value to the attribute's type"""
@@ -153,6 +225,10 @@ class StyleStack:
             else:
                 _style[attr] = self.enforce_type(attr, style[attr])
         self.stack.append(_style)
+        resolved = dict(self.resolved[-1]) if self.resolved else {}
+        resolved.update(_style)
+        self.resolved.append(resolved)
+        self.states.append(self.states[-1] if self.states and not _style else None)
 
     def set(self, style={}):
         """overrides style values at the current stack level"""
@@ -161,19 +237,43 @@ class StyleStack:
             if attr in self.cmds and not style[attr] in self.cmds[attr]:
                 print('WARNING: ESC/POS PRINTING: ignoring invalid value: %s for style %s' % (style[attr], attr))
             else:
-                self.stack[-1][attr] = self.enforce_type(attr, style[attr])
+                value = self.enforce_type(attr, style[attr])
+                self.stack[-1][attr] = value
+                self.resolved[-1][attr] = value
+                self.states[-1] = None
 
     def pop(self):
         """ pop a style stack level """
         if len(self.stack) > 1:
-            self.stack = self.stack[:-1]
-
-    def to_escpos(self):
-        """ converts the current style to an escpos command string """
-        cmd = b''
-        ordered_cmds = sorted(self.cmds.items(), key=lambda kv: (kv[0], kv[1]['_order']))
-        for style in ordered_cmds:
-            cmd += style[1][self.get(style[0])]
+            self.stack.pop()
+            self.resolved.pop()
+            self.states.pop()
+
+    def state(self):
+        """ the escpos state of the current style, as a tuple of values in cmd_order """
+        if self.states[-1] is None:
+            resolved = self.resolved[-1]
+            self.states[-1] = tuple(resolved.get(style) for style in self.cmd_order)
+        return self.states[-1]
+
+    def to_escpos(self, previous=None):
+        """ converts the current style to an escpos command string
+        :param previous: state() of the style last sent to the printer, only the commands needed to
+                         go from it to the current style are returned. None returns all of them.
+        """
+        current = self.state()
+        key = (previous, current)
+        cmd = self._commands.get(key)
+        if cmd is None:
+            cmd = b''
+            printer = dict(zip(self.cmd_order, previous)) if previous else {}
+            for style, value in zip(self.cmd_order, current):
+                if previous is None or printer[style] != value:
+                    cmd += self.cmds[style][value]
+                    printer[style] = value
+                    if style == 'size':
+                        printer.update(self.size_resets)
+            self._commands[key] = cmd
         return cmd
 
 
@@ -188,6 +288,8 @@ class XmlSerializer:
         self.escpos = escpos
         self.stack = ['block']
         self.dirty = False
+        # style state last sent to the printer, None when unknown
+        self.emitted = None
 
     def start_inline(self, stylestack=None):
         """ starts an inline entity with an optional style definition """
@@ -237,7 +339,14 @@ class XmlSerializer:
 
     def style(self, stylestack):
         """ apply a style to the entity (only applies to content added after the definition) """
-        self.raw(stylestack.to_escpos())
+        cmd = stylestack.to_escpos(self.emitted)
+        self.emitted = stylestack.state()
+        if cmd:
+            self.raw(cmd)
+
+    def reset(self):
+        """ the printer state was changed behind the serializer, the next style is sent in full """
+        self.emitted = None
 
     def raw(self, raw):
         """ puts raw text or escpos command in the entity without affecting the state of the serializer """
@@ -314,11 +423,250 @@ class XmlLineSerializer:
                 self.width - self.clwidth - self.crwidth) + self.rbuffer
 
 
+# placeholder of a compiled program: the data before it must be pushed to the printer (after a cut)
+FLUSH = None
+
+
+class Recorder:
+    """
+    Stands in for the _raw method of an Escpos printer to compile the commands sent to it into a
+    program: a list of byte segments and FLUSH placeholders, see Escpos.record() and Escpos.execute()
+    """
+
+    def __init__(self):
+        self.program = []
+        self.data = bytearray()
+
+    def raw(self, msg):
+        if isinstance(msg, str):
+            msg = msg.encode('utf-8')
+        self.data += msg
+
+    def push(self):
+        self._end_segment()
+        self.program.append(FLUSH)
+
+    def take(self):
+        """ :return: the program recorded since the last call """
+        self._end_segment()
+        program, self.program = self.program, []
+        return program
+
+    def _end_segment(self):
+        if self.data:
+            self.program.append(bytes(self.data))
+            self.data = bytearray()
+
+
+class ReceiptRenderer:
+    """
+    Renders an xml receipt while it is parsed.
+
+    Block, inline and list elements are rendered as their start and end tags come in, and their children are
+    dropped from the tree once printed, so the output starts before the whole document is parsed and memory
+    stays bounded by the size of the largest element rendered at once (lines, ordered lists, barcodes...).
+    The output is the same as Escpos._print_elem on the whole tree.
+
+    The top level elements of the receipt are compiled once and taken from Escpos.receipt_cache afterwards:
+    their events are buffered until the element is complete (up to Escpos.receipt_cache_budget events, bigger
+    elements are streamed), so the repeated headers, footers and logos of the receipts are not rendered again.
+    """
+
+    def __init__(self, escpos):
+        self.escpos = escpos
+        self.cache = escpos.receipt_cache
+        self.stylestack = StyleStack()
+        self.serializer = XmlSerializer(escpos)
+        self.parser = ET.XMLPullParser(events=('start', 'end'))
+        self.root = None
+        # streamed elements being rendered, as (element, indent)
+        self.frames = []
+        # element rendered once complete, its indent and depth of the parser inside of it
+        self.capture = None
+        self.capture_indent = 0
+        self.capture_depth = 0
+        # text or tail output waiting for the parser to reach the end of it
+        self.pending = None
+        # events of the top level element being buffered and the depth of the parser inside of it
+        self.buffered = None
+        self.buffered_depth = 0
+        self.context = None
+
+        self.serializer.style(self.stylestack)
+
+    def feed(self, data):
+        self.parser.feed(data)
+        for event, elem in self.parser.read_events():
+            self.handle(event, elem)
+
+    def close(self):
+        """ :return: the root element of the receipt """
+        self.parser.close()
+        for event, elem in self.parser.read_events():
+            self.handle(event, elem)
+        return self.root
+
+    def handle(self, event, elem):
+        if self.buffered is not None:
+            self.buffered.append((event, elem))
+            if event == 'start':
+                self.buffered_depth += 1
+            elif self.buffered_depth:
+                self.buffered_depth -= 1
+            else:
+                self.render_cached(elem)
+                return
+            if len(self.buffered) > self.escpos.receipt_cache_budget:
+                self.replay()
+            return
+
+        if event == 'start' and self.is_cacheable():
+            self.run_pending()
+            self.buffered = [(event, elem)]
+            self.buffered_depth = 0
+            return
+
+        self.render(event, elem)
+
+    def render(self, event, elem):
+        if self.capture is not None:
+            if event == 'start':
+                self.capture_depth += 1
+            elif self.capture_depth:
+                self.capture_depth -= 1
+            else:
+                self.capture = None
+                self.escpos._print_elem(self.stylestack, self.serializer, elem, self.capture_indent)
+                self.end_child(elem)
+            return
+
+        # the text before this event is complete now
+        self.run_pending()
+
+        if event == 'start':
+            if self.root is None:
+                self.root = elem
+            self.start(elem)
+        else:
+            self.end(elem)
+
+    def run_pending(self):
+        if self.pending is not None:
+            pending, self.pending = self.pending, None
+            pending()
+
+    def is_cacheable(self):
+        """ whether the element starting now is a top level element which can be taken from the cache """
+        return (self.cache.max_size and self.capture is None and len(self.frames) == 1
+                and self.frames[0][0].tag != 'ul')
+
+    def state(self):
+        """ everything the output of a top level element depends on, besides the element itself """
+        if self.context is None:
+            # the style and printer settings of the receipt level do not change once it is started
+            escpos = self.escpos
+            self.context = repr((tuple(self.serializer.stack), sorted(self.stylestack.resolved[-1].items()),
+                                 escpos.raster_profile, getattr(escpos, 'codepage', None)))
+        return self.context, self.serializer.dirty, self.serializer.emitted
+
+    def replay(self):
+        """ the buffered element is too big to be cached, stream it """
+        events, self.buffered = self.buffered, None
+        for event, elem in events:
+            self.render(event, elem)
+
+    def render_cached(self, elem):
+        """ print a complete top level element from the cache, compiling it first if needed """
+        events, self.buffered = self.buffered, None
+        key = self.cache.key(elem, self.state())
+        cached = self.cache.get(key)
+        if cached is None and not self.cache.admit(key):
+            # seen once (the order lines...), not worth compiling yet
+            for event, e in events:
+                self.render(event, e)
+            return
+        if cached is None:
+            self.escpos.record()
+            try:
+                for event, e in events:
+                    self.render(event, e)
+            finally:
+                program = self.escpos.stop_recording()
+            self.cache.put(key, (program, (self.serializer.dirty, self.serializer.emitted)))
+        else:
+            program, (self.serializer.dirty, self.serializer.emitted) = cached
+            self.end_child(elem)
+        self.escpos.execute(program)
+
+    def start(self, elem):
+        stylestack, serializer = self.stylestack, self.serializer
+        indent = 0
+        if self.frames and self.frames[-1][0].tag == 'ul':
+            parent_indent = self.frames[-1][1]
+            indent = parent_indent + 1
+            if elem.tag == 'li':
+                serializer.style(stylestack)
+                serializer.raw(' ' * parent_indent * stylestack.get('tabwidth') + stylestack.get('bullet'))
+
+        if elem.tag not in STREAMED_TAGS:
+            self.capture = elem
+            self.capture_indent = indent
+            self.capture_depth = 0
+            return
+
+        stylestack.push()
+        if elem.tag in ELEM_STYLES:
+            stylestack.set(ELEM_STYLES[elem.tag])
+        stylestack.set(elem.attrib)
+
+        if elem.tag == 'ul':
+            serializer.start_block(stylestack)
+        else:
+            if elem.tag in BLOCK_TAGS:
+                serializer.start_block(stylestack)
+            else:
+                serializer.start_inline(stylestack)
+            self.pending = lambda: serializer.text(elem.text)
+        self.frames.append((elem, indent))
+
+    def end(self, elem):
+        self.frames.pop()
+        self.serializer.end_entity()
+        self.stylestack.pop()
+        self.end_child(elem)
+
+    def end_child(self, elem):
+        """ an element is printed, print its tail and drop it from the tree """
+        if not self.frames:
+            return
+        parent = self.frames[-1][0]
+        if parent.tag == 'ul':
+            parent.remove(elem)
+            return
+
+        def tail():
+            self.serializer.start_inline(self.stylestack)
+            self.serializer.text(elem.tail)
+            self.serializer.end_entity()
+            parent.remove(elem)
+
+        self.pending = tail
+
+
 class Escpos(EscposCore):
     """ ESC/POS Printer object """
     device = None
     encoding = None
-    img_cache = {}
+    img_cache = ImageCache()
+    # identifies how images are rasterized, part of the image cache keys
+    raster_profile = 'GS v 0/1X0/512'
+    # size of the xml receipt chunks fed to the parser
+    receipt_chunk_size = 4096
+    receipt_cache = ReceiptCache()
+    # number of parser events buffered to cache a top level element of a receipt
+    receipt_cache_budget = 512
+    # stack of Recorder compiling the output instead of printing it, see record()
+    recorders = None
 
     def _check_image_size(self, size):
         """ Check and fix the size of the image to 32 bits """
@@ -428,13 +776,39 @@ class Escpos(EscposCore):
 
         return (pix_line, img_size)
 
+    def _raster_image(self, im):
+        """ Convert an RGB image to a raster image command, same output as
+        _raw_print_image(*_convert_image(im)) but computed on whole arrays """
+        if numpy is None:
+            pix_line, img_size = self._convert_image(im)
+            return self._raw_print_image(pix_line, img_size)
+
+        if im.size[0] > 512:
+            print("WARNING: Image is wider than 512 and could be truncated at print time ")
+        if im.size[1] > 255:
+            raise ImageSizeError()
+
+        width, height = im.size
+        im_border = self._check_image_size(width)
+        color = numpy.asarray(im, dtype=numpy.uint16).sum(axis=2)
+
+        # "1X0" pattern: dark pixels are printed, light ones are not and the mid-tones
+        # follow a switch flipping on every pixel of the image
+        switch = (numpy.arange(width * height) % 2 == 0).reshape(height, width)
+        dots = (color <= 255) | ((color <= 510) & switch)
+        dots = numpy.pad(dots, ((0, 0), im_border), 'constant')
+
+        buffer = "%02X%02X%02X%02X" % (int(dots.shape[1] / 8), 0, height, 0)
+        return S_RASTER_N + codecs.decode(buffer, 'hex') + numpy.packbits(dots, axis=1).tobytes()
+
     def print_base64_image(self, img):
 
         print('print_b64_img')
 
-        id = hashlib.md5(img.encode()).digest()
+        id = self.img_cache.key(img, self.raster_profile)
+        buffer = self.img_cache.get(id)
 
-        if id not in self.img_cache:
+        if buffer is None:
             print('not in cache')
 
             img = img[img.find(',') + 1:]
@@ -452,199 +826,232 @@ class Escpos(EscposCore):
 
             print('convert image')
 
-            pix_line, img_size = self._convert_image(img)
-
-            print('print image')
-
-            buffer = self._raw_print_image(pix_line, img_size)
-            self.img_cache[id] = buffer
+            buffer = self._raster_image(img)
+            self.img_cache.put(id, buffer)
 
         print('raw image')
 
-        self._raw(self.img_cache[id])
+        self._raw(buffer)
 
-    def receipt(self, xml):
-        """
-        Prints an xml based receipt definition
-        """
-
-        def strclean(string):
-            if not string:
-                string = ''
-            string = string.strip()
-            string = re.sub('\s+', ' ', string)
-            return string
-
-        def format_value(value, decimals=3, width=0, decimals_separator='.', thousands_separator=',', autoint=False,
-                         symbol='', position='after'):
-            decimals = max(0, int(decimals))
-            width = max(0, int(width))
-            value = float(value)
-
-            if autoint and math.floor(value) == value:
-                decimals = 0
-            if width == 0:
-                width = ''
-
-            if thousands_separator:
-                formatstr = "{:" + str(width) + ",." + str(decimals) + "f}"
-            else:
-                formatstr = "{:" + str(width) + "." + str(decimals) + "f}"
-
-            ret = formatstr.format(value)
-            ret = ret.replace(',', 'COMMA')
-            ret = ret.replace('.', 'DOT')
-            ret = ret.replace('COMMA', thousands_separator)
-            ret = ret.replace('DOT', decimals_separator)
+    def _print_elem(self, stylestack, serializer, elem, indent=0):
+        """ Prints an element of an xml receipt and its children """
 
-            if symbol:
-                if position == 'after':
-                    ret = ret + symbol
-                else:
-                    ret = symbol + ret
-            return ret
-
-        def print_elem(stylestack, serializer, elem, indent=0):
-
-            elem_styles = {
-                'h1': {'bold': 'on', 'size': 'double'},
-                'h2': {'size': 'double'},
-                'h3': {'bold': 'on', 'size': 'double-height'},
-                'h4': {'size': 'double-height'},
-                'h5': {'bold': 'on'},
-                'em': {'font': 'b'},
-                'b': {'bold': 'on'},
-            }
-
-            stylestack.push()
-            if elem.tag in elem_styles:
-                stylestack.set(elem_styles[elem.tag])
-            stylestack.set(elem.attrib)
-
-            if elem.tag in (
-                    'p', 'div', 'section', 'article', 'receipt', 'header', 'footer', 'li', 'h1', 'h2', 'h3', 'h4',
-                    'h5'):
-                serializer.start_block(stylestack)
-                serializer.text(elem.text)
-                for child in elem:
-                    print_elem(stylestack, serializer, child)
-                    serializer.start_inline(stylestack)
-                    serializer.text(child.tail)
-                    serializer.end_entity()
-                serializer.end_entity()
+        stylestack.push()
+        if elem.tag in ELEM_STYLES:
+            stylestack.set(ELEM_STYLES[elem.tag])
+        stylestack.set(elem.attrib)
 
-            elif elem.tag in ('span', 'em', 'b', 'left', 'right'):
+        if elem.tag in BLOCK_TAGS:
+            serializer.start_block(stylestack)
+            serializer.text(elem.text)
+            for child in elem:
+                self._print_elem(stylestack, serializer, child)
                 serializer.start_inline(stylestack)
-                serializer.text(elem.text)
-                for child in elem:
-                    print_elem(stylestack, serializer, child)
-                    serializer.start_inline(stylestack)
-                    serializer.text(child.tail)
-                    serializer.end_entity()
+                serializer.text(child.tail)
                 serializer.end_entity()
+            serializer.end_entity()
 
-            elif elem.tag == 'value':
+        elif elem.tag in INLINE_TAGS:
+            serializer.start_inline(stylestack)
+            serializer.text(elem.text)
+            for child in elem:
+                self._print_elem(stylestack, serializer, child)
                 serializer.start_inline(stylestack)
-                serializer.pre(format_value(
-                    elem.text,
-                    decimals=stylestack.get('value-decimals'),
-                    width=stylestack.get('value-width'),
-                    decimals_separator=stylestack.get('value-decimals-separator'),
-                    thousands_separator=stylestack.get('value-thousands-separator'),
-                    autoint=(stylestack.get('value-autoint') == 'on'),
-                    symbol=stylestack.get('value-symbol'),
-                    position=stylestack.get('value-symbol-position')
-                ))
-                serializer.end_entity()
-
-            elif elem.tag == 'line':
-                width = stylestack.get('width')
-                if stylestack.get('size') in ('double', 'double-width'):
-                    width = width / 2
-
-                lineserializer = XmlLineSerializer(stylestack.get('indent') + indent, stylestack.get('tabwidth'), width,
-                                                   stylestack.get('line-ratio'))
-                serializer.start_block(stylestack)
-                for child in elem:
-                    if child.tag == 'left':
-                        print_elem(stylestack, lineserializer, child, indent=indent)
-                    elif child.tag == 'right':
-                        lineserializer.start_right()
-                        print_elem(stylestack, lineserializer, child, indent=indent)
-                serializer.pre(lineserializer.get_line())
-                serializer.end_entity()
-
-            elif elem.tag == 'ul':
-                serializer.start_block(stylestack)
-                bullet = stylestack.get('bullet')
-                for child in elem:
-                    if child.tag == 'li':
-                        serializer.style(stylestack)
-                        serializer.raw(' ' * indent * stylestack.get('tabwidth') + bullet)
-                    print_elem(stylestack, serializer, child, indent=indent + 1)
+                serializer.text(child.tail)
                 serializer.end_entity()
+            serializer.end_entity()
+
+        elif elem.tag == 'value':
+            serializer.start_inline(stylestack)
+            serializer.pre(format_value(
+                elem.text,
+                decimals=stylestack.get('value-decimals'),
+                width=stylestack.get('value-width'),
+                decimals_separator=stylestack.get('value-decimals-separator'),
+                thousands_separator=stylestack.get('value-thousands-separator'),
+                autoint=(stylestack.get('value-autoint') == 'on'),
+                symbol=stylestack.get('value-symbol'),
+                position=stylestack.get('value-symbol-position')
+            ))
+            serializer.end_entity()
+
+        elif elem.tag == 'line':
+            width = stylestack.get('width')
+            if stylestack.get('size') in ('double', 'double-width'):
+                width = width / 2
+
+            lineserializer = XmlLineSerializer(stylestack.get('indent') + indent, stylestack.get('tabwidth'), width,
+                                               stylestack.get('line-ratio'))
+            serializer.start_block(stylestack)
+            for child in elem:
+                if child.tag == 'left':
+                    self._print_elem(stylestack, lineserializer, child, indent=indent)
+                elif child.tag == 'right':
+                    lineserializer.start_right()
+                    self._print_elem(stylestack, lineserializer, child, indent=indent)
+            serializer.pre(lineserializer.get_line())
+            serializer.end_entity()
+
+        elif elem.tag == 'ul':
+            serializer.start_block(stylestack)
+            bullet = stylestack.get('bullet')
+            for child in elem:
+                if child.tag == 'li':
+                    serializer.style(stylestack)
+                    serializer.raw(' ' * indent * stylestack.get('tabwidth') + bullet)
+                self._print_elem(stylestack, serializer, child, indent=indent + 1)
+            serializer.end_entity()
+
+        elif elem.tag == 'ol':
+            cwidth = len(str(len(elem))) + 2
+            i = 1
+            serializer.start_block(stylestack)
+            for child in elem:
+                if child.tag == 'li':
+                    serializer.style(stylestack)
+                    serializer.raw(' ' * indent * stylestack.get('tabwidth') + ' ' + (str(i) + ')').ljust(cwidth))
+                    i = i + 1
+                self._print_elem(stylestack, serializer, child, indent=indent + 1)
+            serializer.end_entity()
+
+        elif elem.tag == 'pre':
+            serializer.start_block(stylestack)
+            serializer.pre(elem.text)
+            serializer.end_entity()
+
+        elif elem.tag == 'hr':
+            width = stylestack.get('width')
+            if stylestack.get('size') in ('double', 'double-width'):
+                width = width / 2
+            serializer.start_block(stylestack)
+            serializer.text('-' * width)
+            serializer.end_entity()
+
+        elif elem.tag == 'br':
+            serializer.linebreak()
+
+        elif elem.tag == 'img':
+            if 'src' in elem.attrib and 'data:' in elem.attrib['src']:
+                self.print_base64_image(elem.attrib['src'])
+
+        elif elem.tag == 'barcode' and 'encoding' in elem.attrib:
+            serializer.start_block(stylestack)
+            self.barcode(strclean(elem.text), elem.attrib['encoding'])
+            # barcode() centers the text
+            serializer.reset()
+            serializer.end_entity()
+
+        elif elem.tag == 'cut':
+            self.cut()
+        elif elem.tag == 'partialcut':
+            self.cut(mode='part')
+        elif elem.tag == 'cashdraw':
+            self.cashdraw(2)
+            self.cashdraw(5)
+
+        stylestack.pop()
+
+    def record(self):
+        """ Compile the commands sent with _raw into a program instead of printing them, until stop_recording() """
+        if self.recorders is None:
+            self.recorders = []
+        recorder = Recorder()
+        self.recorders.append(recorder)
+        self._raw = recorder.raw
+
+    def stop_recording(self):
+        """ :return: the program recorded since record() """
+        program = self.recorders.pop().take()
+        if self.recorders:
+            self._raw = self.recorders[-1].raw
+        else:
+            del self._raw
+        return program
+
+    def push(self):
+        """ the data sent so far must reach the printer now """
+        if self.recorders:
+            self.recorders[-1].push()
+
+    def execute(self, program):
+        """ Prints a compiled program """
+        for segment in program:
+            if segment is FLUSH:
+                self.push()
+            else:
+                self._raw(segment)
 
-            elif elem.tag == 'ol':
-                cwidth = len(str(len(elem))) + 2
-                i = 1
-                serializer.start_block(stylestack)
-                for child in elem:
-                    if child.tag == 'li':
-                        serializer.style(stylestack)
-                        serializer.raw(' ' * indent * stylestack.get('tabwidth') + ' ' + (str(i) + ')').ljust(cwidth))
-                        i = i + 1
-                    print_elem(stylestack, serializer, child, indent=indent + 1)
-                serializer.end_entity()
-
-            elif elem.tag == 'pre':
-                serializer.start_block(stylestack)
-                serializer.pre(elem.text)
-                serializer.end_entity()
-
-            elif elem.tag == 'hr':
-                width = stylestack.get('width')
-                if stylestack.get('size') in ('double', 'double-width'):
-                    width = width / 2
-                serializer.start_block(stylestack)
-                serializer.text('-' * width)
-                serializer.end_entity()
-
-            elif elem.tag == 'br':
-                serializer.linebreak()
-
-            elif elem.tag == 'img':
-                if 'src' in elem.attrib and 'data:' in elem.attrib['src']:
-                    self.print_base64_image(elem.attrib['src'])
-
-            elif elem.tag == 'barcode' and 'encoding' in elem.attrib:
-                serializer.start_block(stylestack)
-                self.barcode(strclean(elem.text), elem.attrib['encoding'])
-                serializer.end_entity()
-
-            elif elem.tag == 'cut':
-                self.cut()
-            elif elem.tag == 'partialcut':
-                self.cut(mode='part')
-            elif elem.tag == 'cashdraw':
-                self.cashdraw(2)
-                self.cashdraw(5)
-
-            stylestack.pop()
-
+    def compile_receipt(self, xml):
+        """
+        Compiles an xml based receipt definition while it is parsed. Reprinted receipts are taken
+        from the receipt cache, as long as their program is small enough to be kept.
+        :return: generator of the successive parts of the program, see execute()
+        """
+        depth = len(self.recorders or ())
         try:
-            stylestack = StyleStack()
-            serializer = XmlSerializer(self)
-            root = ET.fromstring(xml.encode('utf-8'))
-
-            self._raw(stylestack.to_escpos())
-
-            print_elem(stylestack, serializer, root)
-
-            if 'open-cashdrawer' in root.attrib and root.attrib['open-cashdrawer'] == 'true':
-                self.cashdraw(2)
-                self.cashdraw(5)
-            if not 'cut' in root.attrib or root.attrib['cut'] == 'true':
-                self.cut()
+            data = xml.encode('utf-8')
+            cache = self.receipt_cache
+            if cache.max_size:
+                key = cache.receipt_key(data, (self.raster_profile, getattr(self, 'codepage', None)))
+                cached = cache.get(key)
+                if cached is not None:
+                    yield cached[0]
+                    return
+            program, size = [], 0
+
+            renderer = None
+            for i in range(0, len(data) + self.receipt_chunk_size, self.receipt_chunk_size):
+                self.record()
+                if renderer is None:
+                    renderer = ReceiptRenderer(self)
+                if i < len(data):
+                    renderer.feed(data[i:i + self.receipt_chunk_size])
+                else:
+                    root = renderer.close()
+                    if 'open-cashdrawer' in root.attrib and root.attrib['open-cashdrawer'] == 'true':
+                        self.cashdraw(2)
+                        self.cashdraw(5)
+                    if not 'cut' in root.attrib or root.attrib['cut'] == 'true':
+                        self.cut()
+                part = self.stop_recording()
+                if program is not None:
+                    program += part
+                    size += sum(len(segment) for segment in part if segment is not FLUSH)
+                    if size > cache.max_size // 8:
+                        program = None
+                yield part
+
+            if program is not None and cache.max_size:
+                cache.put(key, (program, None))
+        except Exception:
+            # print what was rendered before the error, as the receipt is not printed at once
+            program = []
+            while len(self.recorders or ()) > depth:
+                program[:0] = self.stop_recording()
+            yield program
+            raise
+        finally:
+            while len(self.recorders or ()) > depth:
+                self.stop_recording()
+
+    def receipt(self, xml, cancelled=None):
+        """
+        Prints an xml based receipt definition
+        :param cancelled: function telling whether to stop printing, called before each part of the receipt
+        :return: False when the receipt was stopped, what was printed before is cut
+        """
+        try:
+            parts = self.compile_receipt(xml)
+            printed = False
+            for program in parts:
+                if cancelled is not None and cancelled():
+                    parts.close()
+                    if printed:
+                        self.cut()
+                    return False
+                self.execute(program)
+                printed = True
+            return True
 
         except Exception as e:
             errmsg = str(e) + '\n' + '-' * 48 + '\n' + traceback.format_exc() + '-' * 48 + '\n'
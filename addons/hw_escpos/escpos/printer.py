@@ -5,16 +5,34 @@ from escpos.constants import PAPER_FULL_CUT
 from .escpos import Escpos
 from .constants import DLE_EOT_PRINTER, DLE_EOT_OFFLINE, DLE_EOT_ERROR, DLE_EOT_PAPER
 from devices.printer import Usb as UsbPrinter
+from devices.printer.exceptions import NoStatusError
 
 
 class Usb(UsbPrinter, Escpos, EscposUSB):
     """ Define USB printer """
 
-    def __init__(self, idVendor, idProduct, timeout=0, in_ep=None, out_ep=None, *args, **kwargs):
-        UsbPrinter.__init__(self, idVendor, idProduct, timeout, in_ep, out_ep)
+    def __init__(self, idVendor, idProduct, timeout=0, in_ep=None, out_ep=None, serial_number=None, port=None,
+                 *args, **kwargs):
+        UsbPrinter.__init__(self, idVendor, idProduct, timeout, in_ep, out_ep, serial_number, port)
         self.errorText = b"ERROR PRINTER\n\n\n\n\n\n" + PAPER_FULL_CUT
 
-    def get_printer_status(self):
+    def cut(self, mode=''):
+        """ Cut paper and push the buffered data out so the ticket can be taken right away """
+        Escpos.cut(self, mode)
+        self.push()
+
+    def push(self):
+        if self.recorders:
+            Escpos.push(self)
+        elif self.buffer is not None:
+            self._write_buffer()
+
+    def get_printer_status(self, timeout=200):
+        """ Query the real-time status of the printer: the four DLE EOT requests are sent in a single
+        transfer and the printer answers each of them with one byte
+        :param timeout: milliseconds to wait for the answers
+        :raises NoStatusError: when the printer does not answer in time
+        """
         status = {
             'printer': {},
             'offline': {},
@@ -22,14 +40,13 @@ class Usb(UsbPrinter, Escpos, EscposUSB):
             'paper': {},
         }
 
-        self.device.write(self.out_ep, DLE_EOT_PRINTER, self.interface)
-        printer = self.__extract_status()
-        self.device.write(self.out_ep, DLE_EOT_OFFLINE, self.interface)
-        offline = self.__extract_status()
-        self.device.write(self.out_ep, DLE_EOT_ERROR, self.interface)
-        error = self.__extract_status()
-        self.device.write(self.out_ep, DLE_EOT_PAPER, self.interface)
-        paper = self.__extract_status()
+        self.drain()
+        self.device.write(self.out_ep, DLE_EOT_PRINTER + DLE_EOT_OFFLINE + DLE_EOT_ERROR + DLE_EOT_PAPER,
+                          self.timeout)
+        replies = self.read_status(4, timeout)
+        if len(replies) < 4:
+            raise NoStatusError('%d of 4 replies received' % len(replies))
+        printer, offline, error, paper = bytearray(replies[-4:])
 
         status['printer']['status_code'] = printer
         status['printer']['status_error'] = not ((printer & 147) == 18)
@@ -55,3 +72,43 @@ class Usb(UsbPrinter, Escpos, EscposUSB):
         status['paper']['present'] = not bool(paper & 96)
 
         return status
+
+
+class Renderer(Escpos):
+    """ Stands in for the Usb printer to render jobs ahead of time: everything sent to it is compiled into
+    programs (see Escpos.record()) which produce the same output once executed on the printer. The output
+    is split into parts at the chunks of the receipts, printing can stop between two parts.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.record()
+
+    def _raw(self, msg):
+        # replaced by the recorders, see record()
+        self.recorders[-1].raw(msg)
+
+    def cut(self, mode=''):
+        # same as Usb.cut()
+        Escpos.cut(self, mode)
+        self.push()
+
+    def execute(self, program):
+        Escpos.execute(self, program)
+        if len(self.recorders) == 1:
+            # a chunk of a receipt, see Escpos.receipt()
+            self.end_part()
+
+    def end_part(self):
+        program = self.recorders[0].take()
+        if program:
+            self.parts.append(program)
+
+    def take(self):
+        """ :return: list of the programs of the parts rendered since the last call """
+        self.end_part()
+        parts, self.parts = self.parts, []
+        return parts
+
+    def close(self):
+        pass
@@ -0,0 +1,49 @@
+import unittest
+
+from addons.hw_escpos.escpos.escpos import StyleStack
+
+
+class TestStyleStack(unittest.TestCase):
+
+    def setUp(self):
+        self.stack = StyleStack()
+        self.cmds = self.stack.cmds
+
+    def test_full_state(self):
+        self.assertEqual(self.stack.to_escpos(), b''.join(
+            self.cmds[style][self.stack.defaults[style]] for style in self.stack.cmd_order))
+
+    def test_delta(self):
+        previous = self.stack.state()
+        self.stack.push({'bold': 'on'})
+        self.assertEqual(self.stack.to_escpos(previous), self.cmds['bold']['on'])
+        self.stack.push({'align': 'center'})
+        self.assertEqual(self.stack.to_escpos(self.stack.states[-2]), self.cmds['align']['center'])
+        # nothing changed
+        self.assertEqual(self.stack.to_escpos(self.stack.state()), b'')
+
+    def test_size_resets(self):
+        # ESC ! resets the font, bold and underline modes, they are sent again after it
+        self.stack.push({'bold': 'on', 'font': 'b', 'underline': 'on'})
+        previous = self.stack.state()
+        self.stack.push({'size': 'double'})
+        self.assertEqual(self.stack.to_escpos(previous), self.cmds['size']['double'] + self.cmds['bold']['on'] +
+                         self.cmds['font']['b'] + self.cmds['underline']['on'])
+
+        # the modes left as they are reset are not sent
+        self.stack.pop()
+        self.stack.set({'font': 'a', 'underline': 'off'})
+        previous = self.stack.state()
+        self.stack.push({'size': 'double-height'})
+        self.assertEqual(self.stack.to_escpos(previous), self.cmds['size']['double-height'] + self.cmds['bold']['on'])
+
+    def test_size_resets_to_default(self):
+        self.stack.push({'size': 'double', 'bold': 'on'})
+        previous = self.stack.state()
+        self.stack.pop()
+        # back to normal, bold off is implied by ESC !
+        self.assertEqual(self.stack.to_escpos(previous), self.cmds['size']['normal'])
+
+
+if __name__ == '__main__':
+    unittest.main()
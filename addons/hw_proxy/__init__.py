@@ -1,3 +1,3 @@
-from . import controllers
+from . import controllers, driver, jobs
 
-__all__ = ['controllers']
+__all__ = ['controllers', 'driver', 'jobs']
@@ -0,0 +1,77 @@
+import time
+import random
+
+# states of the circuit breaker
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker(object):
+    """ Retry policy of a device
+
+    The breaker is closed while the device works. When it fails the breaker opens and nothing is
+    attempted on the device until the retry delay elapsed, then it is half-open: one attempt is let
+    through, which closes the breaker when it succeeds or opens it again for twice the delay when it
+    fails. The delays grow exponentially up to `max_delay` and are spread by a random jitter, so
+    the devices failing together are not all retried at the same time.
+    """
+
+    def __init__(self, base_delay=1.0, max_delay=30.0, jitter=0.2):
+        """
+        :param base_delay: seconds before the first retry
+        :param max_delay: maximum seconds between two retries
+        :param jitter: fraction of the delay added or removed at random
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.state = CLOSED
+        # failures since the last success
+        self.consecutive_failures = 0
+        # monotonic time from which an attempt is allowed when open
+        self.retry_at = 0.0
+        self.attempts = 0
+        self.failures = 0
+        # times the breaker opened after the device worked
+        self.opened = 0
+
+    def allow(self, now=None):
+        """ :return: whether the device can be tried now """
+        if self.state == OPEN and (now if now is not None else time.monotonic()) >= self.retry_at:
+            self.state = HALF_OPEN
+        return self.state != OPEN
+
+    def retry_now(self):
+        """ let the next attempt through, e.g. the device was plugged again """
+        if self.state == OPEN:
+            self.state = HALF_OPEN
+
+    def success(self):
+        self.attempts += 1
+        self.state = CLOSED
+        self.consecutive_failures = 0
+
+    def failure(self, now=None):
+        """ :return: monotonic time of the next attempt """
+        now = now if now is not None else time.monotonic()
+        self.attempts += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        delay = min(self.base_delay * 2 ** min(self.consecutive_failures - 1, 32), self.max_delay)
+        delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        if self.state == CLOSED:
+            self.opened += 1
+        self.state = OPEN
+        self.retry_at = now + delay
+        return self.retry_at
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'attempts': self.attempts,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'opened': self.opened,
+            'retry_in': round(max(0.0, self.retry_at - time.monotonic()), 3) if self.state == OPEN else 0.0,
+        }
@@ -1,7 +1,14 @@
 import re
+import json
 import time
+import hashlib
 import logging
 from odoo import http
+from odoo.http.core import request, HTTPResponse
+from state import StateManager
+from addons.hw_proxy.driver import PrinterPool
+from addons.hw_proxy.jobs import QueueFull
+from addons.hw_proxy.journal import JournalError
 
 # drivers modules must add to drivers an object with a get_status() method
 # so that 'status' can return the status of all active drivers
@@ -10,6 +17,125 @@ drivers = {}
 _logger = logging.getLogger(__name__)
 
 
+def register_drivers(driver_class, pool_class=PrinterPool):
+    """ create and add to drivers the driver of the default printer of driver_class, and one
+    driver per additional printer or pool of printers configured (see StateManager.get_printer_names
+    and StateManager.get_printer_pools), so that each printer has its own queue and thread and
+    independent printers print in parallel
+    :return: driver of the default printer
+    """
+    state = StateManager.getInstance()
+    driver = driver_class()
+    drivers[driver.name] = driver
+
+    printer_names = state.get_printer_names(driver_class.printer_type)
+    pooled = set()
+    for pool_name, members in state.get_printer_pools(driver_class.printer_type).items():
+        members = [name for name in members if name in printer_names and name not in pooled]
+        if not members:
+            _logger.warning('%s: the pool %s has no printer' % (driver_class.label, pool_name))
+            continue
+        pool = pool_class(driver_class, pool_name, members)
+        drivers[pool.name] = pool
+        pooled.update(members)
+
+    for printer_name in printer_names:
+        if printer_name in pooled:
+            continue
+        named_driver = driver_class(printer_name)
+        if named_driver.name in drivers:
+            _logger.warning('%s: the printer %s has the name of a pool' % (driver_class.label, printer_name))
+            continue
+        drivers[named_driver.name] = named_driver
+
+    # printers of the same model open the first device found unless they say which one they are
+    devices = {}
+    for printer_name in [None] + printer_names:
+        printer = state.get_printer(driver_class.printer_type, printer_name)
+        if printer.vendor_id and printer.id in devices:
+            _logger.warning('%s: the printers %s and %s are the same device, set their serial_number or port'
+                            % (driver_class.label, devices[printer.id] or 'default', printer_name))
+        devices.setdefault(printer.id, printer_name)
+    return driver
+
+
+def get_driver(name, printer=None):
+    """
+    :param name: name of the driver class, 'escpos' or 'zpl'
+    :param printer: name of an additional printer, None for the default printer
+    :return: the driver of this printer
+    """
+    key = name if not printer else '%s:%s' % (name, printer)
+    if key not in drivers:
+        raise ValueError('Unknown printer: %s' % printer)
+    return drivers[key]
+
+
+def get_job(job_id):
+    """ :return: status of a job recently pushed on any printer, None when it is unknown or forgotten """
+    for name, driver in drivers.items():
+        job = driver.history.get(job_id)
+        if job is not None:
+            return dict(job.get_status(), printer=name)
+    return None
+
+
+def cancel_jobs(job_id=None, task=None, client=None):
+    """ cancel a job, or the jobs of a task and/or of a client, on all the printers, see PrinterDriver.cancel()
+    :return: status of the jobs cancelled
+    """
+    statuses = []
+    for name, driver in drivers.items():
+        statuses += [dict(job.get_status(), printer=name) for job in driver.cancel(job_id, task, client)]
+    return statuses
+
+
+def request_key(payload, job_key=None):
+    """ :return: idempotency key of a print request: the job key sent by the client, or else the JSON-RPC id
+                 of the request with the hash of what is printed. None when the request has neither.
+    """
+    if job_key:
+        return str(job_key)
+    json_request = request.json
+    if isinstance(json_request, dict) and json_request.get('id') is not None:
+        digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+        return '%s:%s' % (json_request['id'], digest)
+    return None
+
+
+def error_response(code, message, data=None, headers=None):
+    """ :return: response to a json request failing with the HTTP status code, with a JSON-RPC error """
+    json_request = request.json
+    error = {
+        'jsonrpc': '2.0',
+        'id': json_request.get('id') if isinstance(json_request, dict) else None,
+        'error': {'code': code, 'message': message, 'data': data or {}},
+    }
+    return HTTPResponse(error, status=code, headers=headers)
+
+
+def push_job(name, printer, task, data=None, job_key=None):
+    """ queue a task on a printer for a print route
+    :param name: name of the driver class, 'escpos' or 'zpl'
+    :param printer: name of an additional printer, None for the default printer
+    :param job_key: idempotency key sent by the client, see request_key()
+    :return: status of the job, with the id to look it up with get_job(), or an error response: 429 telling when
+             to submit again if the queue is full, 413 if the job is bigger than the queue, 503 if it could not
+             be journaled
+    """
+    key = request_key(data, job_key) if data is not None else None
+    driver = get_driver(name, printer)
+    try:
+        job = driver.push_task(task, data, key=key, client=request.remote_addr)
+    except QueueFull as e:
+        return error_response(429, str(e), {'retry_after': e.retry_after}, {'Retry-After': str(e.retry_after)})
+    except ValueError as e:
+        return error_response(413, str(e))
+    except JournalError as e:
+        return error_response(503, str(e))
+    return dict(job.get_status(), printer=driver.name)
+
+
 class Proxy(http.Controller):
 
     def get_status(self):
@@ -76,6 +202,42 @@ class Proxy(http.Controller):
     def status_json(self):
         return self.get_status()
 
+    @http.route('/hw_proxy/job/<job_id>', type='json', auth='none', cors='*')
+    def job(self, job_id):
+        """
+        Status of a print job, by the id returned when it was submitted. Null when
+        the job is unknown or finished long ago.
+        """
+        return get_job(job_id)
+
+    @http.route('/hw_proxy/jobs', type='json', auth='none', cors='*')
+    def jobs(self, ids):
+        """
+        Status of several print jobs, by id
+        """
+        if not isinstance(ids, list):
+            raise ValueError('ids must be a list of job ids')
+        return dict((job_id, get_job(job_id)) for job_id in ids)
+
+    @http.route('/hw_proxy/cancel_job', type='json', auth='none', cors='*')
+    def cancel_job(self, job_id):
+        """
+        Cancel a print job, by id. A job being printed stops at the next chunk
+        of its output, its state tells when it did.
+        """
+        statuses = cancel_jobs(job_id=job_id)
+        return statuses[0] if statuses else None
+
+    @http.route('/hw_proxy/cancel_jobs', type='json', auth='none', cors='*')
+    def cancel_jobs(self, task=None, client=None):
+        """
+        Cancel all the print jobs of a task (receipt, label...) and/or of a client
+        address (as reported in the status of the jobs)
+        """
+        if task is None and client is None:
+            raise ValueError('task or client is required')
+        return cancel_jobs(task=task, client=client)
+
     @http.route('/hw_proxy/scan_item_success', type='json', auth='none', cors='*')
     def scan_item_success(self, ean):
         """
@@ -0,0 +1,674 @@
+# -*- coding: utf-8 -*-
+import os
+import math
+import time
+import logging
+import traceback
+from threading import Lock, Event
+from PyQt5 import QtCore
+
+try:
+    import usb.core
+except ImportError:
+    usb = None
+
+from devices import Printer
+from devices.printer.exceptions import NoStatusError
+from devices.printer import UsbPool
+from devices.printer.hotplug import monitor as hotplug_monitor, DETACHED
+from odoo.thread import Thread
+from state import StateManager
+
+from .jobs import (Job, JobQueue, DedupIndex, JobHistory, QueueFull, JobCancelled, payload_size, PRIORITY_HIGH,
+                   PRIORITY_NORMAL, STATE_QUEUED, STATE_RENDERING, STATE_SENDING, STATE_DONE, STATE_FAILED,
+                   STATE_CANCELLED, FINAL_STATES)
+from .journal import Journal, JournalError
+from .breaker import CircuitBreaker
+
+_logger = logging.getLogger(__name__)
+
+
+class JobStore(object):
+    """ Jobs of a printer, or of a pool of printers sharing them: the queue, the jobs being printed, the
+    journal, and the recent jobs by id and by idempotency key
+    """
+    # bounds in seconds of the delay after which a client is told to submit again when the queue is full
+    min_retry_after = 1
+    max_retry_after = 300
+    # jobs the high priority tasks (opening the cash drawer...) can queue beyond max_jobs
+    high_priority_jobs = 10
+
+    def __init__(self, name, label, tasks, retry_in):
+        """
+        :param name: name of the printer or of the pool, also names the journal
+        :param label: prefix of the log messages
+        :param tasks: priority class, time to live and whether they print of the tasks, see PrinterDriver.tasks
+        :param retry_in: function returning the seconds before a printer is tried again
+        """
+        self.name = name
+        self.label = label
+        self.tasks = tasks
+        self.retry_in = retry_in
+        self.queue = JobQueue(on_expire=self.finish)
+        config = StateManager.getInstance().driver
+        self.dedup = DedupIndex(config.dedup_window, config.dedup_size)
+        self.history = JobHistory(config.history_window, config.history_size)
+        # jobs taken from the queue and being printed, by id
+        self.running = {}
+        self.max_jobs = config.max_jobs
+        self.max_queue_size = config.max_queue_size * 1024
+        self.journal = None
+        self.journal_opened = False
+        # jobs admitted but not queued yet, while they are journaled
+        self.reserved_jobs = 0
+        self.reserved_bytes = 0
+        self.lock = Lock()
+
+    def open_journal(self):
+        """ replay the jobs left unfinished by the previous run, and journal the new ones """
+        with self.lock:
+            if self.journal_opened:
+                return
+            self.journal_opened = True
+            state = StateManager.getInstance()
+            config = state.journal
+            if not config.enabled:
+                return
+
+            journal = Journal(os.path.join(state.base_path, 'journal', '%s.log' % self.name.replace(':', '-')),
+                              config.commit_delay / 1000.0, config.compact_size)
+            records = journal.replay()
+            journal.open()
+            self.journal = journal
+            for record in records:
+                job = journal.restore(record)
+                if job is None:
+                    journal.done(record['id'])
+                    continue
+                job.size = payload_size(job.data)
+                if record.get('key') is not None:
+                    self.dedup.setdefault((job.task, record['key']), job)
+                self.history.add(job)
+                self.queue.put(job)
+            if records:
+                _logger.info('%s: %d unfinished jobs replayed from the journal' % (self.label, len(records)))
+
+    def push(self, task, data=None, key=None, client=None):
+        """ queue a task, see PrinterDriver.push_task() """
+        self.open_journal()
+        priority, ttl, prints = self.tasks.get(task, (PRIORITY_NORMAL, None, True))
+        job = Job(task, data, priority, ttl)
+        job.client = client
+        job.size = payload_size(data)
+        if job.size > self.max_queue_size:
+            raise ValueError('%s: the job is bigger than the queue (%d KB)' % (self.label, job.size // 1024))
+        if key is not None:
+            known = self.dedup.setdefault((task, key), job)
+            if known is not job:
+                _logger.info('%s: duplicate %s request ignored' % (self.label, task))
+                return known
+
+        with self.lock:
+            try:
+                self.check_capacity(job)
+            except QueueFull:
+                # the request can be submitted again with the same key
+                job.set_state(STATE_FAILED)
+                raise
+            # counted in the queue from now on, so that concurrent requests can not exceed its capacity
+            self.reserved_jobs += 1
+            self.reserved_bytes += job.size
+
+        try:
+            if self.journal:
+                try:
+                    self.journal.add(job, key)
+                except JournalError:
+                    # not queued, it would be lost on a restart
+                    job.set_state(STATE_FAILED)
+                    raise
+            self.history.add(job)
+            self.queue.put(job)
+        finally:
+            with self.lock:
+                self.reserved_jobs -= 1
+                self.reserved_bytes -= job.size
+        return job
+
+    def finish(self, job):
+        """ the job is printed, failed or expired """
+        # the history and the dedup index keep the job for its status only
+        job.data = None
+        job.output = None
+        self.history.finish(job)
+        if self.journal:
+            self.journal.done(job.id)
+
+    def cancel(self, job_id=None, task=None, client=None):
+        """ cancel a job, or all the jobs of a task and/or of a client, see PrinterDriver.cancel() """
+        if job_id is not None:
+            job = self.history.get(job_id)
+            jobs = [job] if job is not None and job.state not in FINAL_STATES else []
+            removed = [job for job in jobs if self.queue.remove(job)]
+        else:
+            removed = self.queue.remove_all(task, client)
+            jobs = removed + [job for job in list(self.running.values())
+                              if (task is None or job.task == task) and (client is None or job.client == client)]
+        for job in jobs:
+            job.cancelled = True
+        for job in removed:
+            job.set_state(STATE_CANCELLED)
+            self.finish(job)
+        if jobs:
+            _logger.info('%s: %d jobs cancelled' % (self.label, len(jobs)))
+        return jobs
+
+    def check_capacity(self, job):
+        """ check, with the lock held, that the queue has room for job. The high priority tasks can exceed
+        max_jobs by high_priority_jobs, so that the receipts filling the queue do not block them.
+        :raises QueueFull: when the queue has no room for job, with the time it should take to drain enough
+        """
+        count, size = len(self.queue) + self.reserved_jobs, self.queue.bytes + self.reserved_bytes
+        max_jobs = self.max_jobs
+        if job.priority <= PRIORITY_HIGH:
+            max_jobs += self.high_priority_jobs
+        if count < max_jobs and size + job.size <= self.max_queue_size:
+            return
+
+        # number of jobs to print before this one fits
+        excess = max(count + 1 - max_jobs, 0)
+        if size + job.size > self.max_queue_size:
+            average = max(float(size) / max(count, 1), 1.0)
+            excess = max(excess, int(math.ceil((size + job.size - self.max_queue_size) / average)))
+        rate = self.queue.drain_rate()
+        if rate:
+            retry_after = excess / rate
+        else:
+            # nothing printed lately, the printer is probably gone
+            retry_after = max(self.retry_in(), 30)
+        retry_after = int(math.ceil(min(max(retry_after, self.min_retry_after), self.max_retry_after)))
+        _logger.warning('%s: queue full, %s rejected' % (self.label, job.task))
+        raise QueueFull('%s: the queue is full (%d jobs, %d KB)' % (self.label, count, size // 1024), retry_after)
+
+
+class PrinterDriver(Thread):
+    """ Base of the printer driver threads
+
+    Jobs are dispatched as soon as they are pushed. Device health is probed separately, only every
+    `probe_max_interval` once the printer is connected and healthy (printing a job already tells
+    whether the device is alive). A device which fails goes through a circuit breaker: it is not
+    tried again before `probe_interval`, then twice as long after each new failure, up to
+    `probe_max_interval`, whatever the number of jobs pushed meanwhile. When the USB
+    hotplug monitor runs, a printer which is not plugged is not searched on the bus at all, and the
+    driver is woken up as soon as it is attached or detached.
+
+    The real-time status reported by the printer (paper, cover...) is cached for `status_ttl`. Neither
+    reading the driver status nor dispatching a job waits for the device: the jobs are held according to
+    the cached status, and a stale one is queried again by the driver thread as soon as no job is
+    waiting, or right after a job failed. When it tells that the printer can not print (no paper, cover
+    open...) the jobs are held and the status is queried every `hold_interval` until it clears. The tasks
+    which do not print (opening the cash drawer) are not held.
+    """
+    printer_status_signal = QtCore.pyqtSignal(str, str)
+
+    # StateManager.ZPL_PRINTER or StateManager.ESCPOS_PRINTER
+    printer_type = None
+    # Usb class used to open the printer
+    device_class = None
+    # key of the driver in hw_proxy.drivers, also names its journal, see __init__ for the named printers
+    name = None
+    # prefix of the log messages
+    label = 'Printer'
+    # priority class, time to live in seconds (None never expires) and whether they print, of the tasks
+    tasks = {}
+    # PrinterPool the printer belongs to, its jobs are shared by all the printers of the pool
+    printer_pool = None
+
+    def __init__(self, printer_name=None, printer_pool=None):
+        """
+        :param printer_name: name of the additional printer the driver prints on, None for the default printer
+        :param printer_pool: PrinterPool the printer belongs to
+        """
+        Thread.__init__(self)
+        self.printer_name = printer_name
+        if printer_name is not None:
+            self.name = '%s:%s' % (self.name, printer_name)
+            self.label = '%s %s' % (self.label, printer_name)
+        if printer_pool is not None:
+            self.printer_pool = printer_pool
+            self.store = printer_pool.store
+        else:
+            self.store = JobStore(self.name, self.label, self.tasks, self.retry_in)
+        self.queue = self.store.queue
+        self.dedup = self.store.dedup
+        self.history = self.store.history
+        self.running = self.store.running
+        self.lock = Lock()
+        self.wakeup = Event()
+        self.status = {'status': 'connecting', 'messages': []}
+        self.current_printer_status = None
+        self.pool = UsbPool(self.device_class)
+        self.breaker = CircuitBreaker()
+        # real-time status reported by the printer, see query_printer_status()
+        self.printer_status = None
+        self.printer_status_time = None
+        self.printer_status_wanted = False
+        self.status_ttl = 0
+        # why the jobs are held, None when they are printed
+        self.held = None
+        self.metrics = {'jobs': 0, 'latency_last': 0.0, 'latency_avg': 0.0, 'latency_max': 0.0}
+
+    def lockedstart(self):
+        with self.lock:
+            if not self.isAlive():
+                self.daemon = True
+                self.start()
+
+    def get_printer(self):
+        """ :return: Printer object configured for this driver """
+        return StateManager.getInstance().get_printer(self.printer_type, self.printer_name)
+
+    def get_device(self):
+        """ :return: opened device of the configured printer or None when it is not available """
+        printer = self.get_printer()
+        printer_device = None
+        if self.is_unplugged(printer):
+            # no need to search the bus
+            self.pool.discard(printer)
+            printer.status = Printer.STATUS_DISCONNECTED
+            self.update_printer_status(printer)
+            return None
+        try:
+            # drop the handle of a previously selected printer
+            self.pool.release_others(printer)
+            printer_device = self.pool.get(printer)
+            printer.status = Printer.STATUS_CONNECTED
+            return printer_device
+        except usb.core.USBError:
+            printer.status = Printer.STATUS_DISCONNECTED
+        finally:
+            self.update_printer_status(printer, printer_device)
+
+        return printer_device
+
+    def is_unplugged(self, printer):
+        """ :return: whether the hotplug monitor knows that the printer is not plugged """
+        return hotplug_monitor.is_present(printer.vendor_id, printer.product_id, printer.serial_number or None,
+                                          printer.port or None) is False
+
+    def update_printer_status(self, printer, printer_device=None):
+        if printer.status != self.current_printer_status:
+            self.current_printer_status = printer.status
+            self.held = None
+            if printer_device:
+                self.set_status(
+                    'connected',
+                    "Connected to %s (in=0x%02x,out=0x%02x)" % (printer.description,
+                                                                printer_device.in_ep,
+                                                                printer_device.out_ep)
+                )
+            else:
+                self.set_status('disconnected', 'Printer Not Found')
+
+        # update status in GUI
+        self.printer_status_signal.emit(str(self.printer_type), str(printer.status))
+
+    def get_status(self):
+        status = dict(self.status, metrics=dict(self.metrics, expired=self.queue.dropped,
+                                                expired_tasks=dict(self.queue.dropped_tasks),
+                                                queued=len(self.queue), queued_bytes=self.queue.bytes),
+                      breaker=self.breaker.stats())
+        if self.store.journal and self.printer_pool is None:
+            status['journal'] = self.store.journal.stats()
+        if self.printer_status_time is not None:
+            status['printer_status'] = self.printer_status
+            status['printer_status_age'] = round(time.monotonic() - self.printer_status_time, 3)
+        self.request_printer_status()
+        return status
+
+    def request_printer_status(self):
+        """ ask the driver thread to query the real-time status of the printer when the cached one is stale """
+        if not self.status_ttl or not self.is_connected():
+            return
+        if self.printer_status_stale():
+            self.printer_status_wanted = True
+            self.interrupt()
+
+    def refresh_printer_status(self):
+        """ query the real-time status of the printer, from the driver thread """
+        self.printer_status_wanted = False
+        printer = self.get_printer()
+        try:
+            self.printer_status = self.query_printer_status(self.pool.get(printer))
+        except NoStatusError as e:
+            _logger.debug('%s: %s' % (self.label, str(e)))
+            self.printer_status = None
+        except usb.core.USBError:
+            self.breaker.failure()
+            self.pool.discard(printer)
+            printer.status = Printer.STATUS_DISCONNECTED
+            self.update_printer_status(printer)
+            self.printer_status = None
+        self.printer_status_time = time.monotonic()
+
+    def query_printer_status(self, device):
+        """ :return: real-time status reported by the device, None when the printer language has none """
+        return None
+
+    def printer_status_stale(self):
+        return self.printer_status_time is None or time.monotonic() - self.printer_status_time >= self.status_ttl
+
+    def hold_reason(self, printer_status):
+        """ :return: why the printer can not print according to its real-time status, None when it can """
+        return None
+
+    def hold_jobs(self):
+        """ :return: whether the jobs must wait, according to the cached status of the printer """
+        reason = self.hold_reason(self.printer_status) if self.printer_status else None
+        if reason != self.held:
+            self.held = reason
+            if reason:
+                _logger.warning('%s: %s, the jobs are held' % (self.label, reason))
+                self.set_status('held', '%s, the jobs are held' % reason.capitalize())
+            else:
+                self.set_status('connected', 'Printing resumed')
+        return bool(reason)
+
+    def set_status(self, status, message=None):
+        _logger.info(status + ' : ' + (message or 'no message'))
+        if status == self.status['status']:
+            if message != None and (len(self.status['messages']) == 0 or message != self.status['messages'][-1]):
+                self.status['messages'].append(message)
+        else:
+            self.status['status'] = status
+            if message:
+                self.status['messages'] = [message]
+            else:
+                self.status['messages'] = []
+
+        if status == 'error' and message:
+            _logger.error('%s Error: %s' % (self.label, message))
+        elif status == 'disconnected' and message:
+            _logger.warning('%s Device Disconnected: %s' % (self.label, message))
+
+    def is_connected(self):
+        return self.current_printer_status == Printer.STATUS_CONNECTED
+
+    def on_hotplug(self, event, vendor_id, product_id):
+        """ called by the hotplug monitor when an USB device is attached or detached """
+        printer = self.get_printer()
+        if (printer.vendor_id, printer.product_id) != (vendor_id, product_id):
+            return
+        _logger.info('%s: printer %s' % (self.label, event))
+        if event != DETACHED:
+            self.breaker.retry_now()
+        self.wakeup.set()
+        if event == DETACHED:
+            # stop waiting for jobs, the next probe drops the handle
+            self.interrupt()
+
+    def run(self):
+        self.store.open_journal()
+        config = StateManager.getInstance().driver
+        if config.hotplug_interval:
+            hotplug_monitor.subscribe(self.on_hotplug)
+            hotplug_monitor.start(config.hotplug_interval / 1000.0)
+        self.status_ttl = config.status_ttl / 1000.0
+        hold_interval = config.hold_interval / 1000.0
+        probe_max_interval = config.probe_max_interval / 1000.0
+        self.breaker.base_delay = config.probe_interval / 1000.0
+        self.breaker.max_delay = probe_max_interval
+        next_probe = time.monotonic()
+
+        while True:
+            if self.wakeup.is_set() or time.monotonic() >= next_probe:
+                self.wakeup.clear()
+                next_probe = self.probe(probe_max_interval)
+
+            # expired jobs are dropped whether or not the printer is there
+            self.queue.sweep()
+            next_expiry = self.queue.next_expiry()
+            timeout = max(0, min(next_probe, next_expiry or next_probe) - time.monotonic())
+            if not self.is_connected():
+                # hold the jobs until the printer comes back
+                self.wakeup.wait(timeout)
+                continue
+
+            job = None
+            if self.status_ttl:
+                if self.held and len(self.queue) or self.printer_status_wanted and self.is_idle():
+                    self.refresh_printer_status()
+                if self.hold_jobs():
+                    job = self.queue.get_task(self.unheld_tasks())
+                    if job is None:
+                        # the jobs can not be printed, look again soon
+                        self.wakeup.wait(hold_interval)
+                        continue
+
+            if job is None:
+                job = self.next_job(timeout)
+                if job is None:
+                    continue
+            self.running[job.id] = job
+            try:
+                dispatched = self.dispatch(job)
+            finally:
+                self.running.pop(job.id, None)
+            if not dispatched:
+                self.requeue(job)
+                next_probe = self.breaker.retry_at
+            elif self.status_ttl and job.state == STATE_FAILED:
+                # the printer may have stopped (no paper...), hold the next jobs if so
+                self.refresh_printer_status()
+            elif self.status_ttl and self.printer_status_stale():
+                # queried once no job is waiting
+                self.printer_status_wanted = True
+
+    def unheld_tasks(self):
+        """ :return: the tasks which do not print, they run while the jobs are held """
+        return [task for task, (priority, ttl, prints) in self.tasks.items() if not prints]
+
+    def is_idle(self):
+        """ :return: whether no job is waiting to be printed """
+        return not len(self.queue)
+
+    def next_job(self, timeout):
+        """ :return: the next job to print, None when the timeout elapsed or the thread was interrupted """
+        return self.queue.get(timeout)
+
+    def requeue(self, job):
+        """ put back a job which could not be printed """
+        self.queue.requeue(job)
+
+    def interrupt(self):
+        """ wake up the driver thread waiting for a job """
+        self.queue.interrupt()
+
+    def probe(self, probe_max_interval):
+        """ check the device, when it is disconnected only if the circuit breaker lets it through
+        :return: monotonic time of the next probe
+        """
+        now = time.monotonic()
+        if not self.is_connected() and not self.breaker.allow(now):
+            return self.breaker.retry_at
+        if self.get_device() is not None:
+            # connected and healthy, jobs will tell us when it goes away
+            self.breaker.success()
+            return now + probe_max_interval
+        if self.is_unplugged(self.get_printer()):
+            # the hotplug monitor wakes us up when it is attached
+            return now + probe_max_interval
+        return self.breaker.failure(now)
+
+    def dispatch(self, job):
+        """ run a job on the device
+        :return: False when the job must be printed again
+        """
+        if job.cancelled:
+            job.set_state(STATE_CANCELLED)
+            self.finish(job)
+            return True
+
+        printer = self.get_printer()
+        try:
+            device = self.pool.get(printer)
+            device.first_write = None
+            job.set_state(STATE_RENDERING)
+            device.begin()
+            try:
+                self.process_job(device, job)
+                # the first bytes may have been written while rendering
+                job.set_state(STATE_SENDING, device.first_write)
+            finally:
+                device.flush()
+            job.set_state(STATE_DONE)
+            self.breaker.success()
+            self.finish(job)
+            if device.first_write is not None:
+                self.record_latency(device.first_write - job.enqueued)
+        except JobCancelled:
+            # what was rendered before is printed, the device is fine
+            job.set_state(STATE_CANCELLED)
+            self.breaker.success()
+            self.finish(job)
+            _logger.info('%s: %s stopped' % (self.label, job.task))
+        except usb.core.USBError:
+            # the handle is dead, reconnect on the next attempt
+            job.set_state(STATE_QUEUED)
+            self.breaker.failure()
+            self.pool.discard(printer)
+            printer.status = Printer.STATUS_DISCONNECTED
+            self.update_printer_status(printer)
+            return False
+        except Exception as e:
+            job.set_state(STATE_FAILED)
+            self.finish(job)
+            self.set_status('error', str(e))
+            errmsg = str(e) + '\n' + '-' * 60 + '\n' + traceback.format_exc() + '-' * 60 + '\n'
+            _logger.error(errmsg)
+        return True
+
+    def process_job(self, device, job):
+        """ print job on device, implemented by the drivers """
+        raise NotImplementedError()
+
+    def finish(self, job):
+        """ the job is printed, failed or expired """
+        self.store.finish(job)
+
+    def record_latency(self, latency):
+        """ keep track of the time between enqueueing a job and its first byte reaching the device """
+        metrics = self.metrics
+        latency = round(latency * 1000, 3)
+        metrics['jobs'] += 1
+        metrics['latency_last'] = latency
+        metrics['latency_avg'] = round(metrics['latency_avg'] + (latency - metrics['latency_avg']) / metrics['jobs'], 3)
+        metrics['latency_max'] = max(metrics['latency_max'], latency)
+
+    def push_task(self, task, data=None, key=None, client=None):
+        """ queue a task
+        :param key: idempotency key of the request, a task pushed again with the same key is not printed twice
+        :param client: address of the client pushing the task, see cancel()
+        :return: the Job, which is the one of the first submission for a duplicate
+        :raises ValueError: when the job is bigger than the queue
+        :raises QueueFull: when the queue has no room for the job
+        :raises JournalError: when the job could not be journaled
+        """
+        self.lockedstart()
+        job = self.store.push(task, data, key, client)
+        if not self.is_connected() or self.held:
+            # try to reach the printer right away instead of waiting for the next probe or hold check
+            self.wakeup.set()
+        return job
+
+    def cancel(self, job_id=None, task=None, client=None):
+        """ cancel a job, or all the jobs of a task and/or of a client. Queued jobs are removed from the
+        queue, the jobs being printed stop at the next chunk of their output.
+        :return: list of the unfinished Jobs which are cancelled
+        """
+        return self.store.cancel(job_id, task, client)
+
+    def retry_in(self):
+        """ :return: seconds before the printer is tried again, 0 when it is connected """
+        return self.breaker.stats()['retry_in']
+
+
+class PrinterPool(object):
+    """ Printers of the same kind sharing one queue, addressed like a single printer
+
+    The pool has no thread of its own: each printer keeps its driver thread and takes the next jobs of
+    the shared queue as soon as its device is free, so the jobs go to the printers with the least
+    outstanding data. A printer whose device fails puts its job back for the others and takes no more
+    jobs until its probe finds the device again.
+    """
+
+    def __init__(self, driver_class, pool_name, printer_names):
+        """
+        :param driver_class: PrinterDriver class of the printers
+        :param pool_name: name the pool is addressed with
+        :param printer_names: names of the additional printers of the pool
+        """
+        self.printer_type = driver_class.printer_type
+        self.name = '%s:%s' % (driver_class.name, pool_name)
+        self.label = '%s %s' % (driver_class.label, pool_name)
+        self.printer_name = pool_name
+        self.store = JobStore(self.name, self.label, driver_class.tasks, self.retry_in)
+        self.queue = self.store.queue
+        self.history = self.store.history
+        self.members = [driver_class(printer_name, self) for printer_name in printer_names]
+
+    def start(self):
+        """ start the driver threads of the printers, the pool is started like a driver """
+        self.lockedstart()
+
+    def lockedstart(self):
+        for member in self.members:
+            member.lockedstart()
+
+    def is_connected(self):
+        return any(member.is_connected() for member in self.members)
+
+    def connected_members(self):
+        return len([member for member in self.members if member.is_connected()])
+
+    def retry_in(self):
+        """ :return: seconds before the first printer of the pool is tried again """
+        return min(member.retry_in() for member in self.members)
+
+    def get_status(self):
+        members = dict((member.printer_name, member.get_status()) for member in self.members)
+        statuses = [status['status'] for status in members.values()]
+        if 'connected' in statuses:
+            status = 'connected'
+        elif 'connecting' in statuses:
+            status = 'connecting'
+        else:
+            status = 'disconnected'
+        messages = ['%d/%d printers connected' % (statuses.count('connected'), len(statuses))]
+        messages += ['%s: %s' % (name, member['messages'][-1]) for name, member in members.items() if member['messages']]
+
+        metrics = {
+            'jobs': sum(member['metrics']['jobs'] for member in members.values()),
+            'latency_max': max([member['metrics']['latency_max'] for member in members.values()] or [0.0]),
+            'expired': self.queue.dropped,
+            'expired_tasks': dict(self.queue.dropped_tasks),
+            'queued': len(self.queue),
+            'queued_bytes': self.queue.bytes,
+        }
+        status = {'status': status, 'messages': messages, 'metrics': metrics, 'printers': members}
+        if self.store.journal:
+            status['journal'] = self.store.journal.stats()
+        return status
+
+    def push_task(self, task, data=None, key=None, client=None):
+        """ queue a task for the first printer of the pool to be free, see PrinterDriver.push_task() """
+        self.lockedstart()
+        job = self.store.push(task, data, key, client)
+        for member in self.members:
+            if not member.is_connected():
+                member.wakeup.set()
+        return job
+
+    def cancel(self, job_id=None, task=None, client=None):
+        """ see PrinterDriver.cancel() """
+        return self.store.cancel(job_id, task, client)
@@ -0,0 +1,440 @@
+import json
+import time
+import uuid
+import heapq
+import itertools
+from collections import OrderedDict, deque
+from threading import Condition, Lock
+
+# priority classes, lower is served first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+
+# states of a job
+STATE_QUEUED = 'queued'
+STATE_RENDERING = 'rendering'
+STATE_SENDING = 'sending'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+STATE_EXPIRED = 'expired'
+STATE_CANCELLED = 'cancelled'
+# states of the jobs which are over
+FINAL_STATES = (STATE_DONE, STATE_FAILED, STATE_EXPIRED, STATE_CANCELLED)
+
+
+def payload_size(data):
+    """ :return: approximate size in bytes of the data of a job """
+    if data is None:
+        return 0
+    if isinstance(data, (str, bytes)):
+        return len(data)
+    return len(json.dumps(data, default=str))
+
+
+class QueueFull(Exception):
+    """ The queue of a driver can not take more jobs """
+
+    def __init__(self, message, retry_after):
+        """
+        :param retry_after: seconds after which the queue should have room again
+        """
+        Exception.__init__(self, message)
+        self.retry_after = retry_after
+
+
+class JobCancelled(Exception):
+    """ The job was cancelled while it was printed """
+
+
+class Job(object):
+    """ A task queued on a printer driver """
+
+    def __init__(self, task, data=None, priority=PRIORITY_NORMAL, ttl=None):
+        """
+        :param priority: priority class of the job, see PRIORITY_HIGH and PRIORITY_NORMAL
+        :param ttl: seconds after which the job is dropped instead of printed, None never expires
+        """
+        self.id = uuid.uuid4().hex
+        self.task = task
+        # released once the job is finished, see JobStore.finish()
+        self.data = data
+        self.priority = priority
+        self.ttl = ttl
+        # address of the client which pushed the job
+        self.client = None
+        # set when the job is cancelled while it is printed, it stops at the next chunk
+        self.cancelled = False
+        # wall clock time the job was created at
+        self.timestamp = time.time()
+        # monotonic time, used for latency metrics
+        self.enqueued = time.monotonic()
+        self.deadline = self.enqueued + ttl if ttl is not None else float('inf')
+        # order of arrival, set by the queue
+        self.seq = None
+        self.state = STATE_QUEUED
+        # seconds spent in each state, and monotonic time the current one was entered at
+        self.timings = {}
+        self.state_since = self.enqueued
+        # number of times the same request was submitted again, see DedupIndex
+        self.duplicates = 0
+        # size of the data in bytes, counted by the queue
+        self.size = 0
+        # output rendered ahead of time, see RenderPipeline
+        self.output = None
+
+    def expired(self, now=None):
+        return (now if now is not None else time.monotonic()) > self.deadline
+
+    def set_state(self, state, at=None):
+        """ :param at: monotonic time the job entered the state, now by default """
+        at = at if at is not None else time.monotonic()
+        at = max(at, self.state_since)
+        self.timings[self.state] = self.timings.get(self.state, 0.0) + at - self.state_since
+        self.state = state
+        self.state_since = at
+
+    def get_status(self):
+        """ :return: state of the job and milliseconds spent in each state it went through """
+        timings = dict(self.timings)
+        if self.state not in FINAL_STATES:
+            timings[self.state] = timings.get(self.state, 0.0) + time.monotonic() - self.state_since
+        return {
+            'id': self.id,
+            'task': self.task,
+            'client': self.client,
+            'state': self.state,
+            'duplicates': self.duplicates,
+            'created': self.timestamp,
+            'timings': dict((state, round(seconds * 1000, 3)) for state, seconds in timings.items()),
+        }
+
+    def sort_key(self):
+        return self.priority, self.deadline, self.seq
+
+    def __lt__(self, other):
+        return self.sort_key() < other.sort_key()
+
+    def __repr__(self):
+        return '<Job %s>' % self.task
+
+
+class JobQueue(object):
+    """ Priority queue of jobs a driver thread can block on until work arrives
+
+    Jobs are served by priority class, then by deadline, then in order of arrival, so urgent tasks
+    (opening the cashbox...) go before the receipts waiting in the queue. Expired jobs are dropped
+    when they reach the head of the queue, and by sweep() wherever they are: the jobs which expire
+    are also indexed by deadline, so a sweep only looks at the jobs actually expired.
+
+    Jobs are removed from the middle of the queue by dropping them from the index of the queued jobs,
+    their entry in the heap is skipped when it reaches the head. The queued jobs are also indexed by
+    task and by client, so that removing all the jobs of one only looks at those.
+    """
+
+    def __init__(self, on_expire=None):
+        """
+        :param on_expire: function called with the expired jobs which are dropped, out of the lock of the queue
+        """
+        self.jobs = []
+        # queued jobs by id, the jobs of the heap which are not indexed were removed
+        self.index = {}
+        # queued jobs by id, by task and by client
+        self.tasks = {}
+        self.clients = {}
+        # (deadline, seq, job id) of the queued jobs which expire, entries of jobs no longer queued included
+        self.expiries = []
+        self.condition = Condition()
+        self.counter = itertools.count()
+        self.on_expire = on_expire
+        # expired jobs dropped under the lock, on_expire is called once it is released
+        self.expired = []
+        # number of expired jobs dropped, in total and by task
+        self.dropped = 0
+        self.dropped_tasks = {}
+        # total size of the queued jobs
+        self.bytes = 0
+        # monotonic times the last jobs were taken, see drain_rate()
+        self.taken = deque(maxlen=64)
+
+    def put(self, job):
+        with self.condition:
+            job.seq = next(self.counter)
+            self._push(job)
+            self.condition.notify()
+
+    def requeue(self, job):
+        """ put back a job which could not be printed, it keeps its original place """
+        with self.condition:
+            self._push(job)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """ wait for a job
+        :param timeout: seconds to wait, None waits forever
+        :return: Job object or None when the timeout elapsed
+        """
+        job = None
+        with self.condition:
+            if self._head() is None:
+                self.condition.wait(timeout)
+            if self._head() is not None:
+                job = self._take()
+        self._notify_expired()
+        return job
+
+    def peek(self):
+        """ :return: the first job, left in the queue, None when the queue is empty """
+        with self.condition:
+            job = self._head()
+        self._notify_expired()
+        return job
+
+    def get_task(self, tasks):
+        """ take the first job of one of tasks wherever it is in the queue, without waiting
+        :return: Job object or None when no such job is queued
+        """
+        now = time.monotonic()
+        with self.condition:
+            jobs = [job for task in tasks for job in self.tasks.get(task, {}).values() if not job.expired(now)]
+            if not jobs:
+                return None
+            job = min(jobs)
+            self._remove(job)
+            self.taken.append(now)
+            return job
+
+    def interrupt(self):
+        """ wake up the threads waiting in get(), which return None """
+        with self.condition:
+            self.condition.notify_all()
+
+    def get_while(self, match, limit):
+        """ take the jobs at the head of the queue as long as match(job) is true, without waiting
+        :return: list of at most limit jobs
+        """
+        jobs = []
+        with self.condition:
+            while len(jobs) < limit and self._head() is not None and match(self._head()):
+                jobs.append(self._take())
+        self._notify_expired()
+        return jobs
+
+    def sweep(self):
+        """ drop the expired jobs wherever they are in the queue
+        :return: number of jobs dropped
+        """
+        now = time.monotonic()
+        dropped = 0
+        with self.condition:
+            while self.expiries and self.expiries[0][0] < now:
+                deadline, seq, job_id = heapq.heappop(self.expiries)
+                job = self.index.get(job_id)
+                if job is not None:
+                    self._remove(job)
+                    self._expire(job)
+                    dropped += 1
+            if len(self.jobs) > 2 * len(self.index) + 16:
+                # release the removed jobs instead of waiting for them to reach the head
+                self.jobs = [job for job in self.jobs if self.index.get(job.id) is job]
+                heapq.heapify(self.jobs)
+            if len(self.expiries) > 2 * len(self.index) + 16:
+                self.expiries = [expiry for expiry in self.expiries if expiry[2] in self.index]
+                heapq.heapify(self.expiries)
+        self._notify_expired()
+        return dropped
+
+    def remove(self, job):
+        """ :return: whether the job was queued and is removed """
+        with self.condition:
+            if self.index.get(job.id) is not job:
+                return False
+            self._remove(job)
+            return True
+
+    def remove_all(self, task=None, client=None):
+        """ remove the queued jobs of a task and/or of a client
+        :return: list of the jobs removed
+        """
+        with self.condition:
+            if client is not None:
+                jobs = [job for job in self.clients.get(client, {}).values() if task is None or job.task == task]
+            else:
+                jobs = list(self.tasks.get(task, {}).values())
+            for job in jobs:
+                self._remove(job)
+        return jobs
+
+    def expire(self, job):
+        """ drop a job taken from the queue which expired before it could be printed """
+        with self.condition:
+            self._expire(job)
+        self._notify_expired()
+
+    def drain_rate(self, window=60):
+        """ :return: jobs taken per second lately, None when no job was taken in the last window seconds """
+        with self.condition:
+            if len(self.taken) < 2 or time.monotonic() - self.taken[-1] > window:
+                return None
+            return (len(self.taken) - 1) / max(self.taken[-1] - self.taken[0], 0.001)
+
+    def next_expiry(self):
+        """ :return: monotonic time at which the next sweep has jobs to drop, None when no job expires """
+        with self.condition:
+            return self.expiries[0][0] if self.expiries else None
+
+    def _push(self, job):
+        heapq.heappush(self.jobs, job)
+        self.index[job.id] = job
+        self.tasks.setdefault(job.task, {})[job.id] = job
+        if job.client is not None:
+            self.clients.setdefault(job.client, {})[job.id] = job
+        self.bytes += job.size
+        if job.deadline != float('inf'):
+            heapq.heappush(self.expiries, (job.deadline, job.seq, job.id))
+
+    def _take(self):
+        job = heapq.heappop(self.jobs)
+        self._remove(job)
+        self.taken.append(time.monotonic())
+        return job
+
+    def _remove(self, job):
+        del self.index[job.id]
+        self._unindex(self.tasks, job.task, job)
+        if job.client is not None:
+            self._unindex(self.clients, job.client, job)
+        self.bytes -= job.size
+
+    @staticmethod
+    def _unindex(index, key, job):
+        jobs = index[key]
+        del jobs[job.id]
+        if not jobs:
+            del index[key]
+
+    def _head(self):
+        """ drop the removed and expired jobs at the head of the queue
+        :return: the first job, None when the queue is empty
+        """
+        now = time.monotonic()
+        while self.jobs:
+            job = self.jobs[0]
+            if self.index.get(job.id) is not job:
+                heapq.heappop(self.jobs)
+            elif job.expired(now):
+                heapq.heappop(self.jobs)
+                self._remove(job)
+                self._expire(job)
+            else:
+                return job
+        return None
+
+    def _expire(self, job):
+        job.set_state(STATE_EXPIRED)
+        self.dropped += 1
+        self.dropped_tasks[job.task] = self.dropped_tasks.get(job.task, 0) + 1
+        if self.on_expire:
+            self.expired.append(job)
+
+    def _notify_expired(self):
+        """ call on_expire for the jobs expired under the lock, which may take other locks (journal...) """
+        if not self.expired:
+            return
+        with self.condition:
+            jobs, self.expired = self.expired, []
+        for job in jobs:
+            self.on_expire(job)
+
+    def __len__(self):
+        return len(self.index)
+
+
+class DedupIndex(object):
+    """ Jobs recently submitted with an idempotency key
+
+    A request sent again (the POS retries when it times out) gets the job of the first submission
+    instead of a new one. Entries are forgotten after `window` seconds, and the oldest ones go first
+    when there are more than `max_size`.
+    """
+
+    def __init__(self, window=300, max_size=1000):
+        self.window = window
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def setdefault(self, key, job):
+        """ :return: the job submitted with this key, or job which is indexed if there is none """
+        with self.lock:
+            self._expire()
+            known = self.entries.get(key)
+            # a job which could not be printed or was cancelled can be submitted again
+            if known is not None and known.state not in (STATE_FAILED, STATE_EXPIRED, STATE_CANCELLED):
+                known.duplicates += 1
+                return known
+
+            self.entries.pop(key, None)
+            self.entries[key] = job
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            return job
+
+    def _expire(self):
+        limit = time.monotonic() - self.window
+        while self.entries:
+            key, job = next(iter(self.entries.items()))
+            if job.enqueued >= limit:
+                break
+            del self.entries[key]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class JobHistory(object):
+    """ Jobs recently pushed on a driver, by id, so that clients can follow them
+
+    Unfinished jobs are always kept: the queue bounds their number. Finished ones, whose data the
+    driver releases (see JobStore.finish), are forgotten
+    `window` seconds after they finished, and the oldest ones go first when there are more than
+    `max_size`.
+    """
+
+    def __init__(self, window=3600, max_size=1000):
+        self.window = window
+        self.max_size = max_size
+        self.active = {}
+        # (monotonic time it finished, job) of the finished jobs, by id
+        self.finished = OrderedDict()
+        self.lock = Lock()
+
+    def add(self, job):
+        with self.lock:
+            self.active[job.id] = job
+
+    def finish(self, job):
+        with self.lock:
+            if self.active.pop(job.id, None) is None:
+                return
+            self.finished[job.id] = (time.monotonic(), job)
+            self._expire()
+
+    def get(self, job_id):
+        """ :return: the Job with this id, None when it is unknown or forgotten """
+        with self.lock:
+            self._expire()
+            job = self.active.get(job_id)
+            if job is None and job_id in self.finished:
+                job = self.finished[job_id][1]
+            return job
+
+    def _expire(self):
+        limit = time.monotonic() - self.window
+        while self.finished:
+            finished, job = next(iter(self.finished.values()))
+            if finished >= limit and len(self.finished) <= self.max_size:
+                break
+            self.finished.popitem(last=False)
+
+    def __len__(self):
+        return len(self.active) + len(self.finished)
@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import logging
+from collections import OrderedDict
+from threading import Thread, Condition
+
+from .jobs import Job
+
+_logger = logging.getLogger(__name__)
+
+
+class JournalError(IOError):
+    """ A job could not be written to the journal """
+
+
+class Commit(object):
+    """ Records written together by the journal writer, see Journal._run() """
+
+    def __init__(self):
+        # (line, whether it is retried when the write fails)
+        self.lines = []
+        self.done = False
+        self.error = None
+
+
+class Journal(object):
+    """ Append-only log of the jobs queued on a driver
+
+    A job is written when it is queued and marked done once it is printed, failed or expired, so the
+    jobs still pending after a crash or a restart are replayed at startup. Records are written by a
+    background thread which commits everything appended since its last write with a single fsync
+    (group commit): add() waits for its record to be on disk, but a burst of jobs shares the fsyncs.
+    Once the log holds many more records than pending jobs, it is rewritten with the pending ones only.
+
+    When a write fails the file is truncated back to its last complete record: add() raises JournalError
+    for the jobs of that commit, and the 'done' records are written again with the next one.
+    """
+
+    def __init__(self, path, commit_delay=0, compact_size=1000):
+        """
+        :param path: file of the journal
+        :param commit_delay: seconds the writer waits for more records before a commit
+        :param compact_size: number of records above which the log is compacted
+        """
+        self.path = path
+        self.commit_delay = commit_delay
+        self.compact_size = compact_size
+        self.condition = Condition()
+        # records waiting for the writer
+        self.pending = Commit()
+        # 'add' record of the unfinished jobs, by job id
+        self.live = OrderedDict()
+        # records in the file
+        self.records = 0
+        self.commits = 0
+        self.file = None
+        self.thread = None
+
+    def replay(self):
+        """ read the log left by the previous run, must be called before open()
+        :return: records of the unfinished jobs, in the order they were queued
+        """
+        live = OrderedDict()
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        # the last record was not completely written
+                        _logger.warning('Skipping a damaged record of the journal %s' % self.path)
+                        continue
+                    if record['op'] == 'add':
+                        live.setdefault(record['id'], record)
+                    else:
+                        live.pop(record['id'], None)
+
+        self.live = OrderedDict((job_id, self._encode(record)) for job_id, record in live.items())
+        self._rewrite()
+        return list(live.values())
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.file = open(self.path, 'ab')
+        self.thread = Thread(target=self._run, name='journal')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add(self, job, key=None):
+        """ write a queued job, returns once it is on disk
+        :raises JournalError: when it could not be written
+        """
+        line = self._encode({
+            'op': 'add',
+            'id': job.id,
+            'task': job.task,
+            'data': job.data,
+            'priority': job.priority,
+            'timestamp': job.timestamp,
+            'ttl': job.ttl,
+            'client': job.client,
+            'key': key,
+        })
+        with self.condition:
+            self.live[job.id] = line
+        try:
+            self._append(line, wait=True)
+        except JournalError:
+            with self.condition:
+                self.live.pop(job.id, None)
+            raise
+
+    def done(self, job_id):
+        """ mark a job finished, it will not be replayed """
+        with self.condition:
+            if self.live.pop(job_id, None) is None:
+                return
+        self._append(self._encode({'op': 'done', 'id': job_id}), wait=False)
+
+    def stats(self):
+        with self.condition:
+            return {'pending_jobs': len(self.live), 'records': self.records, 'commits': self.commits}
+
+    @staticmethod
+    def restore(record):
+        """ :return: the Job of a replayed record, None when it expired meanwhile """
+        ttl = record['ttl']
+        if ttl is not None:
+            ttl -= time.time() - record['timestamp']
+            if ttl <= 0:
+                return None
+        job = Job(record['task'], record['data'], record['priority'], ttl)
+        job.id = record['id']
+        job.timestamp = record['timestamp']
+        job.ttl = record['ttl']
+        job.client = record.get('client')
+        return job
+
+    @staticmethod
+    def _encode(record):
+        return json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+
+    def _append(self, line, wait):
+        with self.condition:
+            commit = self.pending
+            # the records which nobody waits for are written again when the write fails
+            commit.lines.append((line, not wait))
+            self.condition.notify_all()
+            while wait and not commit.done:
+                self.condition.wait()
+            if wait and commit.error is not None:
+                raise JournalError('Can not write the journal %s: %s' % (self.path, str(commit.error)))
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending.lines:
+                    self.condition.wait()
+            if self.commit_delay:
+                # let the jobs pushed at the same time join this commit
+                time.sleep(self.commit_delay)
+
+            with self.condition:
+                commit, self.pending = self.pending, Commit()
+            size = None
+            try:
+                size = os.fstat(self.file.fileno()).st_size
+                self.file.write(b''.join(line for line, retry in commit.lines))
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            except (IOError, OSError) as e:
+                _logger.error('Can not write the journal %s: %s' % (self.path, str(e)))
+                commit.error = e
+                self._truncate(size)
+
+            with self.condition:
+                if commit.error is None:
+                    self.records += len(commit.lines)
+                else:
+                    self.pending.lines[:0] = [(line, True) for line, retry in commit.lines if retry]
+                commit.done = True
+                self.commits += 1
+                self.condition.notify_all()
+                if self.records > self.compact_size and self.records > 2 * len(self.live):
+                    self._compact()
+            if commit.error is not None:
+                # do not spin while the disk is full
+                time.sleep(1)
+
+    def _truncate(self, size):
+        """ drop what a failed write left after the last complete record """
+        try:
+            # the buffered data is dropped as well
+            self.file.close()
+        except (IOError, OSError):
+            pass
+        try:
+            if size is not None:
+                os.truncate(self.path, size)
+        except (IOError, OSError) as e:
+            _logger.error('Can not truncate the journal %s: %s' % (self.path, str(e)))
+        self.file = open(self.path, 'ab')
+
+    def _compact(self):
+        self.file.close()
+        self._rewrite()
+        self.file = open(self.path, 'ab')
+
+    def _rewrite(self):
+        """ replace the log by the records of the unfinished jobs """
+        tmp = self.path + '.tmp'
+        try:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(tmp, 'wb') as f:
+                f.write(b''.join(self.live.values()))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self.records = len(self.live)
+        except (IOError, OSError) as e:
+            _logger.error('Can not compact the journal %s: %s' % (self.path, str(e)))
@@ -0,0 +1,170 @@
+import time
+import logging
+import traceback
+from collections import deque
+from threading import Thread, Condition
+
+from .jobs import STATE_QUEUED
+
+_logger = logging.getLogger(__name__)
+
+
+class RenderPipeline(object):
+    """ Render stage of a driver, running ahead of the transmission of the jobs to the printer
+
+    A thread takes the jobs from the queue and renders them while the driver thread sends the previous
+    ones to the device, so the printer does not wait for a job to be rendered once the previous one is
+    sent. At most `lookahead` jobs are rendered in advance. When a job with a higher priority is pushed
+    meanwhile (opening the cashbox...), the rendered jobs go back in the queue and it is sent first. They
+    also go back when the driver can not print (device gone, jobs held), where they expire and are
+    cancelled as usual, and nothing more is rendered until the driver asks for a job again.
+    """
+
+    def __init__(self, queue, render, running, lookahead=2):
+        """
+        :param queue: JobQueue the jobs are taken from
+        :param render: function(job) returning the output of a job, called from the render thread
+        :param running: jobs taken from the queue by id, the jobs rendered ahead are added to it
+        :param lookahead: number of jobs rendered ahead of the one being sent
+        """
+        self.queue = queue
+        self.render = render
+        self.running = running
+        self.lookahead = lookahead
+        self.condition = Condition()
+        # (job, monotonic times its rendering started and ended) of the jobs rendered ahead, in order
+        self.rendered = deque()
+        # incremented when the rendered jobs are put back in the queue, a job rendered meanwhile follows them
+        self.epoch = 0
+        self.paused = True
+        self.thread = None
+        # monotonic time the driver thread started waiting for the next job
+        self.ready = None
+        self.jobs = 0
+        self.render_time = 0.0
+        # part of render_time the driver thread spent waiting for the rendering
+        self.render_exposed = 0.0
+        self.transmits = 0
+        self.transmit_time = 0.0
+
+    def start(self):
+        with self.condition:
+            if self.thread is not None:
+                return
+            self.thread = Thread(target=self._run, name='render')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def get(self, timeout=None):
+        """ wait for a rendered job, and let the render stage run
+        :return: Job with its output, or without for a job more urgent than the rendered ones, None when
+                 the timeout elapsed or on interrupt()
+        """
+        with self.condition:
+            if self.paused:
+                self.paused = False
+                self.condition.notify_all()
+            if self.ready is None:
+                self.ready = time.monotonic()
+            if not self.rendered:
+                self.condition.wait(timeout)
+            first = self.rendered[0][0] if self.rendered else None
+
+        head = self.queue.peek() if first is not None else None
+        if head is not None and head.priority < first.priority:
+            # the driver thread renders it, the next get() resumes the render stage
+            self.drain()
+            return self.queue.get(0)
+
+        job = None
+        expired = []
+        with self.condition:
+            while self.rendered:
+                job, started, ended = self.rendered.popleft()
+                self.condition.notify_all()
+                if job.expired():
+                    job.output = None
+                    self.running.pop(job.id, None)
+                    expired.append(job)
+                    job = None
+                    continue
+                self.jobs += 1
+                self.render_time += ended - started
+                self.render_exposed += max(0.0, ended - max(started, self.ready))
+                self.ready = None
+                break
+        # out of the lock, the driver finishes the expired jobs
+        for expired_job in expired:
+            self.queue.expire(expired_job)
+        return job
+
+    def interrupt(self):
+        """ wake up the driver thread waiting in get(), which returns None """
+        with self.condition:
+            self.condition.notify_all()
+
+    def drain(self):
+        """ stop rendering and put the jobs rendered ahead back in the queue, until the next get()
+        :return: number of jobs put back
+        """
+        with self.condition:
+            self.paused = True
+            self.epoch += 1
+            self.ready = None
+            jobs = [job for job, started, ended in self.rendered]
+            self.rendered.clear()
+            for job in jobs:
+                self._requeue(job)
+        return len(jobs)
+
+    def record_transmit(self, elapsed):
+        """ :param elapsed: seconds the driver thread spent sending a rendered job """
+        with self.condition:
+            self.transmits += 1
+            self.transmit_time += elapsed
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                'lookahead': self.lookahead,
+                'rendered': len(self.rendered),
+                'jobs': self.jobs,
+                'render_avg': round(self.render_time / self.jobs * 1000, 3) if self.jobs else 0.0,
+                'transmit_avg': round(self.transmit_time / self.transmits * 1000, 3) if self.transmits else 0.0,
+                # percentage of the rendering done while the printer was busy with the previous jobs
+                'render_hidden': round(100 * (1 - self.render_exposed / self.render_time), 1) if self.render_time else 0.0,
+            }
+
+    def _requeue(self, job):
+        job.output = None
+        self.running.pop(job.id, None)
+        job.set_state(STATE_QUEUED)
+        self.queue.requeue(job)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.paused or len(self.rendered) >= self.lookahead:
+                    self.condition.wait()
+                epoch = self.epoch
+            job = self.queue.get()
+            if job is None:
+                continue
+
+            self.running[job.id] = job
+            started = time.monotonic()
+            try:
+                job.output = self.render(job)
+            except Exception as e:
+                # the driver thread renders it again
+                _logger.error('Can not render %s ahead: %s\n%s' % (job.task, str(e), traceback.format_exc()))
+                job.output = None
+            ended = time.monotonic()
+
+            with self.condition:
+                if epoch != self.epoch or self.paused:
+                    # the driver stopped printing meanwhile
+                    self._requeue(job)
+                    continue
+                self.rendered.append((job, started, ended))
+                self.condition.notify_all()
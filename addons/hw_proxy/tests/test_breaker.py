@@ -0,0 +1,58 @@
+import unittest
+
+from addons.hw_proxy.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_open_half_open_close(self):
+        breaker = CircuitBreaker(base_delay=1.0, max_delay=30.0, jitter=0)
+        self.assertTrue(breaker.allow(100.0))
+
+        self.assertEqual(breaker.failure(100.0), 101.0)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow(100.5))
+
+        # one attempt once the delay elapsed, it fails again: twice the delay
+        self.assertTrue(breaker.allow(101.0))
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertEqual(breaker.failure(101.0), 103.0)
+        self.assertFalse(breaker.allow(102.0))
+
+        self.assertTrue(breaker.allow(103.0))
+        breaker.success()
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertTrue(breaker.allow(103.0))
+        stats = breaker.stats()
+        self.assertEqual((stats['attempts'], stats['failures'], stats['consecutive_failures'], stats['opened']),
+                         (3, 2, 0, 1))
+
+        # the delays start over after a success
+        self.assertEqual(breaker.failure(200.0), 201.0)
+        self.assertEqual(breaker.stats()['opened'], 2)
+
+    def test_max_delay(self):
+        breaker = CircuitBreaker(base_delay=1.0, max_delay=30.0, jitter=0)
+        delays = [breaker.failure(0.0) for i in range(8)]
+        self.assertEqual(delays, [1.0, 2.0, 4.0, 8.0, 16.0, 30.0, 30.0, 30.0])
+        self.assertEqual(breaker.stats()['opened'], 1)
+
+    def test_jitter(self):
+        breaker = CircuitBreaker(base_delay=10.0, max_delay=30.0, jitter=0.2)
+        for i in range(20):
+            breaker.consecutive_failures = 0
+            self.assertTrue(8.0 <= breaker.failure(0.0) <= 12.0)
+
+    def test_retry_now(self):
+        breaker = CircuitBreaker()
+        breaker.failure()
+        self.assertFalse(breaker.allow())
+        self.assertGreater(breaker.stats()['retry_in'], 0)
+        breaker.retry_now()
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.stats()['retry_in'], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+import time
+import shutil
+import tempfile
+import unittest
+from threading import Thread
+from types import SimpleNamespace
+from unittest import mock
+
+from devices import Printer
+from state import StateManager
+from addons.hw_escpos.controllers.main import EscposDriver
+from addons.hw_zpl.controllers.main import ZPLDriver
+from addons.hw_proxy.jobs import QueueFull, PRIORITY_HIGH, STATE_QUEUED, STATE_DONE, STATE_FAILED, STATE_CANCELLED
+from addons.hw_proxy.journal import Journal
+
+
+class State(object):
+    """ settings of the drivers, instead of the config.ini read by StateManager """
+
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.driver = SimpleNamespace(dedup_window=300, dedup_size=1000, max_jobs=1000, max_queue_size=65536,
+                                      history_window=3600, history_size=1000)
+        self.journal = SimpleNamespace(enabled=1, commit_delay=0, compact_size=1000)
+        self.printer = Printer(1208, 514, 'Test printer')
+
+    def get_printer(self, type, name=None):
+        return self.printer
+
+
+class Device(object):
+    """ opened ESC/POS printer, it only records the pulses sent to the cash drawer """
+    first_write = None
+
+    def __init__(self):
+        self.pulses = []
+
+    def begin(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def cashdraw(self, pin):
+        self.pulses.append(pin)
+
+
+class LabelDevice(Device):
+    """ opened ZPL printer, it records the transfers """
+
+    def __init__(self):
+        Device.__init__(self)
+        self.sent = []
+
+    def send_job(self, zpl):
+        self.sent.append(zpl)
+
+
+def open_driver(driver_class=EscposDriver, device_class=Device):
+    """ :return: driver printing on a device_class, with its journal replayed """
+    driver = driver_class()
+    driver.device = device_class()
+    driver.pool.factory = lambda vendor_id, product_id, **kwargs: driver.device
+    driver.store.open_journal()
+    return driver
+
+
+class DriverTestCase(unittest.TestCase):
+    """ the drivers read the settings of a State, their journal is in a temporary directory """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.state = State(self.directory)
+        patcher = mock.patch.object(StateManager, 'getInstance', return_value=self.state)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+class TestPrinterDriver(DriverTestCase):
+
+    def test_replayed_job_runs(self):
+        driver = open_driver()
+        job = driver.store.push('cashbox')
+
+        # restarted before the job was run
+        driver = open_driver()
+        replayed = driver.queue.get(0)
+        self.assertEqual((replayed.id, replayed.task, replayed.priority), (job.id, 'cashbox', PRIORITY_HIGH))
+        self.assertTrue(driver.dispatch(replayed))
+        self.assertEqual(replayed.state, STATE_DONE)
+        self.assertEqual(driver.device.pulses, [2, 5])
+
+        # once run, it is not replayed again
+        journal = driver.store.journal
+        for _ in range(100):
+            if journal.stats()['records'] == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(Journal(journal.path).replay(), [])
+
+
+    def test_duplicate(self):
+        driver = open_driver()
+        job = driver.store.push('xml_receipt', '<receipt/>', key='key')
+        self.assertIs(driver.store.push('xml_receipt', '<receipt/>', key='key'), job)
+        self.assertEqual((len(driver.queue), job.duplicates), (1, 1))
+
+    def test_resubmit_cancelled(self):
+        driver = open_driver()
+        job = driver.store.push('xml_receipt', '<receipt/>', key='key')
+        self.assertEqual(driver.cancel(job.id), [job])
+        self.assertEqual((job.state, len(driver.queue)), (STATE_CANCELLED, 0))
+
+        # submitted again with the same key, it is printed
+        resubmitted = driver.store.push('xml_receipt', '<receipt/>', key='key')
+        self.assertIsNot(resubmitted, job)
+        self.assertEqual((resubmitted.state, len(driver.queue)), (STATE_QUEUED, 1))
+        self.assertIs(driver.history.get(resubmitted.id), resubmitted)
+
+
+    def test_queue_full(self):
+        self.state.driver.max_jobs = 2
+        driver = open_driver()
+        for i in range(2):
+            driver.store.push('xml_receipt', '<receipt>%d</receipt>' % i)
+        with self.assertRaises(QueueFull) as raised:
+            driver.store.push('xml_receipt', '<receipt/>', key='key')
+        # nothing printed lately, the client waits for the printer to be tried again
+        self.assertEqual(raised.exception.retry_after, 30)
+        self.assertEqual(len(driver.queue), 2)
+
+        # printing a job every 10 seconds, the next one fits in 10 seconds
+        now = time.monotonic()
+        driver.queue.taken.extend([now - 10, now])
+        with self.assertRaises(QueueFull) as raised:
+            driver.store.push('xml_receipt', '<receipt/>', key='key')
+        self.assertEqual(raised.exception.retry_after, 10)
+
+        # the cash drawer still opens
+        self.assertEqual(driver.store.push('cashbox').state, STATE_QUEUED)
+        # submitted again once the queue has room
+        self.assertEqual(driver.queue.get(0).task, 'cashbox')
+        driver.queue.get(0)
+        self.assertEqual(driver.store.push('xml_receipt', '<receipt/>', key='key').state, STATE_QUEUED)
+
+    def test_queue_size(self):
+        self.state.driver.max_queue_size = 64
+        driver = open_driver()
+        with self.assertRaises(ValueError):
+            driver.store.push('xml_receipt', 'x' * 65 * 1024)
+        driver.store.push('xml_receipt', 'x' * 40 * 1024)
+        with self.assertRaises(QueueFull) as raised:
+            driver.store.push('xml_receipt', 'x' * 40 * 1024)
+        self.assertGreaterEqual(raised.exception.retry_after, driver.store.min_retry_after)
+        self.assertLessEqual(raised.exception.retry_after, driver.store.max_retry_after)
+
+    def test_concurrent_pushes(self):
+        self.state.driver.max_jobs = 5
+        driver = open_driver()
+        journal_add = driver.store.journal.add
+
+        def add(job, key=None):
+            # the jobs wait for the disk together
+            time.sleep(0.05)
+            journal_add(job, key)
+
+        driver.store.journal.add = add
+        jobs = []
+
+        def push(i):
+            try:
+                jobs.append(driver.store.push('xml_receipt', '<receipt>%d</receipt>' % i))
+            except QueueFull:
+                pass
+
+        threads = [Thread(target=push, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((len(jobs), len(driver.queue)), (5, 5))
+        self.assertEqual((driver.store.reserved_jobs, driver.store.reserved_bytes), (0, 0))
+
+
+
+class TestZPLDriver(DriverTestCase):
+
+    def test_batch(self):
+        driver = open_driver(ZPLDriver, LabelDevice)
+        labels = [driver.store.push('label', '^XA^FD%d^FS^XZ' % i) for i in range(3)]
+        xml_label = driver.store.push('xml_label', '<label height="10"><text>xml</text></label>')
+        status = driver.store.push('printstatus')
+        # the printer status comes first, alone
+        self.assertIs(driver.queue.get(0), status)
+        self.assertTrue(driver.dispatch(status))
+        self.assertEqual(len(driver.device.sent), 1)
+
+        self.assertTrue(driver.dispatch(driver.queue.get(0)))
+        self.assertEqual(len(driver.device.sent), 2)
+        self.assertEqual(driver.device.sent[1].count('^XA'), 4)
+        self.assertTrue(driver.device.sent[1].startswith('^XA^FD0^FS^XZ^XA^FD1^FS^XZ^XA^FD2^FS^XZ'))
+        self.assertEqual([job.state for job in labels + [xml_label]], [STATE_DONE] * 4)
+        self.assertEqual((driver.metrics['label_batches'], driver.metrics['batch_size_last']), (1, 4))
+        self.assertEqual(len(driver.queue), 0)
+
+    def test_batch_limit(self):
+        driver = open_driver(ZPLDriver, LabelDevice)
+        driver.max_batch = 2
+        for i in range(3):
+            driver.store.push('label', '^XA^FD%d^FS^XZ' % i)
+        self.assertTrue(driver.dispatch(driver.queue.get(0)))
+        self.assertEqual((driver.device.sent, len(driver.queue)), (['^XA^FD0^FS^XZ^XA^FD1^FS^XZ'], 1))
+
+    def test_bad_label(self):
+        driver = open_driver(ZPLDriver, LabelDevice)
+        jobs = [driver.store.push('label', '^XA^FD0^FS^XZ'),
+                driver.store.push('label', {'height': 10, 'fields': [{'type': 'circle'}]}),
+                driver.store.push('label', '^XA^FD2^FS^XZ')]
+        self.assertTrue(driver.dispatch(driver.queue.get(0)))
+        # the other labels of the batch are printed
+        self.assertEqual(driver.device.sent, ['^XA^FD0^FS^XZ^XA^FD2^FS^XZ'])
+        self.assertEqual([job.state for job in jobs], [STATE_DONE, STATE_FAILED, STATE_DONE])
+
+
+if __name__ == '__main__':
+    unittest.main()
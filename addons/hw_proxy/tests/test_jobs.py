@@ -0,0 +1,110 @@
+import time
+import unittest
+from threading import Thread
+
+from addons.hw_proxy.jobs import (Job, JobQueue, DedupIndex, PRIORITY_HIGH, STATE_DONE, STATE_EXPIRED,
+                                  STATE_CANCELLED)
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def test_on_expire_out_of_lock(self):
+        calls = []
+
+        def on_expire(job):
+            # another thread can lock the queue meanwhile, the callback can wait for it
+            locked = []
+
+            def lock():
+                locked.append(queue.condition.acquire(timeout=1))
+                if locked[0]:
+                    queue.condition.release()
+
+            thread = Thread(target=lock)
+            thread.start()
+            thread.join()
+            calls.append((job, locked[0]))
+
+        queue = JobQueue(on_expire=on_expire)
+        expired = [Job('xml_receipt', str(i), ttl=0.01) for i in range(3)]
+        job = Job('cashbox')
+        for queued in expired[:2] + [job]:
+            queue.put(queued)
+        time.sleep(0.02)
+
+        self.assertIs(queue.get(0), job)
+        queue.put(expired[2])
+        time.sleep(0.02)
+        self.assertEqual(queue.sweep(), 1)
+        self.assertEqual(calls, [(queued, True) for queued in expired])
+        self.assertEqual([queued.state for queued in expired], [STATE_EXPIRED] * 3)
+
+    def test_sweep_releases_finished_jobs(self):
+        queue = JobQueue()
+        for i in range(1000):
+            queue.put(Job('xml_receipt', str(i), ttl=3600))
+            self.assertIsNotNone(queue.get(0))
+            queue.sweep()
+        self.assertEqual(len(queue), 0)
+        self.assertLessEqual(len(queue.expiries), 16)
+        self.assertLessEqual(len(queue.jobs), 16)
+
+    def test_get_task(self):
+        queue = JobQueue()
+        status = Job('printstatus', priority=PRIORITY_HIGH)
+        receipt = Job('xml_receipt', '<receipt/>')
+        cashboxes = [Job('cashbox', priority=PRIORITY_HIGH, ttl=12) for i in range(2)]
+        for job in [status, receipt] + cashboxes:
+            queue.put(job)
+        # taken from behind the jobs which are held
+        self.assertEqual([queue.get_task(['cashbox']) for i in range(3)], cashboxes + [None])
+        self.assertEqual([queue.get(0), queue.get(0), queue.get(0)], [status, receipt, None])
+
+
+
+class TestDedupIndex(unittest.TestCase):
+
+    def test_duplicate(self):
+        index = DedupIndex()
+        first = Job('xml_receipt', '<receipt/>')
+        self.assertIs(index.setdefault(('xml_receipt', 'key'), first), first)
+        # sent again, even once printed
+        first.set_state(STATE_DONE)
+        self.assertIs(index.setdefault(('xml_receipt', 'key'), Job('xml_receipt', '<receipt/>')), first)
+        self.assertEqual(first.duplicates, 1)
+        # another task or another key is another job
+        job = Job('cashbox')
+        self.assertIs(index.setdefault(('cashbox', 'key'), job), job)
+
+    def test_window(self):
+        index = DedupIndex(window=300)
+        first = Job('xml_receipt', '<receipt/>')
+        index.setdefault(('xml_receipt', 'key'), first)
+        first.enqueued -= 301
+        second = Job('xml_receipt', '<receipt/>')
+        self.assertIs(index.setdefault(('xml_receipt', 'key'), second), second)
+        self.assertEqual(len(index), 1)
+
+    def test_max_size(self):
+        index = DedupIndex(max_size=2)
+        jobs = [Job('xml_receipt', str(i)) for i in range(3)]
+        for i, job in enumerate(jobs):
+            index.setdefault(('xml_receipt', i), job)
+        self.assertEqual(len(index), 2)
+        # the oldest was forgotten
+        job = Job('xml_receipt', '0')
+        self.assertIs(index.setdefault(('xml_receipt', 0), job), job)
+
+    def test_resubmit_cancelled(self):
+        index = DedupIndex()
+        for state in (STATE_CANCELLED, STATE_EXPIRED):
+            first = Job('xml_receipt', '<receipt/>')
+            index.setdefault(('xml_receipt', state), first)
+            first.set_state(state)
+            second = Job('xml_receipt', '<receipt/>')
+            self.assertIs(index.setdefault(('xml_receipt', state), second), second)
+            self.assertEqual(first.duplicates, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
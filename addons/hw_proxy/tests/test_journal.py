@@ -0,0 +1,134 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from threading import Thread
+
+from addons.hw_proxy.jobs import Job, PRIORITY_HIGH
+from addons.hw_proxy.journal import Journal, JournalError
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'journal', 'escpos.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def open(self, **kwargs):
+        journal = Journal(self.path, **kwargs)
+        records = journal.replay()
+        journal.open()
+        return journal, records
+
+    def wait_written(self, journal, records):
+        for _ in range(100):
+            if journal.stats()['records'] == records:
+                return
+            time.sleep(0.01)
+        self.fail('%d records written instead of %d' % (journal.stats()['records'], records))
+
+    def test_replay(self):
+        journal, records = self.open()
+        self.assertEqual(records, [])
+        jobs = [Job('xml_receipt', '<receipt>%d</receipt>' % i, ttl=60) for i in range(3)]
+        jobs[0].client = '10.0.0.2'
+        for job in jobs:
+            journal.add(job, key='key-%s' % job.id)
+        journal.done(jobs[1].id)
+        self.wait_written(journal, 4)
+
+        journal, records = self.open()
+        self.assertEqual([record['id'] for record in records], [jobs[0].id, jobs[2].id])
+        self.assertEqual(records[0]['key'], 'key-%s' % jobs[0].id)
+        job = journal.restore(records[0])
+        self.assertEqual((job.id, job.task, job.data, job.client), (jobs[0].id, 'xml_receipt', jobs[0].data, '10.0.0.2'))
+        # the replayed log only holds the unfinished jobs
+        self.assertEqual(journal.stats(), {'pending_jobs': 2, 'records': 2, 'commits': 0})
+
+    def test_replay_damaged_record(self):
+        journal, records = self.open()
+        job = Job('cashbox', priority=PRIORITY_HIGH, ttl=12)
+        journal.add(job)
+        with open(self.path, 'ab') as f:
+            f.write(b'{"op":"add","id":')
+
+        journal, records = self.open()
+        self.assertEqual([record['id'] for record in records], [job.id])
+        restored = journal.restore(records[0])
+        self.assertEqual((restored.task, restored.priority), ('cashbox', PRIORITY_HIGH))
+
+    def test_restore_expired(self):
+        journal, records = self.open()
+        job = Job('xml_receipt', '<receipt/>', ttl=1)
+        job.timestamp -= 2
+        journal.add(job)
+
+        journal, records = self.open()
+        self.assertEqual(len(records), 1)
+        self.assertIsNone(journal.restore(records[0]))
+
+    def test_group_commit(self):
+        journal, records = self.open(commit_delay=0.05)
+        threads = [Thread(target=journal.add, args=(Job('xml_receipt', str(i)),)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = journal.stats()
+        self.assertEqual(stats['records'], 20)
+        self.assertLess(stats['commits'], 20)
+
+    def test_compaction(self):
+        journal, records = self.open(compact_size=10)
+        jobs = [Job('xml_receipt', str(i)) for i in range(12)]
+        for job in jobs:
+            journal.add(job)
+        for job in jobs[:-1]:
+            journal.done(job.id)
+        for _ in range(100):
+            if journal.stats()['records'] == 1:
+                break
+            time.sleep(0.01)
+        self.assertEqual(journal.stats()['records'], 1)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+        journal, records = self.open()
+        self.assertEqual([record['id'] for record in records], [jobs[-1].id])
+
+    def test_write_failure(self):
+        journal, records = self.open()
+        first = Job('xml_receipt', 'first')
+        journal.add(first)
+        file = journal.file
+
+        class Failing(object):
+            """ writes part of the data, then fails like a full disk """
+
+            def write(self, data):
+                file.write(data[:5])
+                file.flush()
+                raise OSError(28, 'No space left on device')
+
+            def __getattr__(self, name):
+                return getattr(file, name)
+
+        journal.file = Failing()
+        job = Job('xml_receipt', 'lost')
+        with self.assertRaises(JournalError):
+            journal.add(job)
+        self.assertEqual(journal.stats()['pending_jobs'], 1)
+
+        # the partial record was dropped, the next records are readable
+        second = Job('xml_receipt', 'second')
+        journal.add(second)
+        journal, records = self.open()
+        self.assertEqual([record['id'] for record in records], [first.id, second.id])
+
+
+if __name__ == '__main__':
+    unittest.main()
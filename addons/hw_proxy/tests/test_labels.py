@@ -0,0 +1,55 @@
+import unittest
+
+from addons.hw_zpl.zpl.zpl import label_from_spec, label_to_zpl, xml_label_to_zpl
+
+SPEC = {'width': 50, 'height': 30, 'dpmm': 8, 'copies': 2, 'darkness': 15, 'fields': [
+    {'type': 'text', 'x': 2, 'y': 2, 'text': 'Product', 'char_height': 3, 'char_width': 2},
+    {'type': 'barcode', 'x': 2, 'y': 10, 'code': '123456', 'barcode_type': 'C', 'height': 10},
+    {'type': 'box', 'x': 0, 'y': 0, 'width': 50, 'height': 30, 'thickness': 0.2},
+    {'type': 'raw', 'zpl': '^FO10,10^GB100,0,2^FS'},
+]}
+
+ZPL = ('^XA^PW400^LL240~SD15'
+       '^FO16,16^A0N,24,16^FDProduct^FS'
+       '^FO16,80^BCN,80,Y,N,N,N^FD123456^FS'
+       '^FO0,0^GB400,240,1,B,0^FS'
+       '^FO10,10^GB100,0,2^FS'
+       '^PQ2^XZ')
+
+XML = '''<labels>
+    <label width="50" height="30" dpmm="8" copies="2" darkness="15">
+        <text x="2" y="2" char_height="3" char_width="2">Product</text>
+        <barcode x="2" y="10" barcode_type="C" height="10">123456</barcode>
+        <box x="0" y="0" width="50" height="30" thickness="0.2"/>
+        <raw>^FO10,10^GB100,0,2^FS</raw>
+    </label>
+    <label height="30"><text>Other</text></label>
+</labels>'''
+
+
+class TestLabelFromSpec(unittest.TestCase):
+
+    def test_fields(self):
+        # millimeters converted to dots
+        self.assertEqual(label_from_spec(SPEC), ZPL)
+
+    def test_defaults(self):
+        zpl = label_from_spec({'height': 10, 'fields': [{'text': 'Text'}]})
+        self.assertEqual(zpl, '^XA^PW1320^LL120^FO0,0^A0N,36,24^FDText^FS^XZ')
+
+    def test_unknown_field(self):
+        with self.assertRaises(ValueError):
+            label_from_spec({'height': 10, 'fields': [{'type': 'circle'}]})
+
+    def test_xml(self):
+        # the attributes are strings, converted like the numbers of a spec
+        zpl = xml_label_to_zpl(XML)
+        self.assertEqual(zpl, ZPL + label_from_spec({'height': 30, 'fields': [{'text': 'Other'}]}))
+
+    def test_label_to_zpl(self):
+        self.assertEqual(label_to_zpl(' ^XA^XZ\n'), '^XA^XZ')
+        self.assertEqual(label_to_zpl([SPEC, '^XA^XZ']), ZPL + '^XA^XZ')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import time
+import unittest
+
+from addons.hw_proxy.jobs import Job, JobQueue, PRIORITY_HIGH
+from addons.hw_proxy.pipeline import RenderPipeline
+
+
+class TestRenderPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = JobQueue()
+        self.pipeline = RenderPipeline(self.queue, lambda job: 'rendered %s' % job.data, {}, 2)
+        self.pipeline.start()
+
+    def wait_rendered(self, count):
+        for _ in range(100):
+            if len(self.pipeline.rendered) == count:
+                return
+            time.sleep(0.01)
+        self.fail('%d jobs rendered instead of %d' % (len(self.pipeline.rendered), count))
+
+    def test_order(self):
+        jobs = [Job('xml_receipt', i) for i in range(5)]
+        for job in jobs:
+            self.queue.put(job)
+        for job in jobs:
+            taken = self.pipeline.get(1)
+            self.assertIs(taken, job)
+            self.assertEqual(taken.output, 'rendered %d' % job.data)
+
+    def test_urgent_job_first(self):
+        jobs = [Job('xml_receipt', i) for i in range(4)]
+        for job in jobs:
+            self.queue.put(job)
+        self.assertIs(self.pipeline.get(1), jobs[0])
+        self.wait_rendered(2)
+
+        cashbox = Job('cashbox', 'open', PRIORITY_HIGH)
+        self.queue.put(cashbox)
+        taken = self.pipeline.get(1)
+        self.assertIs(taken, cashbox)
+        # rendered by the driver thread
+        self.assertIsNone(taken.output)
+        # the rendered jobs went back in the queue and keep their order
+        self.assertEqual([self.pipeline.get(1) for job in jobs[1:]], jobs[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,25 +1,19 @@
 # -*- coding: utf-8 -*-
 import time
+import math
 import logging
-import traceback
+from collections import deque
 from threading import Lock
-from queue import Queue
-from PyQt5 import QtCore
 import addons.hw_proxy.controllers.main as hw_proxy
+from addons.hw_proxy.driver import PrinterDriver, PrinterPool
+from addons.hw_proxy.jobs import (Job, PRIORITY_HIGH, PRIORITY_NORMAL, STATE_QUEUED, STATE_RENDERING, STATE_SENDING,
+                                  STATE_FAILED, STATE_CANCELLED, FINAL_STATES)
 
-try:
-    import usb.core
-except ImportError:
-    usb = None
-
-from devices import Printer
-from devices.printer.exceptions import (NoDeviceError, NoStatusError,
-                                        TicketNotPrinted, HandleDeviceError)
 from odoo import http
-from odoo.thread import Thread
 from state import StateManager
 
 from ..zpl.printer import Usb
+from ..zpl.zpl import label_to_zpl, xml_label_to_zpl
 
 _logger = logging.getLogger(__name__)
 
@@ -30,122 +24,101 @@ from datetime import datetime
 datetime.strptime('2012-01-01', '%Y-%m-%d')
 
 
-class ZPLDriver(Thread):
-    printer_status_signal = QtCore.pyqtSignal(str, str)
-
-    def __init__(self):
-        Thread.__init__(self)
-        self.queue = Queue()
-        self.lock = Lock()
-        self.status = {'status': 'connecting', 'messages': []}
-        self.current_printer_status = None
-
-    def lockedstart(self):
-        with self.lock:
-            if not self.isAlive():
-                self.daemon = True
-                self.start()
-
-    def get_zpl_printer(self):
-        printer = StateManager.getInstance().printer_zpl
-        # print test request coming out
-        if printer.print_test_request:
-            self.push_task('printstatus')
-            printer.print_test_request = False
-
-        printer_device = None
+LABEL_TASKS = ('label', 'xml_label')
+
+
+class ZPLDriver(PrinterDriver):
+    printer_type = StateManager.ZPL_PRINTER
+    device_class = Usb
+    name = 'zpl'
+    label = 'ZPL'
+    tasks = {
+        'printstatus': (PRIORITY_HIGH, None, True),
+        'label': (PRIORITY_NORMAL, 1 * 60 * 60, True),
+        'xml_label': (PRIORITY_NORMAL, 1 * 60 * 60, True),
+    }
+    # label jobs waiting in the queue are sent together, up to this number of jobs
+    max_batch = 50
+
+    def __init__(self, printer_name=None, printer_pool=None):
+        PrinterDriver.__init__(self, printer_name, printer_pool)
+        self.metrics.update({'labels': 0, 'label_batches': 0, 'batch_size_last': 0, 'labels_per_sec_last': 0.0})
+
+    def dispatch(self, job):
+        if job.task not in LABEL_TASKS:
+            return PrinterDriver.dispatch(self, job)
+
+        limit = self.max_batch
+        if self.printer_pool is not None:
+            # leave their share of the waiting labels to the other printers of the pool
+            printers = max(1, self.printer_pool.connected_members())
+            limit = min(limit, int(math.ceil((len(self.queue) + 1.0) / printers)))
+        jobs = [job] + self.queue.get_while(lambda queued: queued.task in LABEL_TASKS, limit - 1)
+        for queued in jobs[1:]:
+            self.running[queued.id] = queued
+        batch = Job('labels', jobs, job.priority)
+        batch.timestamp, batch.enqueued, batch.deadline = job.timestamp, job.enqueued, job.deadline
         try:
-            printer_device = Usb(printer.vendor_id, printer.product_id)
-            printer.status = Printer.STATUS_CONNECTED
-            return printer_device
-        except usb.core.USBError:
-            printer.status = Printer.STATUS_DISCONNECTED
+            dispatched = PrinterDriver.dispatch(self, batch)
         finally:
-            if printer.status != self.current_printer_status:
-                self.current_printer_status = printer.status
-                if printer_device:
-                    self.set_status(
-                        'connected',
-                        "Connected to %s (in=0x%02x,out=0x%02x)" % (printer.description,
-                                                                    printer_device.in_ep,
-                                                                    printer_device.out_ep)
-                    )
-                else:
-                    self.set_status('disconnected', 'Printer Not Found')
-
-            # update status in GUI
-            self.printer_status_signal.emit(str(StateManager.ZPL_PRINTER), str(printer.status))
-
-        return printer_device
-
-    def get_status(self):
-        return self.status
-
-    def set_status(self, status, message=None):
-        _logger.info(status + ' : ' + (message or 'no message'))
-        if status == self.status['status']:
-            if message != None and (len(self.status['messages']) == 0 or message != self.status['messages'][-1]):
-                self.status['messages'].append(message)
-        else:
-            self.status['status'] = status
-            if message:
-                self.status['messages'] = [message]
-            else:
-                self.status['messages'] = []
-
-        if status == 'error' and message:
-            _logger.error('ZPL Error: ' + message)
-        elif status == 'disconnected' and message:
-            _logger.warning('ZPL Device Disconnected: ' + message)
-
-    def run(self):
-        while True:
-            reprint = False
-            printer = None
-            timestamp, task, data = self.queue.get(True)
+            for queued in jobs[1:]:
+                self.running.pop(queued.id, None)
+        if dispatched:
+            for queued in jobs:
+                if queued.state not in FINAL_STATES:
+                    queued.set_state(batch.state)
+                self.finish(queued)
+            return True
+        # run() requeues the first job, the others go back in front of it
+        for queued in jobs:
+            queued.set_state(STATE_QUEUED)
+        for queued in reversed(jobs[1:]):
+            self.queue.requeue(queued)
+        return False
+
+    def process_job(self, printer, job):
+        if job.task == 'labels':
+            self.print_labels(printer, job.data)
+        elif job.task == 'printstatus':
+            self.print_status(printer)
+
+    def print_labels(self, printer, jobs):
+        """ print label jobs in a single transfer """
+        started = time.monotonic()
+        zpl = []
+        for job in jobs:
+            if job.cancelled:
+                job.set_state(STATE_CANCELLED)
+                continue
+            job.set_state(STATE_RENDERING)
             try:
-                printer = self.get_zpl_printer()
-
-                if printer:
-                    if task == 'status':
-                        # nothing todo
-                        continue
-
-                    # specific done bellow
-                    if task == 'receipt':
-                        if timestamp >= time.time() - 1 * 60 * 60:
-                            self.print_receipt_body(printer, data)
-                            printer.cut()
-                    elif task == 'xml_receipt':
-                        if timestamp >= time.time() - 1 * 60 * 60:
-                            printer.receipt(data)
-                    elif task == 'cashbox':
-                        if timestamp >= time.time() - 12:
-                            self.open_cashbox(printer)
-                    elif task == 'printstatus':
-                        self.print_status(printer)
+                if job.task == 'xml_label':
+                    zpl.append(xml_label_to_zpl(job.data))
                 else:
-                    if task != 'status':
-                        # re-add job if exists
-                        reprint = True
-            except usb.core.USBError:
-                reprint = True
+                    zpl.append(label_to_zpl(job.data))
             except Exception as e:
-                self.set_status('error', str(e))
-                errmsg = str(e) + '\n' + '-' * 60 + '\n' + traceback.format_exc() + '-' * 60 + '\n'
-                _logger.error(errmsg)
-            finally:
-                if reprint:
-                    self.queue.put((timestamp, task, data))
-                if printer:
-                    printer.close()
-                # check status after complete
-                self.push_task('status')
-                time.sleep(0.25)
-
-    def push_task(self, task, data=None):
-        self.lockedstart()
-        self.queue.put((time.time(), task, data))
+                # a bad label does not prevent the rest of the batch from printing
+                job.set_state(STATE_FAILED)
+                self.set_status('error', 'Invalid label: %s' % str(e))
+        if not zpl:
+            return
+
+        zpl = ''.join(zpl)
+        for job in jobs:
+            if job.state == STATE_RENDERING:
+                job.set_state(STATE_SENDING)
+        printer.send_job(zpl)
+        self.record_batch(zpl.count('^XA'), time.monotonic() - started)
+
+    def record_batch(self, labels, elapsed):
+        metrics = self.metrics
+        metrics['labels'] += labels
+        metrics['label_batches'] += 1
+        metrics['batch_size_last'] = labels
+        metrics['labels_per_sec_last'] = round(labels / elapsed, 1) if elapsed > 0 else 0.0
+        if self.printer_pool is not None:
+            self.printer_pool.record_labels(labels)
+        _logger.debug('%s: %d labels sent at %.1f labels/s' % (self.label, labels, metrics['labels_per_sec_last']))
 
     def print_status(self, eprint):
         eprint.send_job('''^XA
@@ -156,19 +129,45 @@ class ZPLDriver(Thread):
         pass
 
 
-driver = ZPLDriver()
-driver.push_task('status')
-hw_proxy.drivers['zpl'] = driver
+class ZPLPool(PrinterPool):
+    """ Label printers sharing the label jobs, see PrinterPool """
+    # seconds over which the throughput of the pool is measured
+    rate_window = 10
+
+    def __init__(self, driver_class, pool_name, printer_names):
+        PrinterPool.__init__(self, driver_class, pool_name, printer_names)
+        self.batches = deque()
+        self.labels = 0
+        self.batches_lock = Lock()
+
+    def record_labels(self, labels):
+        with self.batches_lock:
+            self.labels += labels
+            self.batches.append((time.monotonic(), labels))
+
+    def get_status(self):
+        status = PrinterPool.get_status(self)
+        with self.batches_lock:
+            limit = time.monotonic() - self.rate_window
+            while self.batches and self.batches[0][0] < limit:
+                self.batches.popleft()
+            recent = sum(labels for sent, labels in self.batches)
+            status['metrics'].update({'labels': self.labels,
+                                      'labels_per_sec': round(float(recent) / self.rate_window, 1)})
+        return status
+
+
+driver = hw_proxy.register_drivers(ZPLDriver, ZPLPool)
 
 
 class ZPLProxy(hw_proxy.Proxy):
 
     @http.route('/hw_proxy/print_label', type='json', auth='none', cors='*')
-    def print_label(self, label):
+    def print_label(self, label, job_key=None, printer=None):
         _logger.info('ZPL: PRINT LABEL')
-        driver.push_task('label', label)
+        return hw_proxy.push_job(ZPLDriver.name, printer, 'label', label, job_key)
 
     @http.route('/hw_proxy/print_xml_label', type='json', auth='none', cors='*')
-    def print_xml_receipt(self, label):
+    def print_xml_receipt(self, label, job_key=None, printer=None):
         _logger.info('ZPL: PRINT XML LABEL')
-        driver.push_task('xml_label', label)
+        return hw_proxy.push_job(ZPLDriver.name, printer, 'xml_label', label, job_key)
@@ -8,8 +8,15 @@ from .zpl import Zpl
 class Usb(UsbPrinter, Zpl, ZPLUSB):
     """ Define USB printer """
 
-    def __init__(self, idVendor, idProduct, timeout=0, in_ep=None, out_ep=None, *args, **kwargs):
-        UsbPrinter.__init__(self, idVendor, idProduct, timeout, in_ep, out_ep)
+    def __init__(self, idVendor, idProduct, timeout=0, in_ep=None, out_ep=None, serial_number=None, port=None,
+                 *args, **kwargs):
+        UsbPrinter.__init__(self, idVendor, idProduct, timeout, in_ep, out_ep, serial_number, port)
 
     def send_job(self, zpl2):
-        self._raw(zpl2)
+        """ Send ZPL code to the printer in a single bulk transfer """
+        if isinstance(zpl2, str):
+            zpl2 = zpl2.encode('utf-8')
+        if self.buffer is not None:
+            # keep the order of what was sent before
+            self._write_buffer()
+        self._write(zpl2)
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+import xml.etree.ElementTree as ET
+
 from zpl import Label
 
 
@@ -10,3 +12,120 @@ class Zpl(Label):
     """
 
     pass
+
+
+# attributes of the label specs converted to numbers, everything else is kept as a string
+SPEC_FLOATS = ('x', 'y', 'width', 'height', 'dpmm', 'char_height', 'char_width', 'line_width', 'thickness')
+SPEC_INTS = ('copies', 'darkness', 'max_line', 'magnification', 'rounding')
+
+
+def _number(name, value):
+    if name in SPEC_FLOATS:
+        return float(value)
+    if name in SPEC_INTS:
+        return int(value)
+    return value
+
+
+def label_from_spec(spec):
+    """ Builds a label from a structured definition
+
+    All dimensions are given in millimeters::
+
+        {'width': 50, 'height': 30, 'dpmm': 8, 'copies': 1, 'darkness': 15, 'fields': [
+            {'type': 'text', 'x': 2, 'y': 2, 'text': 'Product', 'char_height': 3, 'char_width': 2},
+            {'type': 'barcode', 'x': 2, 'y': 10, 'code': '123456', 'barcode_type': 'C', 'height': 10},
+            {'type': 'box', 'x': 0, 'y': 0, 'width': 50, 'height': 30, 'thickness': 0.2},
+            {'type': 'raw', 'zpl': '^FO10,10^GB100,0,2^FS'},
+        ]}
+
+    :return: the ZPL code of the label, from ^XA to ^XZ
+    """
+    spec = dict((name, _number(name, value)) for name, value in spec.items())
+    label = Label(spec['height'], spec.get('width', 110.0), spec.get('dpmm', 12.0))
+    if 'darkness' in spec:
+        label.set_darkness(spec['darkness'])
+
+    for field in spec.get('fields', ()):
+        field = dict((name, _number(name, value)) for name, value in field.items())
+        kind = field.get('type', 'text')
+        if kind == 'raw':
+            label.zpl_raw(field.get('zpl', ''))
+            continue
+
+        label.origin(field.get('x', 0), field.get('y', 0))
+        if kind == 'text':
+            label.write_text(field.get('text', ''),
+                             char_height=field.get('char_height', 3),
+                             char_width=field.get('char_width', 2),
+                             font=field.get('font', '0'),
+                             orientation=field.get('orientation', 'N'),
+                             line_width=field.get('line_width'),
+                             max_line=field.get('max_line', 1),
+                             justification=field.get('justification', 'L'))
+        elif kind == 'barcode':
+            label.barcode(field.get('barcode_type', 'C'), field.get('code', ''),
+                          height=int(field.get('height', 10) * label.dpmm),
+                          orientation=field.get('orientation', 'N'),
+                          print_interpretation_line=field.get('interpretation', 'Y'),
+                          magnification=field.get('magnification', 1))
+        elif kind == 'box':
+            label.draw_box(field.get('width', 0), field.get('height', 0),
+                           thickness=field.get('thickness', 0.1),
+                           rounding=field.get('rounding', 0))
+        else:
+            raise ValueError('Unknown label field: %s' % kind)
+        label.endorigin()
+
+    if spec.get('copies', 1) > 1:
+        label.zpl_raw('^PQ%d' % spec['copies'])
+    return label.dumpZPL()
+
+
+def specs_from_xml(xml):
+    """ Reads the labels of an xml document::
+
+        <labels>
+            <label width="50" height="30" dpmm="8" copies="2">
+                <text x="2" y="2" char_height="3" char_width="2">Product</text>
+                <barcode x="2" y="10" barcode_type="C" height="10">123456</barcode>
+                <box x="0" y="0" width="50" height="30" thickness="0.2"/>
+                <raw>^FO10,10^GB100,0,2^FS</raw>
+            </label>
+        </labels>
+
+    The root element can also be a single label.
+    :return: list of label specs, see label_from_spec()
+    """
+    root = ET.fromstring(xml)
+    labels = [root] if root.tag == 'label' else root.findall('label')
+    specs = []
+    for label in labels:
+        spec = dict(label.attrib)
+        spec['fields'] = []
+        for elem in label:
+            field = dict(elem.attrib, type=elem.tag)
+            text = elem.text or ''
+            if elem.tag == 'barcode':
+                field['code'] = text.strip()
+            elif elem.tag == 'raw':
+                field['zpl'] = text.strip()
+            else:
+                field['text'] = text.strip()
+            spec['fields'].append(field)
+        specs.append(spec)
+    return specs
+
+
+def label_to_zpl(label):
+    """ :return: the ZPL code of a label task: raw ZPL, a label spec or a list of them """
+    if isinstance(label, (list, tuple)):
+        return ''.join(label_to_zpl(item) for item in label)
+    if isinstance(label, dict):
+        return label_from_spec(label)
+    return label.strip()
+
+
+def xml_label_to_zpl(xml):
+    """ :return: the ZPL code of the labels of an xml document, see specs_from_xml() """
+    return ''.join(label_from_spec(spec) for spec in specs_from_xml(xml))
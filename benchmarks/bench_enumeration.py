@@ -0,0 +1,112 @@
+"""
+Benchmark of the printer enumeration done when the printers are reloaded.
+
+Enumerates a fake pyusb backend of 50 devices, a few of them printers,
+with an empty enumeration cache (what every reload used to cost), then
+with the cache warmed by a previous enumeration, and reports the time of
+an enumeration and the number of control transfers sent to the devices.
+
+usage: python -m benchmarks.bench_enumeration [--devices 50] [--printers 5] [--latency 0.001]
+"""
+from __future__ import print_function
+import time
+import argparse
+from collections import namedtuple
+
+import usb.backend
+
+from devices.printer import FindPrinters
+
+DeviceDescriptor = namedtuple('DeviceDescriptor', [
+    'bLength', 'bDescriptorType', 'bcdUSB', 'bDeviceClass', 'bDeviceSubClass', 'bDeviceProtocol',
+    'bMaxPacketSize0', 'idVendor', 'idProduct', 'bcdDevice', 'iManufacturer', 'iProduct', 'iSerialNumber',
+    'bNumConfigurations', 'bus', 'address', 'port_number', 'port_numbers', 'speed'])
+ConfigurationDescriptor = namedtuple('ConfigurationDescriptor', [
+    'bLength', 'bDescriptorType', 'wTotalLength', 'bNumInterfaces', 'bConfigurationValue', 'iConfiguration',
+    'bmAttributes', 'bMaxPower', 'extra_descriptors'])
+InterfaceDescriptor = namedtuple('InterfaceDescriptor', [
+    'bLength', 'bDescriptorType', 'bInterfaceNumber', 'bAlternateSetting', 'bNumEndpoints', 'bInterfaceClass',
+    'bInterfaceSubClass', 'bInterfaceProtocol', 'iInterface', 'extra_descriptors'])
+
+
+class FakeBackend(usb.backend.IBackend):
+    """ pyusb backend of fake devices, the control transfers take `latency` seconds """
+
+    def __init__(self, devices, printers, latency):
+        self.latency = latency
+        self.transfers = 0
+        self.devices = []
+        for n in range(devices):
+            printer = n < printers
+            self.devices.append(DeviceDescriptor(
+                18, 1, 0x0200, 0, 0, 0, 64,
+                # a printer of an unknown vendor, the printer class is declared by its interface
+                0x1234 if printer else 0x2000 + n, 0x0100 + n, 0x0100, 1, 2, 0, 1,
+                1 + n // 16, 1 + n % 16, 1, (1,), None))
+        self.classes = [7 if n < printers else 3 for n in range(devices)]
+
+    def enumerate_devices(self):
+        return iter(range(len(self.devices)))
+
+    def get_device_descriptor(self, dev):
+        return self.devices[dev]
+
+    def get_configuration_descriptor(self, dev, config):
+        if config:
+            raise IndexError()
+        return ConfigurationDescriptor(9, 2, 32, 1, 1, 0, 0xc0, 50, b'')
+
+    def get_interface_descriptor(self, dev, intf, alt, config):
+        if intf or alt:
+            raise IndexError()
+        return InterfaceDescriptor(9, 4, 0, 0, 2, self.classes[dev], 1, 2, 0, b'')
+
+    def open_device(self, dev):
+        return dev
+
+    def close_device(self, dev_handle):
+        pass
+
+    def ctrl_transfer(self, dev_handle, bmRequestType, bRequest, wValue, wIndex, data_or_wLength, timeout):
+        if self.latency:
+            time.sleep(self.latency)
+        self.transfers += 1
+        index = wValue & 0xff
+        if index == 0:
+            # supported languages: english
+            string = b'\x04\x03\x09\x04'
+        else:
+            text = ('Vendor' if index == 1 else 'Device %d' % dev_handle).encode('utf-16-le')
+            string = bytes([len(text) + 2, 3]) + text
+        data_or_wLength[:len(string)] = type(data_or_wLength)('B', string)
+        return len(string)
+
+
+def run(backend, rounds, clear):
+    backend.transfers = 0
+    started = time.time()
+    for _ in range(rounds):
+        if clear:
+            FindPrinters.cache.clear()
+        printers = len(list(FindPrinters(backend))) - 1
+    return (time.time() - started) / rounds * 1000, backend.transfers // rounds, printers
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--devices', type=int, default=50)
+    parser.add_argument('--printers', type=int, default=5)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.001,
+                        help='seconds spent by the fake devices on every control transfer')
+    args = parser.parse_args()
+
+    backend = FakeBackend(args.devices, args.printers, args.latency)
+    elapsed, transfers, printers = run(backend, args.rounds, True)
+    print('not cached : %8.2f ms %4d control transfers, %d printers' % (elapsed, transfers, printers))
+    elapsed, transfers, printers = run(backend, args.rounds, False)
+    print('cached     : %8.2f ms %4d control transfers, %d printers' % (elapsed, transfers, printers))
+
+
+if __name__ == '__main__':
+    main()
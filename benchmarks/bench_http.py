@@ -0,0 +1,99 @@
+"""
+Load benchmark of the web service server adapters.
+
+Simulates POS terminals hammering the box while one of them keeps a slow
+request open (like `/hw_proxy/scanner`) and reports requests/sec for the
+single-threaded wsgiref adapter and the thread-pool adapter.
+
+usage: python -m benchmarks.bench_http [--clients 20] [--duration 5]
+"""
+from __future__ import print_function
+import time
+import socket
+import argparse
+import threading
+import http.client
+
+from odoo.http.core import WSGIRefServer, ThreadPoolServer
+
+
+def app(environ, start_response):
+    # a request that waits on the printer / scanner for a moment
+    delay = float(environ.get('QUERY_STRING') or 0.005)
+    time.sleep(delay)
+    start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', '4')])
+    return [b'ping']
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def start_server(adapter, **options):
+    port = free_port()
+    server = adapter(host='127.0.0.1', port=port, **options)
+    server.quiet = True
+    thread = threading.Thread(target=server.run, args=(app,))
+    thread.daemon = True
+    thread.start()
+    # wait until the socket is listening
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return port
+        except socket.error:
+            time.sleep(0.05)
+
+
+def client(port, deadline, path, counter, lock):
+    done = 0
+    while time.time() < deadline:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.request('GET', path)
+        conn.getresponse().read()
+        conn.close()
+        done += 1
+    with lock:
+        counter[0] += done
+
+
+def run(adapter, clients, duration, **options):
+    port = start_server(adapter, **options)
+    counter, lock = [0], threading.Lock()
+    deadline = time.time() + duration
+    threads = [threading.Thread(target=client, args=(port, deadline, '/?0.005', counter, lock))
+               for _ in range(clients)]
+    # one terminal waiting on the scanner route the whole time
+    slow = threading.Thread(target=client, args=(port, deadline, '/?1.0', [0], lock))
+    slow.daemon = True
+    slow.start()
+    started = time.time()
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+    return counter[0] / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    print('%d concurrent clients, %.0fs per run' % (args.clients, args.duration))
+    rps = run(WSGIRefServer, args.clients, args.duration)
+    print('wsgiref    : %8.1f req/s' % rps)
+    rps = run(ThreadPoolServer, args.clients, args.duration, workers=args.workers, backlog=64)
+    print('threadpool : %8.1f req/s (workers=%d)' % (rps, args.workers))
+
+
+if __name__ == '__main__':
+    main()
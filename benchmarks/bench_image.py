@@ -0,0 +1,59 @@
+"""
+Benchmark of the image rasterization used by print_base64_image.
+
+Converts a synthetic 512x255 logo with the per-pixel implementation
+(_convert_image + _raw_print_image) and with the array based one
+(_raster_image), checks both produce the same bytes and reports the time.
+
+usage: python -m benchmarks.bench_image [--rounds 5]
+"""
+from __future__ import print_function
+import time
+import argparse
+
+from PIL import Image, ImageDraw
+
+from addons.hw_escpos.escpos.printer import Usb
+
+from .fake import FakeDevice, fake_usb
+
+
+def sample_logo(width=512, height=255):
+    im = Image.new('RGB', (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(im)
+    # a gradient so every branch of the "1X0" pattern is used
+    for x in range(width):
+        level = int(255 * x / width)
+        draw.line([(x, 0), (x, height // 3)], fill=(level, level, level))
+    draw.ellipse([20, height // 3, 200, height - 10], fill=(0, 0, 0))
+    draw.rectangle([260, height // 2, 500, height - 20], fill=(128, 140, 150))
+    draw.text((230, 100), 'LinkBox', fill=(0, 0, 0))
+    return im
+
+
+def timeit(func, rounds):
+    started = time.time()
+    for _ in range(rounds):
+        result = func()
+    return result, (time.time() - started) * 1000 / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    printer = fake_usb(Usb, FakeDevice())
+    logo = sample_logo()
+
+    legacy, legacy_ms = timeit(lambda: printer._raw_print_image(*printer._convert_image(logo)), args.rounds)
+    raster, raster_ms = timeit(lambda: printer._raster_image(logo), args.rounds)
+
+    print('image %dx%d, %d bytes' % (logo.size[0], logo.size[1], len(raster)))
+    print('per pixel  : %8.2f ms' % legacy_ms)
+    print('vectorized : %8.2f ms (x%.1f)' % (raster_ms, legacy_ms / raster_ms))
+    print('identical  : %s' % (legacy == raster))
+
+
+if __name__ == '__main__':
+    main()
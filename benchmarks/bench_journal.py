@@ -0,0 +1,86 @@
+"""
+Benchmark of the job journal.
+
+Several threads (the web service workers) queue receipts as push_task
+does, with the journal off and on, and the enqueue throughput is
+reported with the number of fsyncs the journal needed. The journal is
+then replayed to check every unfinished job comes back.
+
+usage: python -m benchmarks.bench_journal [--threads 8] [--jobs 250]
+"""
+from __future__ import print_function
+import os
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+
+from addons.hw_proxy.jobs import Job, JobQueue
+from addons.hw_proxy.journal import Journal
+
+from .fake import sample_receipt
+
+
+def run(queue, journal, threads, jobs, receipt):
+
+    def push():
+        for _ in range(jobs):
+            job = Job('xml_receipt', receipt, ttl=3600)
+            if journal:
+                journal.add(job)
+            queue.put(job)
+
+    workers = [threading.Thread(target=push) for _ in range(threads)]
+    started = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return threads * jobs / (time.time() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--jobs', type=int, default=250, help='jobs queued by every thread')
+    parser.add_argument('--lines', type=int, default=20)
+    args = parser.parse_args()
+
+    receipt = sample_receipt(args.lines)
+    total = args.threads * args.jobs
+
+    rate = run(JobQueue(), None, args.threads, args.jobs, receipt)
+    print('journal off : %10.1f jobs/s' % rate)
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'bench.log')
+        for threads in (1, args.threads):
+            journal = Journal(path, compact_size=10 * total)
+            journal.replay()
+            journal.open()
+            jobs = total // threads
+            rate = run(JobQueue(), journal, threads, jobs, receipt)
+            print('journal on  : %10.1f jobs/s, %d threads, %.1f jobs per fsync'
+                  % (rate, threads, threads * jobs / float(journal.commits)))
+            if os.path.exists(path):
+                os.remove(path)
+
+        # unfinished jobs are replayed, finished ones are not
+        journal = Journal(path)
+        journal.replay()
+        journal.open()
+        queue = JobQueue()
+        run(queue, journal, 1, 100, receipt)
+        for job in queue.jobs[:60]:
+            journal.done(job.id)
+        while journal.committed < journal.appended:
+            time.sleep(0.01)
+        print('replayed    : %d of 40 unfinished jobs' % len(Journal(path).replay()))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Benchmark of the batched ZPL label path.
+
+Converts label specs to ZPL and sends them to a fake USB device one
+transfer per label, then concatenated in batches as the ZPL driver does
+with the label jobs waiting in its queue, and reports the throughput.
+
+usage: python -m benchmarks.bench_labels [--labels 200] [--batch 50] [--latency 0.001]
+"""
+from __future__ import print_function
+import time
+import argparse
+
+from addons.hw_zpl.zpl.printer import Usb
+from addons.hw_zpl.zpl.zpl import label_to_zpl
+
+from .fake import FakeDevice, fake_usb
+
+
+def sample_label(n):
+    return {'width': 50, 'height': 30, 'dpmm': 8, 'fields': [
+        {'type': 'text', 'x': 2, 'y': 2, 'text': 'Product %d' % n, 'char_height': 3, 'char_width': 2},
+        {'type': 'barcode', 'x': 2, 'y': 10, 'code': '%012d' % n, 'barcode_type': 'C', 'height': 10},
+        {'type': 'box', 'x': 0, 'y': 0, 'width': 50, 'height': 30, 'thickness': 0.2},
+    ]}
+
+
+def run(printer, device, labels, batch):
+    device.reset()
+    started = time.time()
+    for i in range(0, len(labels), batch):
+        printer.send_job(''.join(label_to_zpl(label) for label in labels[i:i + batch]))
+    elapsed = time.time() - started
+    return device.writes, len(labels) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--labels', type=int, default=200)
+    parser.add_argument('--batch', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.001,
+                        help='seconds spent by the fake device on every transfer')
+    args = parser.parse_args()
+
+    device = FakeDevice(args.latency)
+    printer = fake_usb(Usb, device)
+    labels = [sample_label(n) for n in range(args.labels)]
+
+    writes, rate = run(printer, device, labels, 1)
+    print('one by one : %5d writes %10.1f labels/s' % (writes, rate))
+    writes, rate = run(printer, device, labels, args.batch)
+    print('batched    : %5d writes %10.1f labels/s' % (writes, rate))
+
+
+if __name__ == '__main__':
+    main()
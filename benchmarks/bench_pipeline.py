@@ -0,0 +1,102 @@
+"""
+Benchmark of the render/transmit pipeline of the ESC/POS driver.
+
+Prints a series of receipts on a fake USB device whose transfers take
+some time, as the printer does while it prints, first rendering and
+sending each receipt in turn on one thread, then with a RenderPipeline
+rendering the next receipts while the previous ones are sent. Checks
+both print the same bytes and reports the time per receipt and the time
+spent in each stage.
+
+usage: python -m benchmarks.bench_pipeline [--receipts 50] [--lines 30] [--latency 0.005] [--lookahead 2]
+"""
+from __future__ import print_function
+import time
+import argparse
+
+from addons.hw_escpos.escpos.cache import ReceiptCache
+from addons.hw_escpos.escpos.escpos import Escpos
+from addons.hw_escpos.escpos.printer import Usb, Renderer
+from addons.hw_proxy.jobs import Job, JobQueue
+from addons.hw_proxy.pipeline import RenderPipeline
+
+from .bench_receipt_cache import sample_receipts
+from .fake import FakeDevice, fake_usb
+
+
+class RecordingDevice(FakeDevice):
+
+    def __init__(self, latency):
+        FakeDevice.__init__(self, latency)
+        self.data = bytearray()
+
+    def write(self, endpoint, data, timeout=None):
+        self.data += data
+        return FakeDevice.write(self, endpoint, data, timeout)
+
+
+def serial(receipts, latency):
+    """ :return: the printed data and the time per receipt, in ms """
+    device = RecordingDevice(latency)
+    printer = fake_usb(Usb, device)
+    started = time.time()
+    for xml in receipts:
+        printer.begin()
+        printer.receipt(xml)
+        printer.flush()
+    return bytes(device.data), (time.time() - started) * 1000 / len(receipts)
+
+
+def pipelined(receipts, latency, lookahead):
+    """ :return: the printed data, the time per receipt, in ms, and the statistics of the pipeline """
+    device = RecordingDevice(latency)
+    printer = fake_usb(Usb, device)
+    renderer = Renderer()
+
+    def render(job):
+        renderer.receipt(job.data)
+        return renderer.take()
+
+    queue = JobQueue()
+    pipeline = RenderPipeline(queue, render, {}, lookahead)
+    pipeline.start()
+    started = time.time()
+    for xml in receipts:
+        queue.put(Job('xml_receipt', xml))
+    for _ in receipts:
+        job = pipeline.get()
+        sent = time.monotonic()
+        printer.begin()
+        for program in job.output:
+            printer.execute(program)
+        printer.flush()
+        pipeline.record_transmit(time.monotonic() - sent)
+    return bytes(device.data), (time.time() - started) * 1000 / len(receipts), pipeline.get_stats()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--receipts', type=int, default=50)
+    parser.add_argument('--lines', type=int, default=30)
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='seconds spent by the fake device on every transfer')
+    parser.add_argument('--lookahead', type=int, default=2)
+    args = parser.parse_args()
+
+    receipts = sample_receipts(args.receipts, args.lines)
+    # render every receipt for real, only the logo raster is cached
+    Escpos.receipt_cache = ReceiptCache(0)
+    serial(receipts[:1], 0)
+
+    print('%d receipts of %d lines, %.1f ms per transfer' % (args.receipts, args.lines, args.latency * 1000))
+    expected, elapsed = serial(receipts, args.latency)
+    print('serial    : %8.2f ms per receipt' % elapsed)
+    data, pipelined_elapsed, stats = pipelined(receipts, args.latency, args.lookahead)
+    print('pipelined : %8.2f ms per receipt (x%.2f)' % (pipelined_elapsed, elapsed / pipelined_elapsed))
+    print('  render %.2f ms, transmit %.2f ms per receipt, %.1f%% of the rendering hidden'
+          % (stats['render_avg'], stats['transmit_avg'], stats['render_hidden']))
+    print('identical : %s' % (data == expected))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark of the compiled receipt cache.
+
+Prints a series of receipts sharing the same header (logo, company
+details) and footer but with different order lines, as a POS does, with
+the receipt cache disabled and enabled, then prints them again. Checks
+both print the same bytes and reports the render time per receipt.
+
+usage: python -m benchmarks.bench_receipt_cache [--receipts 50] [--lines 10] [--rounds 3]
+"""
+from __future__ import print_function
+import io
+import time
+import base64
+import argparse
+
+from addons.hw_escpos.escpos.cache import ReceiptCache
+from addons.hw_escpos.escpos.escpos import Escpos
+from addons.hw_escpos.escpos.printer import Usb
+
+from .bench_image import sample_logo
+from .fake import FakeDevice, fake_usb
+
+
+class RecordingDevice(FakeDevice):
+
+    def __init__(self):
+        FakeDevice.__init__(self, latency=0)
+        self.data = bytearray()
+
+    def write(self, endpoint, data, timeout=None):
+        self.data += data
+        return FakeDevice.write(self, endpoint, data, timeout)
+
+
+def sample_receipts(count, lines):
+    buf = io.BytesIO()
+    sample_logo().save(buf, 'PNG')
+    logo = 'data:image/png;base64,' + base64.b64encode(buf.getvalue()).decode()
+    header = '''<div align="center"><img src="%s"/></div>
+    <div align="center"><h1>My Company</h1><div>Street 1, 12345 City</div><div>Tel: 555-1234</div>
+    <div>VAT: BE0477472701</div><div>contact@example.com</div><div>www.example.com</div></div>
+    <br/>''' % logo
+    footer = '''<br/>
+    <div align="center"><div>Thank you for your visit!</div><div>Goods are not exchanged without receipt</div>
+    <div font="b"><div>Opening hours: 9:00 - 18:00</div><div>Mon - Sat</div></div></div>'''
+    receipts = []
+    for n in range(count):
+        orderlines = ''.join(
+            '<line><left>Product %d</left><right><value>%d.5</value></right></line>' % (i, n + i)
+            for i in range(lines))
+        receipts.append('''<receipt width="40" value-thousands-separator="">%s
+    <div>%s</div>
+    <line size="double-height"><left><pre>        TOTAL</pre></left><right><value>%d.00</value></right></line>
+    <div font="b"><div>Order %05d</div></div>%s
+</receipt>''' % (header, orderlines, n, n, footer))
+    return receipts
+
+
+def run(receipts, reprint=False):
+    """ :return: the printed data and the render time per receipt, in ms """
+    device = RecordingDevice()
+    printer = fake_usb(Usb, device)
+    # the logo raster is cached in every run, only the receipt rendering is compared
+    printer.receipt(receipts[0])
+    if reprint:
+        for xml in receipts:
+            printer.receipt(xml)
+    device.data = bytearray()
+
+    started = time.time()
+    for xml in receipts:
+        printer.begin()
+        printer.receipt(xml)
+        printer.flush()
+    return bytes(device.data), (time.time() - started) * 1000 / len(receipts)
+
+
+def compare(receipts, rounds, reprint=False):
+    uncached_ms = cached_ms = float('inf')
+    for _ in range(rounds):
+        Escpos.receipt_cache = ReceiptCache(0)
+        uncached, elapsed = run(receipts, reprint)
+        uncached_ms = min(uncached_ms, elapsed)
+        Escpos.receipt_cache = ReceiptCache()
+        cached, elapsed = run(receipts, reprint)
+        cached_ms = min(cached_ms, elapsed)
+
+    print('%s:' % ('reprints' if reprint else 'new receipts'))
+    print('  no cache  : %8.2f ms per receipt' % uncached_ms)
+    print('  cache     : %8.2f ms per receipt (x%.1f)' % (cached_ms, uncached_ms / cached_ms))
+    print('  cache     : %s' % Escpos.receipt_cache.stats())
+    print('  identical : %s' % (uncached == cached))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--receipts', type=int, default=50)
+    parser.add_argument('--lines', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    receipts = sample_receipts(args.receipts, args.lines)
+    print('%d receipts of %d lines' % (args.receipts, args.lines))
+    compare(receipts, args.rounds)
+    compare(receipts, args.rounds, reprint=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark of the ESC/POS write buffer.
+
+Sends the same receipt on a fake USB device with and without a
+begin()/flush() transaction and reports the number of bulk transfers and
+the wall time per receipt. The receipt is written with one text() or _raw()
+call per command, as the XML serializer does: receipt() compiles its
+commands into a few segments, which would hide the effect of the buffer.
+
+usage: python -m benchmarks.bench_usb_buffer [--receipts 50] [--lines 40] [--latency 0.0001]
+"""
+from __future__ import print_function
+import time
+import argparse
+
+from escpos.constants import TXT_ALIGN_CT, TXT_ALIGN_LT, TXT_NORMAL, TXT_2HEIGHT, TXT_4SQUARE, TXT_FONT_A, TXT_FONT_B
+
+from addons.hw_escpos.escpos.printer import Usb
+
+from .fake import FakeDevice, fake_usb
+
+
+def print_receipt(printer, lines):
+    """ the receipt of sample_receipt(), one call per style command and text """
+    printer._raw(TXT_ALIGN_CT)
+    printer._raw(TXT_4SQUARE)
+    printer.text('My Company\n')
+    printer._raw(TXT_NORMAL)
+    for header in ('Street 1, 12345 City', 'Tel: 555-1234', 'VAT: BE0477472701'):
+        printer.text(header)
+        printer.text('\n')
+    printer.text('\n')
+    printer._raw(TXT_ALIGN_LT)
+    for i in range(lines):
+        left, right = 'Product %d' % i, '%d.50' % i
+        printer.text(left)
+        printer.text(' ' * (40 - len(left) - len(right)))
+        printer.text(right)
+        printer.text('\n')
+    printer._raw(TXT_2HEIGHT)
+    printer.text('        TOTAL')
+    printer.text(' ' * 21)
+    printer.text('820.00')
+    printer.text('\n')
+    printer._raw(TXT_NORMAL)
+    printer.text('\n')
+    printer._raw(TXT_FONT_B)
+    printer.text('Order 00042-001-0001\n')
+    printer.text('2019-01-01 12:00:00\n')
+    printer._raw(TXT_FONT_A)
+    printer.cut()
+
+
+def run(printer, device, lines, receipts, buffered):
+    device.reset()
+    started = time.time()
+    for _ in range(receipts):
+        if buffered:
+            printer.begin()
+        print_receipt(printer, lines)
+        if buffered:
+            printer.flush()
+    elapsed = time.time() - started
+    return device.writes / float(receipts), elapsed * 1000 / receipts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--receipts', type=int, default=50)
+    parser.add_argument('--lines', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.0001,
+                        help='seconds spent by the fake device on every transfer')
+    args = parser.parse_args()
+
+    device = FakeDevice(args.latency)
+    printer = fake_usb(Usb, device)
+
+    writes, ms = run(printer, device, args.lines, args.receipts, buffered=False)
+    print('unbuffered : %7.1f writes/receipt %8.2f ms/receipt' % (writes, ms))
+    writes, ms = run(printer, device, args.lines, args.receipts, buffered=True)
+    print('buffered   : %7.1f writes/receipt %8.2f ms/receipt' % (writes, ms))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Fake USB device shared by the benchmarks, it stands in for the pyusb device
+of devices.printer.Usb and counts the bulk transfers it receives.
+"""
+import time
+
+
+class FakeDevice(object):
+
+    def __init__(self, latency=0.0001):
+        """
+        :param latency: seconds spent by every bulk transfer (USB round trip)
+        """
+        self.latency = latency
+        self.writes = 0
+        self.written = 0
+
+    def write(self, endpoint, data, timeout=None):
+        if self.latency:
+            time.sleep(self.latency)
+        self.writes += 1
+        self.written += len(data)
+        return len(data)
+
+    def ctrl_transfer(self, *args, **kwargs):
+        return b'\x00\x00'
+
+    def reset(self):
+        self.writes = 0
+        self.written = 0
+
+
+def fake_usb(usb_class, device):
+    """ :return: usb_class instance writing to device instead of a real printer """
+
+    class FakeUsb(usb_class):
+        def open(self):
+            self.device = device
+            self.in_ep = 0x82
+            self.out_ep = 0x01
+            self.max_packet_size = 64
+
+        def close(self):
+            self.device = None
+
+    return FakeUsb(0, 0)
+
+
+def sample_receipt(lines=40):
+    orderlines = ''.join(
+        '<line><left>Product %d</left><right><value>%d.5</value></right></line>' % (i, i)
+        for i in range(lines))
+    return '''<receipt align="center" width="40" value-thousands-separator="">
+    <h1>My Company</h1>
+    <div>Street 1, 12345 City</div>
+    <div>Tel: 555-1234</div>
+    <div>VAT: BE0477472701</div>
+    <br/>
+    <div align="left">%s</div>
+    <line size="double-height"><left><pre>        TOTAL</pre></left><right><value>820.00</value></right></line>
+    <br/>
+    <div font="b"><div>Order 00042-001-0001</div><div>2019-01-01 12:00:00</div></div>
+</receipt>''' % orderlines
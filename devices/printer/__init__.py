@@ -1,3 +1,5 @@
 from .printer import Printer, FindPrinters, Usb
+from .pool import UsbPool
+from .hotplug import HotplugMonitor
 
-__all__ = ['Printer', 'FindPrinters', 'Usb']
+__all__ = ['Printer', 'FindPrinters', 'Usb', 'UsbPool', 'HotplugMonitor']
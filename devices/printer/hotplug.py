@@ -0,0 +1,168 @@
+import os
+import sys
+import time
+import logging
+from threading import Thread, Lock, Event
+
+try:
+    import usb1
+except ImportError:
+    usb1 = None
+
+from .printer import port_path
+
+_logger = logging.getLogger(__name__)
+
+# events passed to the listeners
+ATTACHED = 'attached'
+DETACHED = 'detached'
+
+SYSFS_DEVICES = '/sys/bus/usb/devices'
+
+
+class HotplugMonitor(object):
+    """ Live table of the USB devices plugged in the box
+
+    With libusb hotplug support (python-libusb1) the table is maintained from the attach and detach
+    callbacks, otherwise on Linux it is refreshed by polling sysfs, which only reads what the kernel
+    already knows and does not send anything on the bus. Listeners are called on every attach and
+    detach, so the drivers can reconnect immediately instead of probing the bus until the printer
+    comes back. On other platforms without libusb1 the monitor does not run and is_present() is None.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.ready = Event()
+        # (vendor_id, product_id, serial number or None when unknown) of the plugged devices, by port
+        # (see port_path)
+        self.devices = {}
+        self.listeners = []
+        self.thread = None
+        self.interval = 1.0
+        self.backend = None
+
+    @staticmethod
+    def backends():
+        """ :return: names of the backends available on this system, best first """
+        backends = []
+        if usb1 is not None and usb1.hasCapability(usb1.CAP_HAS_HOTPLUG):
+            backends.append('libusb')
+        if sys.platform.startswith('linux') and os.path.isdir(SYSFS_DEVICES):
+            backends.append('sysfs')
+        return backends
+
+    def start(self, interval=1.0):
+        """ start watching, does nothing when already started or when no backend is available
+        :param interval: seconds between two polls of the sysfs backend
+        """
+        with self.lock:
+            if self.thread is not None:
+                return
+            backends = self.backends()
+            if not backends:
+                _logger.info('USB hotplug is not available, devices are probed on the bus')
+                return
+            self.interval = interval
+            self.backend = backends[0]
+            target = self._run_libusb if self.backend == 'libusb' else self._run_sysfs
+            self.thread = Thread(target=target, name='usb-hotplug')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def subscribe(self, listener):
+        """ :param listener: callable(event, vendor_id, product_id), called from the monitor thread """
+        with self.lock:
+            if listener not in self.listeners:
+                self.listeners.append(listener)
+
+    def is_present(self, vendor_id, product_id, serial_number=None, port=None):
+        """
+        :param serial_number: serial number of the device, None for any
+        :param port: port the device is plugged in, None for any
+        :return: whether such a device is plugged, None when the monitor does not run
+        """
+        if not self.ready.is_set():
+            return None
+        with self.lock:
+            for position, (vendor, product, serial) in self.devices.items():
+                if (vendor, product) != (vendor_id, product_id) or port and position != port:
+                    continue
+                if serial_number and serial is not None and serial != serial_number:
+                    continue
+                return True
+        return False
+
+    def _update(self, devices):
+        """ replace the table by devices and notify the changes """
+        with self.lock:
+            previous, self.devices = self.devices, devices
+            listeners = list(self.listeners)
+        events = [(DETACHED, ids) for key, ids in previous.items() if devices.get(key) != ids]
+        events += [(ATTACHED, ids) for key, ids in devices.items() if previous.get(key) != ids]
+        for event, (vendor_id, product_id, serial) in events:
+            _logger.debug('USB device %04x:%04x %s' % (vendor_id, product_id, event))
+            for listener in listeners:
+                try:
+                    listener(event, vendor_id, product_id)
+                except Exception as e:
+                    _logger.error('USB hotplug listener failed: %s' % str(e))
+
+    def _run_sysfs(self):
+        while True:
+            try:
+                names = [name for name in os.listdir(SYSFS_DEVICES) if ':' not in name]
+                devices = {}
+                for name in names:
+                    # read again at every poll: another device can be plugged in the same port meanwhile
+                    ids = self._read_sysfs(name)
+                    if ids is not None:
+                        devices[name] = ids
+                if devices != self.devices:
+                    self._update(dict(devices))
+                self.ready.set()
+            except OSError as e:
+                _logger.warning('Can not read %s: %s' % (SYSFS_DEVICES, str(e)))
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _read_sysfs(name):
+        path = os.path.join(SYSFS_DEVICES, name)
+        try:
+            with open(os.path.join(path, 'idVendor')) as f:
+                vendor_id = int(f.read().strip(), 16)
+            with open(os.path.join(path, 'idProduct')) as f:
+                product_id = int(f.read().strip(), 16)
+        except (IOError, OSError, ValueError):
+            # hubs being set up, or the device left meanwhile
+            return None
+        try:
+            with open(os.path.join(path, 'serial')) as f:
+                serial = f.read().strip()
+        except (IOError, OSError):
+            # the device has no serial number
+            serial = None
+        return vendor_id, product_id, serial
+
+    def _run_libusb(self):
+        context = usb1.USBContext()
+
+        def callback(context, device, event):
+            key = (port_path(device.getBusNumber(), device.getPortNumberList())
+                   or (device.getBusNumber(), device.getDeviceAddress()))
+            with self.lock:
+                devices = dict(self.devices)
+            if event == usb1.HOTPLUG_EVENT_DEVICE_ARRIVED:
+                # reading the serial number needs to open the device
+                devices[key] = (device.getVendorID(), device.getProductID(), None)
+            else:
+                devices.pop(key, None)
+            self._update(devices)
+
+        # the devices already plugged are reported during the registration
+        context.hotplugRegisterCallback(callback)
+        self.ready.set()
+        while True:
+            context.handleEvents()
+
+
+monitor = HotplugMonitor()
@@ -0,0 +1,74 @@
+import time
+import logging
+from threading import Lock
+
+import usb.core
+
+_logger = logging.getLogger(__name__)
+
+
+class UsbPool(object):
+    """ Cache of opened USB printer handles
+    Opening a printer means enumerating the bus, detaching the kernel driver and claiming the
+    interface. The pool keeps the handle of each printer (keyed by Printer.id) open across jobs
+    and only reopens it when the device stops answering.
+    """
+
+    def __init__(self, factory, health_interval=5):
+        """
+        :param factory: callable(idVendor, idProduct, **Printer.usb_match()) returning an opened Usb object
+        :param health_interval: seconds a handle may stay unused before it is checked again
+        """
+        self.factory = factory
+        self.health_interval = health_interval
+        self.lock = Lock()
+        self._handles = {}
+        self._last_used = {}
+
+    def get(self, printer):
+        """ Return the opened device of printer, (re)connecting when needed
+        :raises usb.core.USBError: when the printer can not be opened
+        """
+        with self.lock:
+            device = self._handles.get(printer.id)
+            if device is not None and not self._is_healthy(printer.id, device):
+                _logger.info('USB handle of %s is stale, reconnecting' % printer)
+                self._close(printer.id)
+                device = None
+
+            if device is None:
+                device = self.factory(printer.vendor_id, printer.product_id, **printer.usb_match())
+                self._handles[printer.id] = device
+
+            self._last_used[printer.id] = time.monotonic()
+            return device
+
+    def discard(self, printer):
+        """ Close and forget the handle of printer, e.g. after an USBError """
+        with self.lock:
+            self._close(printer.id)
+
+    def release_others(self, printer):
+        """ Close every handle except the one of printer (the selected printer changed) """
+        with self.lock:
+            for key in [key for key in self._handles if key != printer.id]:
+                self._close(key)
+
+    def clear(self):
+        with self.lock:
+            for key in list(self._handles):
+                self._close(key)
+
+    def _is_healthy(self, key, device):
+        if time.monotonic() - self._last_used.get(key, 0) < self.health_interval:
+            return True
+        return device.is_alive()
+
+    def _close(self, key):
+        device = self._handles.pop(key, None)
+        self._last_used.pop(key, None)
+        if device is not None:
+            try:
+                device.close()
+            except usb.core.USBError as e:
+                _logger.warning('Can not release USB device %s: %s' % (key, str(e)))
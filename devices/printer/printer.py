@@ -1,5 +1,9 @@
 import time
+import zlib
+import errno
+import struct
 import logging
+from threading import Lock
 import usb.core
 import usb.util
 
@@ -7,17 +11,40 @@ from devices.printer.exceptions import (NoDeviceError, NoStatusError, HandleDevi
 
 _logger = logging.getLogger(__name__)
 
+# raised by pyusb 1.2 on timeouts, the older versions raise an USBError with the errno of the timeout
+USBTimeoutError = getattr(usb.core, 'USBTimeoutError', None)
+
+
+def is_timeout(error):
+    """ :return: whether an USBError tells that the device did not answer in time """
+    if USBTimeoutError is not None and isinstance(error, USBTimeoutError):
+        return True
+    return error.errno == errno.ETIMEDOUT
+
+
+def port_path(bus, port_numbers):
+    """ :return: position of a device on the USB tree, as named by sysfs (1-1.2), None when it is unknown """
+    if not port_numbers:
+        return None
+    return '%d-%s' % (bus, '.'.join(str(number) for number in port_numbers))
+
 
 class Printer(object):
+    """ Printer configured or found on the bus
+
+    Printers of the same model have the same vendor and product ids: the serial number, or else the
+    port the printer is plugged in, tells them apart. Empty, any device with these ids matches.
+    """
     STATUS_DISCONNECTED = 0
     STATUS_CONNECTED = 1
 
-    def __init__(self, product_id, vendor_id, description):
+    def __init__(self, product_id, vendor_id, description, serial_number='', port=''):
         self.product_id = product_id
         self.vendor_id = vendor_id
         self.description = description
+        self.serial_number = serial_number
+        self.port = port
         self.status = Printer.STATUS_DISCONNECTED
-        self.print_test_request = False
 
     def get_status_display(self):
         if self.status == Printer.STATUS_DISCONNECTED:
@@ -27,7 +54,21 @@ class Printer(object):
 
     @property
     def id(self):
-        return '%d@%d' % (self.product_id, self.vendor_id)
+        printer_id = '%d@%d' % (self.product_id, self.vendor_id)
+        if self.serial_number:
+            printer_id += '#%s' % self.serial_number
+        if self.port:
+            printer_id += '/%s' % self.port
+        return printer_id
+
+    def usb_match(self):
+        """ :return: keyword arguments of Usb selecting this very printer among the ones of its model """
+        match = {}
+        if self.serial_number:
+            match['serial_number'] = self.serial_number
+        if self.port:
+            match['port'] = self.port
+        return match
 
     def __repr__(self):
         return self.description
@@ -48,55 +89,77 @@ class Printer(object):
 class FindPrinters(object):
     ''' Printer Iterator class '''
 
-    def _get_connected_usb_printers(self):
-        # printers can either define bDeviceClass=7, or they can define one of
-        # their interfaces with bInterfaceClass=7. This class checks for both.
-        class FindUsbClass(object):
-            def __init__(self, usb_class, idVendors):
-                self._class = usb_class
-                self.vendors = idVendors
-
-            def __call__(self, device):
-                # first, let's check the device
-                if device.bDeviceClass == self._class:
-                    return True
-
-                # transverse all devices and look through their interfaces to
-                # find a matching class
-                for cfg in device:
-                    for idVendor in self.vendors:
-                        if idVendor == device.idVendor:
-                            return True
-
-                    if usb.util.find_descriptor(cfg, bInterfaceClass=self._class) is not None:
-                        return True
-
-                return False
-
-        # find epson and start on the usb
-        # epson = 0x04b8
-        # star  = 0x0519
-        usb_devices = usb.core.find(find_all=True, custom_match=FindUsbClass(7, [0x04b8, 0x0519]))
+    # printers can either define bDeviceClass=7, or they can define one of
+    # their interfaces with bInterfaceClass=7.
+    usb_class = 7
+    # vendors whose devices are all printers: epson = 0x04b8, star = 0x0519
+    vendors = frozenset([0x04b8, 0x0519])
+    # description of the enumerated devices, None for the devices which are not printers, by
+    # (bus, address, checksum of the device descriptor): the configurations and strings of a
+    # device are only read the first time it is seen, once per attachment
+    cache = {}
+    cache_lock = Lock()
+
+    @classmethod
+    def is_printer(cls, device):
+        if device.bDeviceClass == cls.usb_class or device.idVendor in cls.vendors:
+            return True
+
+        # transverse all configurations and look through their interfaces to
+        # find a matching class
+        for cfg in device:
+            if usb.util.find_descriptor(cfg, bInterfaceClass=cls.usb_class) is not None:
+                return True
+
+        return False
+
+    @staticmethod
+    def device_key(device):
+        """ :return: key of the device in the cache, which changes when it is plugged again """
+        descriptor = struct.pack('<BBHBBBBHHHBBBB', device.bLength, device.bDescriptorType, device.bcdUSB,
+                                 device.bDeviceClass, device.bDeviceSubClass, device.bDeviceProtocol,
+                                 device.bMaxPacketSize0, device.idVendor, device.idProduct, device.bcdDevice,
+                                 device.iManufacturer, device.iProduct, device.iSerialNumber,
+                                 device.bNumConfigurations)
+        return device.bus, device.address, zlib.crc32(descriptor)
+
+    @staticmethod
+    def get_description(device):
+        try:
+            manufacture = usb.util.get_string(device, device.iManufacturer)
+            product = usb.util.get_string(device, device.iProduct)
+            return '%s %s' % (manufacture, product)
+        except Exception as e:
+            _logger.error("Can not get printer description: %s" % (str(e)))
+            return 'Unknown printer'
 
+    def _get_connected_usb_printers(self):
         printers = []
-        for device in usb_devices:
-            try:
-                manufacture = usb.util.get_string(device, device.iManufacturer)
-                product = usb.util.get_string(device, device.iProduct)
-                description = '%s %s' % (manufacture, product)
-            except Exception as e:
-                _logger.error("Can not get printer description: %s" % (str(e)))
-                description = 'Unknown printer'
-
-            # create printer instance
-            printer = Printer(device.idProduct, device.idVendor, description)
-            printers.append(printer)
+        cache = FindPrinters.cache
+        with FindPrinters.cache_lock:
+            keys = set()
+            for device in usb.core.find(find_all=True, backend=self.backend):
+                key = self.device_key(device)
+                keys.add(key)
+                if key not in cache:
+                    cache[key] = self.get_description(device) if self.is_printer(device) else None
+                if cache[key] is not None:
+                    # create printer instance
+                    printers.append(Printer(device.idProduct, device.idVendor, cache[key]))
+
+            # forget the unplugged devices
+            for key in [key for key in cache if key not in keys]:
+                del cache[key]
 
         # finally we return all connected printers
         return printers
 
     # default constructors
-    def __init__(self):
+    def __init__(self, backend=None):
+        """
+        :param backend: pyusb backend, None for the default one
+        """
+        self.backend = backend
         self._current = 0
         self._printers = [Printer(0, 0, '')]
         self._printers += self._get_connected_usb_printers()
@@ -118,16 +181,20 @@ class Usb(object):
     This class describes a printer that natively speaks USB.
     """
 
-    def __init__(self, idVendor, idProduct, timeout=0, in_ep=None, out_ep=None):
+    def __init__(self, idVendor, idProduct, timeout=0, in_ep=None, out_ep=None, serial_number=None, port=None):
         """
         :param idVendor: Vendor ID
         :param idProduct: Product ID
         :param timeout: Is the time limit of the USB operation. Default without timeout.
         :param in_ep: Input end point
         :param out_ep: Output end point
+        :param serial_number: serial number of the device, None for any
+        :param port: position of the device on the USB tree (see port_path), None for any
         """
         self.idVendor = idVendor
         self.idProduct = idProduct
+        self.serial_number = serial_number
+        self.port = port
         self.timeout = timeout
         self.in_ep = in_ep
         self.out_ep = out_ep
@@ -135,11 +202,17 @@ class Usb(object):
         self.interface = 0
         self.device = None
         self.check_driver = False
+        # monotonic time of the first write since it was last reset, used for latency metrics
+        self.first_write = None
+        # write buffer of the current transaction, see begin()
+        self.buffer = None
+        self.max_packet_size = 64
         self.open()
 
     def open(self):
         """ Search device on USB tree and set it as printer device """
-        self.device = usb.core.find(idVendor=self.idVendor, idProduct=self.idProduct)
+        custom_match = self.match if self.serial_number or self.port else None
+        self.device = usb.core.find(idVendor=self.idVendor, idProduct=self.idProduct, custom_match=custom_match)
         if self.device is None:
             raise usb.core.USBError("Device not found or cable not plugged in.")
 
@@ -176,6 +249,7 @@ class Usb(object):
                     endpoint_out = usb.util.find_descriptor(intf, custom_match=is_OUT)
                     self.in_ep = endpoint_in.bEndpointAddress
                     self.out_ep = endpoint_out.bEndpointAddress
+                    self.max_packet_size = endpoint_out.wMaxPacketSize or self.max_packet_size
                 except usb.core.USBError:
                     # default values for officially supported printers
                     self.in_ep = 0x82
@@ -183,6 +257,18 @@ class Usb(object):
         except usb.core.USBError as e:
             raise usb.core.USBError("Could not set configuration: {0}".format(str(e)))
 
+    def match(self, device):
+        """ :return: whether device is this printer, and not another one of the same model """
+        if self.port and port_path(device.bus, device.port_numbers) != self.port:
+            return False
+        if self.serial_number:
+            try:
+                return usb.util.get_string(device, device.iSerialNumber) == self.serial_number
+            except (usb.core.USBError, ValueError):
+                # no serial number, or not readable
+                return False
+        return True
+
     def close(self):
         i = 0
         while True:
@@ -202,27 +288,105 @@ class Usb(object):
 
             time.sleep(0.1)
 
+    def is_alive(self):
+        """ Cheap health check of an opened device (standard GET_STATUS control request) """
+        if not self.device:
+            return False
+        try:
+            self.device.ctrl_transfer(usb.util.CTRL_IN | usb.util.CTRL_RECIPIENT_DEVICE,
+                                      usb.REQ_GET_STATUS, 0, 0, 2)
+            return True
+        except usb.core.USBError:
+            return False
+
+    @property
+    def flush_size(self):
+        """ amount of buffered bytes which triggers a bulk transfer """
+        return self.max_packet_size * 64
+
+    def begin(self):
+        """ Start a transaction: until flush() everything sent with _raw is kept in memory
+        and written in a few bulk transfers instead of one transfer per command.
+        """
+        if self.buffer is None:
+            self.buffer = bytearray()
+
+    def flush(self):
+        """ Write out the buffered data and end the transaction """
+        if self.buffer is None:
+            return
+        self._write_buffer()
+        self.buffer = None
+
+    def _write_buffer(self, partial=False):
+        """ Write the buffered data to the device
+        :param partial: only write whole max-packet multiples, keep the rest buffered
+        """
+        size = len(self.buffer)
+        if partial:
+            size -= size % self.max_packet_size
+        if size:
+            data = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            self._write(data)
+
+    def _write(self, data):
+        if self.first_write is None:
+            self.first_write = time.monotonic()
+        self.device.write(self.out_ep, data, self.timeout)
+
     def _raw(self, msg):
         """ Print any command sent in raw format
         :param msg: arbitrary code to be printed
         :type msg: bytes
         """
-        self.device.write(self.out_ep, msg, self.timeout)
-
-    def __extract_status(self):
-        maxiterate = 0
-        rep = None
-        while rep == None:
-            maxiterate += 1
-            if maxiterate > 10000:
-                raise StopIteration()
-            r = self.device.read(self.in_ep, 20, self.interface).tolist()
-            while len(r):
-                rep = r.pop()
-        return rep
-
-    def get_printer_status(self):
-        raise NotImplemented()
+        if self.buffer is None:
+            self._write(msg)
+            return
+
+        if isinstance(msg, str):
+            msg = msg.encode('utf-8')
+        self.buffer += msg
+        if len(self.buffer) >= self.flush_size:
+            self._write_buffer(partial=True)
+
+    def drain(self):
+        """ Drop the bytes left on the input endpoint, e.g. the late replies of a query which timed out
+        :raises usb.core.USBError: when the device fails, not when it has nothing to send
+        """
+        for i in range(8):
+            try:
+                if not len(self.device.read(self.in_ep, self.max_packet_size, 1)):
+                    return
+            except usb.core.USBError as e:
+                if not is_timeout(e):
+                    raise
+                return
+
+    def read_status(self, size, timeout=200):
+        """ Read the status bytes sent back by the printer
+        :param size: number of bytes expected
+        :param timeout: milliseconds to wait for all of them
+        :return: bytes received, fewer than size when the printer did not answer in time
+        :raises usb.core.USBError: when the device fails, e.g. it was unplugged
+        """
+        data = bytearray()
+        deadline = time.monotonic() + timeout / 1000.0
+        while len(data) < size:
+            remaining = int((deadline - time.monotonic()) * 1000)
+            if remaining <= 0:
+                break
+            try:
+                data += bytearray(self.device.read(self.in_ep, self.max_packet_size, remaining))
+            except usb.core.USBError as e:
+                if not is_timeout(e):
+                    raise
+                break
+        return bytes(data)
+
+    def get_printer_status(self, timeout=200):
+        """ :return: real-time status of the printer, implemented by the printer languages supporting it """
+        raise NotImplementedError()
 
     def __del__(self):
         """ Release USB interface """
@@ -2771,6 +2771,54 @@ class WSGIRefServer(ServerAdapter):
         srv.serve_forever()
 
 
+class ThreadPoolServer(WSGIRefServer):
+    """ wsgiref server that hands accepted connections to a bounded pool of
+        worker threads, so one slow request does not stall every client.
+        Options:
+
+        * `workers` (default: 8) number of threads serving requests.
+        * `backlog` (default: 64) size of the listen() backlog. Connections
+          beyond `workers` wait in the kernel accept queue.
+    """
+    def run(self, app): # pragma: no cover
+        from wsgiref.simple_server import WSGIServer
+        from queue import Queue
+
+        workers = max(1, int(self.options.pop('workers', 8)))
+        backlog = max(1, int(self.options.pop('backlog', 64)))
+        server_cls = self.options.get('server_class', WSGIServer)
+
+        class PooledWSGIServer(server_cls):
+            request_queue_size = backlog
+
+            def server_activate(self):
+                server_cls.server_activate(self)
+                # Only hand over as many sockets as there are idle workers,
+                # the rest stays in the listen backlog instead of piling up.
+                self.pending = Queue(workers)
+                for i in range(workers):
+                    worker = threading.Thread(target=self.process_request_worker,
+                                              name='http-worker-%d' % i)
+                    worker.daemon = True
+                    worker.start()
+
+            def process_request(self, request, client_address):
+                self.pending.put((request, client_address))
+
+            def process_request_worker(self):
+                while True:
+                    request, client_address = self.pending.get()
+                    try:
+                        self.finish_request(request, client_address)
+                    except Exception:
+                        self.handle_error(request, client_address)
+                    finally:
+                        self.shutdown_request(request)
+
+        self.options['server_class'] = PooledWSGIServer
+        WSGIRefServer.run(self, app)
+
+
 class CherryPyServer(ServerAdapter):
     def run(self, handler): # pragma: no cover
         from cherrypy import wsgiserver
@@ -2973,6 +3021,7 @@ server_names = {
     'cgi': CGIServer,
     'flup': FlupFCGIServer,
     'wsgiref': WSGIRefServer,
+    'threadpool': ThreadPoolServer,
     'waitress': WaitressServer,
     'cherrypy': CherryPyServer,
     'paste': PasteServer,
@@ -80,7 +80,12 @@ class EnableCorsPlugin(object):
                     'Access-Control-Allow-Headers'] = 'Origin, X-Requested-With, Content-Type, Accept, X-Debug-Mode'
             else:
                 # actual request; reply with the actual response
-                return callback(*args, **kwargs)
+                rv = callback(*args, **kwargs)
+                if isinstance(rv, HTTPResponse):
+                    # the headers of a response object replace the ones set above
+                    rv.headers['Access-Control-Allow-Origin'] = '*'
+                    rv.headers['Access-Control-Allow-Methods'] = ", ".join(allowed_methods)
+                return rv
 
         return wrapper
 
@@ -141,7 +146,7 @@ class JSONRPCPlugin(object):
                 return self.make_error(400, message)
 
             route = callback._route
-            if route.get('type') == 'json':
+            if route.get('type') == 'json' and not isinstance(rv, HTTPResponse):
                 # build json
                 try:
                     if not isinstance(json_request, dict):
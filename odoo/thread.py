@@ -34,5 +34,6 @@ class WebThread(Thread):
 
         app.install(EnableCorsPlugin())
         app.install(JSONRPCPlugin())
-        port = StateManager.getInstance().web_service.port
-        app.run(host='0.0.0.0', port=port, debug=False)
+        web_service = StateManager.getInstance().web_service
+        app.run(host='0.0.0.0', port=web_service.port, server='threadpool',
+                workers=web_service.workers, backlog=web_service.backlog, debug=False)
@@ -19,7 +19,11 @@ class StateManager(configparser.RawConfigParser):
 
     __printer_zpl = None
     __printer_escpos = None
+    __printers = None
     __web_service = None
+    __driver = None
+    __image_cache = None
+    __journal = None
 
     @staticmethod
     def getInstance():
@@ -38,6 +42,8 @@ class StateManager(configparser.RawConfigParser):
             self.base_path = os.path.dirname(os.path.abspath(__file__))
 
         self.config_file = os.path.join(self.base_path, 'config.ini')
+        # named printers, by (type, name)
+        self.__printers = {}
         """ Virtually private constructor. """
         if StateManager.__instance is not None:
             raise Exception("This class is a singleton!")
@@ -156,6 +162,8 @@ class StateManager(configparser.RawConfigParser):
         class WebService:
             def __init__(self):
                 self.port = None
+                self.workers = None
+                self.backlog = None
 
             def validate_port(self, value):
                 if not 1024 <= value <= 65535:
@@ -163,10 +171,234 @@ class StateManager(configparser.RawConfigParser):
 
                 return value
 
+            def validate_workers(self, value):
+                if not 1 <= value <= 64:
+                    raise ValueError('workers must be 1-64')
+
+                return value
+
+            def validate_backlog(self, value):
+                if not 1 <= value <= 1024:
+                    raise ValueError('backlog must be 1-1024')
+
+                return value
+
         webservice = WebService()
-        sections = {'SERVICE': [('port', int, 8080)]}
+        sections = {'SERVICE': [
+            ('port', int, 8080),
+            ('workers', int, 8),
+            ('backlog', int, 64)
+        ]}
         return self._build_config(webservice, sections)
 
+    @property
+    def driver(self):
+        '''
+        short-cut of get_driver function
+        :return: Driver object
+        '''
+        if not self.__driver:
+            self.__driver = self.__get_driver()
+        return self.__driver
+
+    def __get_driver(self):
+        '''
+        :return: Driver object, options of the printer driver threads:
+                 probe_interval: milliseconds before a failed printer is tried again
+                 probe_max_interval: maximum milliseconds between two probes
+                 hotplug_interval: milliseconds between two USB hotplug polls, 0 disables them
+                 status_ttl: milliseconds the real-time printer status is cached, 0 disables the queries
+                 hold_interval: milliseconds between two status queries while the jobs are held
+                 dedup_window: seconds a duplicate print request is recognized
+                 dedup_size: maximum number of requests in the duplicate index
+                 max_jobs: maximum number of jobs waiting in the queue of a printer
+                 max_queue_size: maximum size (in KB) of the jobs waiting in the queue of a printer
+                 history_window: seconds the status of a finished job can be looked up
+                 history_size: maximum number of finished jobs in the history
+                 render_ahead: ESC/POS jobs rendered ahead of the one being sent, 0 disables it
+        '''
+
+        class Driver:
+            def __init__(self):
+                self.probe_interval = None
+                self.probe_max_interval = None
+                self.hotplug_interval = None
+                self.status_ttl = None
+                self.hold_interval = None
+                self.dedup_window = None
+                self.dedup_size = None
+                self.max_jobs = None
+                self.max_queue_size = None
+                self.history_window = None
+                self.history_size = None
+                self.render_ahead = None
+
+            def validate_probe_interval(self, value):
+                if not 100 <= value <= 60000:
+                    raise ValueError('probe_interval must be 100-60000')
+
+                return value
+
+            def validate_probe_max_interval(self, value):
+                if not 100 <= value <= 600000:
+                    raise ValueError('probe_max_interval must be 100-600000')
+
+                return value
+
+            def validate_hotplug_interval(self, value):
+                if not 0 <= value <= 60000:
+                    raise ValueError('hotplug_interval must be 0-60000')
+
+                return value
+
+            def validate_status_ttl(self, value):
+                if not 0 <= value <= 600000:
+                    raise ValueError('status_ttl must be 0-600000')
+
+                return value
+
+            def validate_hold_interval(self, value):
+                if not 50 <= value <= 60000:
+                    raise ValueError('hold_interval must be 50-60000')
+
+                return value
+
+            def validate_dedup_window(self, value):
+                if not 0 <= value <= 86400:
+                    raise ValueError('dedup_window must be 0-86400')
+
+                return value
+
+            def validate_dedup_size(self, value):
+                if not 1 <= value <= 100000:
+                    raise ValueError('dedup_size must be 1-100000')
+
+                return value
+
+            def validate_max_jobs(self, value):
+                if not 1 <= value <= 100000:
+                    raise ValueError('max_jobs must be 1-100000')
+
+                return value
+
+            def validate_max_queue_size(self, value):
+                if not 64 <= value <= 4194304:
+                    raise ValueError('max_queue_size must be 64-4194304')
+
+                return value
+
+            def validate_history_window(self, value):
+                if not 0 <= value <= 86400:
+                    raise ValueError('history_window must be 0-86400')
+
+                return value
+
+            def validate_history_size(self, value):
+                if not 0 <= value <= 100000:
+                    raise ValueError('history_size must be 0-100000')
+
+                return value
+
+            def validate_render_ahead(self, value):
+                if not 0 <= value <= 16:
+                    raise ValueError('render_ahead must be 0-16')
+
+                return value
+
+        driver = Driver()
+        sections = {'DRIVER': [
+            ('probe_interval', int, 1000),
+            ('probe_max_interval', int, 30000),
+            ('hotplug_interval', int, 1000),
+            ('status_ttl', int, 2000),
+            ('hold_interval', int, 250),
+            ('dedup_window', int, 300),
+            ('dedup_size', int, 1000),
+            ('max_jobs', int, 1000),
+            ('max_queue_size', int, 65536),
+            ('history_window', int, 3600),
+            ('history_size', int, 1000),
+            ('render_ahead', int, 2)
+        ]}
+        return self._build_config(driver, sections)
+
+    @property
+    def image_cache(self):
+        '''
+        short-cut of get_image_cache function
+        :return: ImageCache object
+        '''
+        if not self.__image_cache:
+            self.__image_cache = self.__get_image_cache()
+        return self.__image_cache
+
+    def __get_image_cache(self):
+        '''
+        :return: ImageCache object, size (in KB) of the rasterized image cache
+        '''
+
+        class ImageCache:
+            def __init__(self):
+                self.max_size = None
+
+            def validate_max_size(self, value):
+                if not 0 <= value <= 262144:
+                    raise ValueError('max_size must be 0-262144')
+
+                return value
+
+        image_cache = ImageCache()
+        sections = {'IMAGE_CACHE': [('max_size', int, 4096)]}
+        return self._build_config(image_cache, sections)
+
+    @property
+    def journal(self):
+        '''
+        short-cut of get_journal function
+        :return: Journal object
+        '''
+        if not self.__journal:
+            self.__journal = self.__get_journal()
+        return self.__journal
+
+    def __get_journal(self):
+        '''
+        :return: Journal object, whether the queued jobs are journaled on disk (1 or 0), how long (in
+                 milliseconds) a commit waits for more jobs and the number of records triggering a compaction
+        '''
+
+        class Journal:
+            def __init__(self):
+                self.enabled = None
+                self.commit_delay = None
+                self.compact_size = None
+
+            def validate_enabled(self, value):
+                if value not in (0, 1):
+                    raise ValueError('enabled must be 0 or 1')
+
+                return value
+
+            def validate_commit_delay(self, value):
+                if not 0 <= value <= 100:
+                    raise ValueError('commit_delay must be 0-100')
+
+                return value
+
+            def validate_compact_size(self, value):
+                if not 10 <= value <= 1000000:
+                    raise ValueError('compact_size must be 10-1000000')
+
+                return value
+
+        journal = Journal()
+        sections = {'JOURNAL': [
+            ('enabled', int, 1),
+            ('commit_delay', int, 0),
+            ('compact_size', int, 1000)
+        ]}
+        return self._build_config(journal, sections)
+
     @property
     def printer_zpl(self):
         if not self.__printer_zpl:
@@ -179,45 +411,108 @@ class StateManager(configparser.RawConfigParser):
             self.__printer_escpos = self.__get_printer(StateManager.ESCPOS_PRINTER)
         return self.__printer_escpos
 
-    def __get_printer(self, type):
+    def get_printer(self, type, name=None):
         '''
         :param type: type of printer. ZPL_PRINTER|ESCPOS_PRINTER
+        :param name: name of an additional printer, None for the default printer of this type
         :return: Printer object
         '''
-        if type not in [self.ZPL_PRINTER, self.ESCPOS_PRINTER]:
-            return
+        if name is None:
+            return self.printer_zpl if type == self.ZPL_PRINTER else self.printer_escpos
+        if (type, name) not in self.__printers:
+            self.__printers[(type, name)] = self.__get_printer(type, name)
+        return self.__printers[(type, name)]
+
+    def get_printer_names(self, type):
+        '''
+        Additional printers are configured in their own section, named after the section of the
+        default printer: [PRINTER_ESCPOS:kitchen], [PRINTER_ESCPOS:bar], [PRINTER_ZPL:warehouse]...
+        Printers of the same model also need their serial_number, or the port they are plugged in
+        (1-1.2, as named in /sys/bus/usb/devices)
+        :param type: type of printer. ZPL_PRINTER|ESCPOS_PRINTER
+        :return: names of the additional printers of this type
+        '''
+        prefix = self.__get_printer_section(type) + ':'
+        return [section[len(prefix):] for section in self.sections()
+                if section.startswith(prefix) and len(section) > len(prefix)]
+
+    def get_printer_pools(self, type):
+        '''
+        Additional printers of the same type can be grouped in a pool addressed like a single printer,
+        e.g. [PRINTER_ZPL_POOL:warehouse] with printers = bay1, bay2 for [PRINTER_ZPL:bay1] and [PRINTER_ZPL:bay2]
+        :param type: type of printer. ZPL_PRINTER|ESCPOS_PRINTER
+        :return: dict of the names of the printers of each pool, by pool name
+        '''
+
+        class Pool:
+            def __init__(self):
+                self.printers = None
+
+            def validate_printers(self, value):
+                if not [name for name in value.split(',') if name.strip()]:
+                    raise ValueError('printers must be a comma separated list of printer names')
+
+                return value
+
+        prefix = self.__get_printer_section(type) + '_POOL:'
+        pools = {}
+        for section in self.sections():
+            if section.startswith(prefix) and len(section) > len(prefix):
+                pool = self._build_config(Pool(), {section: [('printers', str, '')]})
+                pools[section[len(prefix):]] = [name.strip() for name in pool.printers.split(',') if name.strip()]
+        return pools
+
+    def __get_printer_section(self, type, name=None):
         section_name = 'PRINTER_ZPL'
         if type == self.ESCPOS_PRINTER:
             section_name = 'PRINTER_ESCPOS'
+        if name is not None:
+            section_name = '%s:%s' % (section_name, name)
+        return section_name
+
+    def __get_printer(self, type, name=None):
+        '''
+        :param type: type of printer. ZPL_PRINTER|ESCPOS_PRINTER
+        :param name: name of an additional printer, None for the default printer of this type
+        :return: Printer object
+        '''
+        if type not in [self.ZPL_PRINTER, self.ESCPOS_PRINTER]:
+            return
+        section_name = self.__get_printer_section(type, name)
 
         printer = Printer(0, 0, '')
         sections = {section_name: [
             ('product_id', int, 0),
             ('vendor_id', int, 0),
-            ('description', str, '')
+            ('description', str, ''),
+            ('serial_number', str, ''),
+            ('port', str, '')
         ]}
         return self._build_config(printer, sections)
 
-    def set_printer(self, type, printer):
+    def set_printer(self, type, printer, name=None):
         '''
         :param type: type of printer. ZPL_PRINTER|ESCPOS_PRINTER
         :param printer: Printer object
+        :param name: name of an additional printer, None for the default printer of this type
         :return: Printer Object
         '''
         if type not in [self.ZPL_PRINTER, self.ESCPOS_PRINTER]:
             return
-        section_name = 'PRINTER_ZPL'
-        if type == self.ESCPOS_PRINTER:
-            section_name = 'PRINTER_ESCPOS'
+        section_name = self.__get_printer_section(type, name)
         # remove section and then re-create
         self.remove_section(section_name)
         sections = {section_name: [
             ('product_id', int, printer.product_id),
             ('vendor_id', int, printer.vendor_id),
-            ('description', str, printer.description)
+            ('description', str, printer.description),
+            ('serial_number', str, printer.serial_number),
+            ('port', str, printer.port)
         ]}
         self._build_config(printer, sections)
-        if type == StateManager.ZPL_PRINTER:
+        if name is not None:
+            self.__printers[(type, name)] = printer
+        elif type == StateManager.ZPL_PRINTER:
             self.__printer_zpl = printer
-        if type == StateManager.ESCPOS_PRINTER:
+        elif type == StateManager.ESCPOS_PRINTER:
             self.__printer_escpos = printer